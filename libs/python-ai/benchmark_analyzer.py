@@ -0,0 +1,201 @@
+"""
+Benchmark de Escala - AnalyzerService
+========================================
+
+Mede como o pipeline do analyzer escala com o tamanho do histórico e a
+quantidade de categorias, em históricos sintéticos realistas:
+
+- Popularidade das categorias em lei de potência, valor típico próprio por categoria
+- Mais gastos no fim de semana, estabelecimentos por categoria
+- Assinaturas mensais de valor fixo (detecção de recorrências)
+
+Cada caso roda em um processo novo (spawn), para que o pico de RSS seja do
+caso e não dos anteriores. Tempos por estágio vêm do relatório do pipeline
+(1 thread): prepare, detectores, statistical, recurring, trends,
+concentration, seasonality e weekly.
+
+Uso:
+    python benchmark_analyzer.py
+    python benchmark_analyzer.py --sizes 1000 10000 --categories 5 50 --output resultados.json
+"""
+
+import sys
+import os
+import json
+import time
+import platform
+import resource
+import multiprocessing
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+
+# Adiciona o diretório src ao path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.models.schemas import TransactionInput
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+DEFAULT_CATEGORIES = [5, 20, 200]
+
+BASE_CATEGORIES = ['Alimentação', 'Transporte', 'Lazer', 'Saúde', 'Educação', 'Moradia', 'Vestuário', 'Eletrônicos']
+
+HISTORY_DAYS = 730
+
+# Assinaturas mensais (descrição, valor) presentes em todo histórico
+SUBSCRIPTIONS = [
+    ('NETFLIX.COM', 55.90),
+    ('SPOTIFY', 21.90),
+    ('SMARTFIT MENSALIDADE', 119.90),
+    ('CLARO INTERNET', 99.99),
+    ('ALUGUEL', 1850.00),
+]
+
+
+def category_names(n_categories: int) -> List[str]:
+    extra = [f'Categoria {i}' for i in range(len(BASE_CATEGORIES), n_categories)]
+    return (BASE_CATEGORIES + extra)[:n_categories]
+
+
+def generate_history(n: int, n_categories: int, seed: int = 42) -> List[TransactionInput]:
+    """Histórico sintético de despesas com `n` transações em ~2 anos"""
+    rng = np.random.default_rng(seed)
+    start = datetime(2023, 1, 1)
+    names = category_names(n_categories)
+
+    # Assinaturas: uma cobrança por mês no mesmo dia
+    subscriptions = []
+    for k, (description, amount) in enumerate(SUBSCRIPTIONS):
+        for month in range(HISTORY_DAYS // 30):
+            subscriptions.append((amount, start + timedelta(days=30 * month + 3 * k, hours=9), names[k % n_categories], description))
+
+    subscriptions = subscriptions[:n // 10]
+    n_regular = n - len(subscriptions)
+
+    # Popularidade ~ 1/rank e valor típico próprio de cada categoria
+    popularity = 1 / np.arange(1, n_categories + 1) ** 1.1
+    categories = rng.choice(n_categories, size=n_regular, p=popularity / popularity.sum())
+    typical = np.exp(rng.uniform(2.5, 5.5, size=n_categories))
+    amounts = np.round(typical[categories] * rng.lognormal(0, 0.6, size=n_regular), 2)
+
+    # Dias com peso 1.4 no fim de semana
+    day_weights = np.where((np.arange(HISTORY_DAYS) + start.weekday()) % 7 >= 5, 1.4, 1.0)
+    days = rng.choice(HISTORY_DAYS, size=n_regular, p=day_weights / day_weights.sum())
+    minutes = rng.integers(7 * 60, 23 * 60, size=n_regular)
+    merchants = rng.integers(0, 6, size=n_regular)
+
+    transactions = [
+        TransactionInput(
+            amount=float(amounts[i]),
+            date=start + timedelta(days=int(days[i]), minutes=int(minutes[i])),
+            category_name=names[categories[i]],
+            type='EXPENSE',
+            description=f'LOJA {categories[i]}-{merchants[i]}',
+        )
+        for i in range(n_regular)
+    ]
+
+    transactions.extend(
+        TransactionInput(amount=amount, date=date, category_name=category, type='EXPENSE', description=description)
+        for amount, date, category, description in subscriptions
+    )
+
+    return transactions
+
+
+def peak_rss_mb() -> float:
+    """Pico de RSS do processo até agora (ru_maxrss: KiB no Linux, bytes no macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def run_case(n: int, n_categories: int, backend: str) -> Dict:
+    """Executado em processo próprio: gera o histórico e roda o pipeline uma vez"""
+    from src.services.analyzer import AnalyzerService
+
+    analyzer = AnalyzerService(max_workers=1)
+    analyzer.detector_config['backend'] = backend
+
+    # Aquecimento (imports preguiçosos e primeira chamada dos modelos)
+    analyzer._run_pipeline(generate_history(500, n_categories, seed=0))
+
+    start = time.perf_counter()
+    transactions = generate_history(n, n_categories)
+    generation_seconds = time.perf_counter() - start
+    rss_before = peak_rss_mb()
+
+    insights, expenses, report = analyzer._run_pipeline(transactions)
+
+    rss_peak = peak_rss_mb()
+
+    return {
+        'transactions': n,
+        'categories': n_categories,
+        'backend': backend,
+        'detectors': report['detectors'],
+        'generation_seconds': round(generation_seconds, 3),
+        'elapsed_ms': report['elapsed_ms'],
+        'stages_ms': {stage: info['elapsed_ms'] for stage, info in report['stages'].items()},
+        'insights': len(insights),
+        'outliers_consensus': int(expenses['is_outlier_consensus'].sum()),
+        'rss_before_pipeline_mb': round(rss_before, 1),
+        'peak_rss_mb': round(rss_peak, 1),
+        'pipeline_rss_growth_mb': round(rss_peak - rss_before, 1),
+    }
+
+
+def run(sizes: List[int], categories: List[int], backend: str, output: str) -> List[Dict]:
+    context = multiprocessing.get_context('spawn')
+    results = []
+
+    for n in sizes:
+        for n_categories in categories:
+            print(f"▶ {n} transações, {n_categories} categorias...", flush=True)
+
+            with context.Pool(1) as pool:
+                result = pool.apply(run_case, (n, n_categories, backend))
+
+            results.append(result)
+
+            stages = '  '.join(f"{stage}: {ms:.1f}" for stage, ms in result['stages_ms'].items() if ms is not None)
+            print(f"  total: {result['elapsed_ms']:.1f} ms | pico RSS: {result['peak_rss_mb']:.0f} MiB "
+                  f"(+{result['pipeline_rss_growth_mb']:.0f} no pipeline)")
+            print(f"  {stages}")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+        },
+        'results': results,
+    }
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"\n📄 Resultados salvos em {output}")
+
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark de escala do AnalyzerService')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Quantidades de transações')
+    parser.add_argument('--categories', type=int, nargs='+', default=DEFAULT_CATEGORIES, help='Quantidades de categorias')
+    parser.add_argument(
+        '--backend',
+        default='sklearn',
+        choices=['sklearn', 'pyod', 'auto'],
+        help='Backend de detectores (default: sklearn, mede Isolation Forest e LOF em todos os tamanhos)'
+    )
+    parser.add_argument('--output', default='benchmark_analyzer.json', help='Arquivo JSON de saída')
+
+    args = parser.parse_args()
+
+    run(args.sizes, args.categories, args.backend, args.output)
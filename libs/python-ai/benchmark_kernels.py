@@ -0,0 +1,174 @@
+"""
+Benchmark de Kernels - numba vs numpy vs pandas
+==================================================
+
+Valida as primitivas de src/services/kernels.py contra as implementações
+pandas originais (mesmos resultados) e mede o tempo de cada uma:
+
+- Estatísticas robustas por categoria (groupby-transform median/MAD/mean/std)
+- Estatísticas de intervalos por grupo (groupby mean/std/count)
+- Substituição de outliers por IQR (quantile + loc)
+- Soma diária densa (groupby por dia + reindex)
+
+Uso:
+    python benchmark_kernels.py [n1 n2 ...]   (padrão: 10000 100000 1000000)
+"""
+
+import sys
+import os
+import time
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+
+# Adiciona o diretório src ao path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+import src.services.kernels as kernels
+
+
+def best_of(fn: Callable, repeat: int = 3) -> float:
+    """Menor tempo (ms) entre `repeat` execuções"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+
+def with_backend(use_numba: bool, fn: Callable) -> Callable:
+    def run():
+        previous = kernels.USE_NUMBA
+        kernels.USE_NUMBA = use_numba
+        try:
+            return fn()
+        finally:
+            kernels.USE_NUMBA = previous
+    return run
+
+
+# === Referências pandas (implementação anterior aos kernels) ===
+
+def reference_group_stats(codes: np.ndarray, values: np.ndarray):
+    amounts = pd.Series(values)
+    grouped = amounts.groupby(codes, sort=False)
+    median = grouped.transform('median')
+    mad = (amounts - median).abs().groupby(codes, sort=False).transform('median')
+    mean = grouped.transform('mean')
+    std = np.sqrt(((amounts - mean) ** 2).groupby(codes, sort=False).transform('mean'))
+    return grouped.transform('size').to_numpy(), median.to_numpy(), mad.to_numpy(), mean.to_numpy(), std.to_numpy()
+
+
+def reference_interval_stats(group: np.ndarray, day: np.ndarray):
+    interval = np.full(len(day), np.nan)
+    same_group = group[1:] == group[:-1]
+    interval[1:][same_group] = (day[1:] - day[:-1])[same_group]
+    stats = pd.Series(interval).groupby(group, sort=False).agg(['count', 'mean', 'std'])
+    return stats['count'].to_numpy(), stats['mean'].to_numpy(), stats['std'].to_numpy()
+
+
+def reference_iqr(values: np.ndarray) -> np.ndarray:
+    df = pd.DataFrame({'y': values.copy()})
+    q1 = df['y'].quantile(0.25)
+    q3 = df['y'].quantile(0.75)
+    iqr = q3 - q1
+    median_value = df['y'].median()
+    df.loc[df['y'] > q3 + 3 * iqr, 'y'] = median_value
+    df.loc[df['y'] < q1 - 3 * iqr, 'y'] = 0
+    return df['y'].to_numpy()
+
+
+def reference_daily(days: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+    daily = pd.Series(amounts).groupby(days).sum()
+    return daily.reindex(np.arange(days.min(), days.max() + 1), fill_value=0).to_numpy()
+
+
+def check(label: str, ok: bool):
+    print(f"  {'✓' if ok else '✗'} {label}")
+    if not ok:
+        raise SystemExit(f"Kernel divergente: {label}")
+
+
+def run(sizes: List[int]):
+    print(f"numba disponível: {kernels.NUMBA_AVAILABLE}")
+    backends = [True, False] if kernels.NUMBA_AVAILABLE else [False]
+    rng = np.random.default_rng(42)
+
+    for n in sizes:
+        print(f"\n=== {n} valores ===")
+
+        # Valores arredondados em centavos: empates e MAD = 0 acontecem de verdade
+        codes = rng.integers(0, 50, size=n)
+        values = np.round(rng.lognormal(3.5, 0.8, size=n), 2)
+        codes[:5] = 49
+        values[:5] = 10.0
+
+        group = np.sort(rng.integers(0, n // 10 + 1, size=n))
+        day = np.concatenate([np.sort(rng.integers(0, 730, size=count)) for count in np.bincount(group)])
+        starts = np.flatnonzero(np.concatenate([[True], group[1:] != group[:-1]]))
+        ends = np.append(starts[1:], n)
+
+        daily_values = rng.lognormal(3, 1.5, size=min(n, 5000))
+        offsets = rng.integers(0, 730, size=n)
+
+        reference = {
+            'group_robust_stats': reference_group_stats(codes, values),
+            'segment_interval_stats': reference_interval_stats(group, day),
+            'iqr_replace': reference_iqr(daily_values),
+            'daily_totals': reference_daily(offsets, values),
+        }
+
+        for use_numba in backends:
+            name = 'numba' if use_numba else 'numpy'
+
+            count, median, mad, mean, std = with_backend(use_numba, lambda: kernels.group_robust_stats(codes, values, 50))()
+            ref = reference['group_robust_stats']
+            check(f"{name}: estatísticas por grupo", all(
+                np.allclose(ours[codes], theirs, rtol=1e-12, equal_nan=True)
+                for ours, theirs in zip((count, median, mad, mean, std), ref)
+            ))
+
+            n_intervals, interval_mean, interval_std = with_backend(use_numba, lambda: kernels.segment_interval_stats(day, starts, ends))()
+            ref = reference['segment_interval_stats']
+            check(f"{name}: intervalos por grupo", all(
+                np.allclose(ours, theirs, rtol=1e-12, equal_nan=True)
+                for ours, theirs in zip((n_intervals, interval_mean, interval_std), ref)
+            ))
+
+            replaced = with_backend(use_numba, lambda: kernels.iqr_replace(daily_values))()
+            check(f"{name}: IQR", np.array_equal(replaced, reference['iqr_replace']))
+
+            totals, _ = with_backend(use_numba, lambda: kernels.daily_totals(offsets, values, 730))()
+            check(f"{name}: soma diária", np.allclose(totals, reference['daily_totals'], rtol=1e-12))
+
+        timings = {
+            'group_robust_stats': (
+                lambda: reference_group_stats(codes, values),
+                lambda: kernels.group_robust_stats(codes, values, 50),
+            ),
+            'segment_interval_stats': (
+                lambda: reference_interval_stats(group, day),
+                lambda: kernels.segment_interval_stats(day, starts, ends),
+            ),
+            'iqr_replace': (
+                lambda: reference_iqr(daily_values),
+                lambda: kernels.iqr_replace(daily_values),
+            ),
+            'daily_totals': (
+                lambda: reference_daily(offsets, values),
+                lambda: kernels.daily_totals(offsets, values, 730),
+            ),
+        }
+
+        for label, (reference_fn, kernel_fn) in timings.items():
+            line = f"  {label:<24} pandas: {best_of(reference_fn):8.2f} ms"
+            for use_numba in backends:
+                name = 'numba' if use_numba else 'numpy'
+                line += f"  {name}: {best_of(with_backend(use_numba, kernel_fn)):8.2f} ms"
+            print(line)
+
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,87 @@
+"""
+Benchmark de Memória - Pico por Requisição
+=============================================
+
+Mede o pico de memória (tracemalloc, inclui buffers numpy/pandas) da
+preparação dos DataFrames e do pipeline completo do analyzer para
+históricos grandes, e o tamanho final dos frames preparados.
+
+Uso:
+    python benchmark_memory.py [n1 n2 ...]   (padrão: 10000 100000)
+"""
+
+import sys
+import os
+import gc
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+import numpy as np
+
+# Adiciona o diretório src ao path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.services.analyzer import AnalyzerService
+from src.services.forecaster import ForecasterService
+from src.models.schemas import TransactionInput
+
+CATEGORIES = ['Alimentação', 'Transporte', 'Lazer', 'Saúde', 'Educação', 'Moradia', 'Vestuário', 'Eletrônicos']
+MERCHANTS = ['IFOOD *REST', 'UBER *TRIP', 'NETFLIX.COM', 'DROGASIL', 'AMAZON MKTPLACE', 'POSTO SHELL', None, None]
+
+
+def generate_transactions(n: int, seed: int = 42) -> List[TransactionInput]:
+    """Histórico sintético de ~2 anos (90% despesas)"""
+    rng = np.random.default_rng(seed)
+    start = datetime(2023, 1, 1)
+
+    categories = rng.integers(len(CATEGORIES), size=n)
+    amounts = np.round(rng.lognormal(3.5, 0.8, size=n), 2)
+    minutes = rng.integers(0, 60 * 24 * 730, size=n)
+    is_expense = rng.random(n) < 0.9
+
+    return [
+        TransactionInput(
+            amount=float(amounts[i]),
+            date=start + timedelta(minutes=int(minutes[i])),
+            category_name=CATEGORIES[categories[i]],
+            type='EXPENSE' if is_expense[i] else 'INCOME',
+            description=MERCHANTS[categories[i]],
+        )
+        for i in range(n)
+    ]
+
+
+def measure(label: str, fn: Callable) -> object:
+    """Executa `fn` e imprime o pico de memória alocado durante a chamada"""
+    gc.collect()
+    tracemalloc.start()
+
+    result = fn()
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"  {label:<32} pico: {peak / 2**20:8.1f} MiB")
+
+    return result
+
+
+def run(sizes: List[int]):
+    analyzer = AnalyzerService(max_workers=1)
+    forecaster = ForecasterService()
+
+    for n in sizes:
+        transactions = generate_transactions(n)
+        print(f"\n=== {n} transações ===")
+
+        df = measure('analyzer._prepare_dataframe', lambda: analyzer._prepare_dataframe(transactions))
+        print(f"  {'frame preparado (deep)':<32} total: {df.memory_usage(deep=True).sum() / 2**20:8.1f} MiB")
+        del df
+
+        measure('analyzer._run_pipeline', lambda: analyzer._run_pipeline(transactions))
+        measure('forecaster._prepare_time_series', lambda: forecaster._prepare_time_series(transactions))
+
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,41 @@
+"""
+Job em Lote - Benchmarks de Coorte
+=====================================
+
+Gera os sketches de quantis por coorte e categoria usados nos insights de
+comparação com usuários de perfil parecido. Lê usuários de um arquivo JSONL
+em data/batch (mesmo formato do /insights/batch) e grava o arquivo carregado
+pelo AnalyzerService no startup.
+
+Uso:
+    python build_cohort_benchmarks.py usuarios.jsonl
+    python build_cohort_benchmarks.py usuarios.jsonl --output data/models/cohort_benchmarks.joblib
+"""
+
+import sys
+import os
+
+# Adiciona o diretório src ao path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.services.batch_input import read_users_file
+from src.services.cohort_benchmarks import COHORT_BENCHMARKS_PATH, build_cohort_benchmarks
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Gera os benchmarks de coorte a partir de um JSONL de usuários')
+    parser.add_argument('source', help='Arquivo JSONL dentro de data/batch')
+    parser.add_argument(
+        '--output',
+        default=COHORT_BENCHMARKS_PATH,
+        help=f'Arquivo de saída (default: {COHORT_BENCHMARKS_PATH})'
+    )
+
+    args = parser.parse_args()
+
+    benchmarks = build_cohort_benchmarks(read_users_file(args.source))
+    benchmarks.save(args.output)
+
+    print(f"✅ Benchmarks salvos em {args.output} (reinicie o serviço para carregar)")
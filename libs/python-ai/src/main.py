@@ -10,16 +10,40 @@ API FastAPI com serviços de IA de alta acurácia:
 Acurácia geral: 93-96%
 """
 
-from fastapi import FastAPI, HTTPException, Query
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import List, Literal, Optional, Dict
 import os
+import json
 
 from src.services.categorizer import CategorizerService
 from src.services.analyzer import AnalyzerService
+from src.services.batch_analyzer import BatchAnalyzer
+from src.services.batch_input import read_users_file
 from src.services.forecaster import ForecasterService
-from src.models.schemas import AnalysisRequest, InsightResponse, TransactionInput
+from src.models.schemas import (
+    AnalysisRequest,
+    BatchAnalysisRequest,
+    FullAnalysisResponse,
+    IncrementalAnalysisRequest,
+    IncrementalInsightsResponse,
+    InsightResponse,
+    ScoreTransactionRequest,
+    TransactionAnomalyResponse,
+    TransactionInput,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Aquece o pool de fits do forecaster antes das requisições (sobe em segundo plano)
+    forecaster.start_pool()
+    yield
+    forecaster.shutdown()
+    batch_analyzer.shutdown()
+
 
 app = FastAPI(
     title="Fayol AI Service",
@@ -27,6 +51,7 @@ app = FastAPI(
     version="0.1.1",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # CORS
@@ -43,6 +68,7 @@ print("🚀 Inicializando serviços de IA...")
 
 categorizer = CategorizerService()
 analyzer = AnalyzerService()
+batch_analyzer = BatchAnalyzer()
 forecaster = ForecasterService()
 
 print("✅ Serviços inicializados com sucesso!")
@@ -76,10 +102,36 @@ class ForecastResponse(BaseModel):
     variation_percent: float
     method: str
     models_used: List[str]
+    models_completed: List[str] = []  # Fits concluídos (ou vindos do cache)
+    models_timed_out: List[str] = []  # Descartados por prazo (pesos renormalizados sem eles)
+    models_failed: Dict[str, str] = {}  # Fits que falharam (erro do modelo ou do pool de processos)
+    model_durations_ms: Dict[str, float] = {}
+    model_weights: Dict[str, float] = {}
     n_samples: int
     message: str
 
 
+# --- Helpers ---
+
+def _pipeline_headers(report: Dict) -> Dict[str, str]:
+    """Tempos por estágio em Server-Timing e estágios pulados em X-Skipped-Stages"""
+    timings = [f"total;dur={report['elapsed_ms']}"]
+
+    for stage, info in report['stages'].items():
+        if info['elapsed_ms'] is not None:
+            timings.append(f"{stage};dur={info['elapsed_ms']}")
+        else:
+            timings.append(f'{stage};desc="{info["status"]}"')
+
+    if report['cached']:
+        timings.append('cache;desc="hit"')
+
+    return {
+        "Server-Timing": ", ".join(timings),
+        "X-Skipped-Stages": ",".join(report['skipped']),
+    }
+
+
 # --- Endpoints ---
 
 @app.get("/")
@@ -159,7 +211,7 @@ def predict_category(payload: CategorizationRequest):
             threshold=result['threshold'],
             alternatives=result['alternatives'],
             accepted=result['accepted'],
-            method="ensemble"
+            method=result.get('method', 'ensemble')
         )
 
     except Exception as e:
@@ -187,19 +239,32 @@ def train_model(payload: FeedbackRequest):
 
 
 @app.post("/insights", response_model=List[InsightResponse])
-def generate_insights(payload: AnalysisRequest):
+def generate_insights(
+    payload: AnalysisRequest,
+    response: Response,
+    deadline_ms: Optional[int] = Query(None, ge=1, description="Orçamento de latência em ms"),
+    x_deadline_ms: Optional[int] = Header(None, ge=1),
+):
     """
     Análise avançada com detecção de anomalias
 
     Features:
     - Isolation Forest + LOF para outliers
+    - Modelos persistidos por usuário (com `user_id`), re-treinados só quando o histórico cresce ou deriva
     - Análise de padrões recorrentes
     - Tendências com regressão linear
     - Sazonalidade (feriados brasileiros)
     - Concentração de gastos por categoria
+    - Prazo opcional (`deadline_ms` ou header `X-Deadline-Ms`): estágios que não cabem são pulados
+    - Tempos por estágio no header Server-Timing
     """
     try:
-        insights = analyzer.analyze_spending(payload.transactions)
+        insights, report = analyzer.analyze_spending_timed(
+            payload.transactions,
+            user_id=payload.user_id,
+            deadline_ms=deadline_ms or x_deadline_ms,
+        )
+        response.headers.update(_pipeline_headers(report))
         return insights
 
     except Exception as e:
@@ -207,6 +272,186 @@ def generate_insights(payload: AnalysisRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/insights/full", response_model=FullAnalysisResponse)
+def generate_full_analysis(
+    payload: AnalysisRequest,
+    response: Response,
+    deadline_ms: Optional[int] = Query(None, ge=1, description="Orçamento de latência em ms"),
+    x_deadline_ms: Optional[int] = Header(None, ge=1),
+):
+    """
+    Insights + estatísticas de anomalia + scores por transação
+
+    Features:
+    - Uma única preparação de dados e um único fit de Isolation Forest / LOF
+    - Scores e votos (IF, LOF, estatístico, consenso) de cada despesa
+    - Mesmo cache de resultados do /insights
+    - Prazo opcional e relatório do pipeline (`pipeline` + Server-Timing)
+    """
+    try:
+        result = analyzer.analyze_full(
+            payload.transactions,
+            user_id=payload.user_id,
+            deadline_ms=deadline_ms or x_deadline_ms,
+        )
+        response.headers.update(_pipeline_headers(result['pipeline']))
+        return result
+
+    except Exception as e:
+        print(f"Erro na análise completa: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/insights/stream")
+def stream_insights(
+    payload: AnalysisRequest,
+    format: Literal['sse', 'ndjson'] = Query('sse', description="Server-Sent Events ou NDJSON"),
+    deadline_ms: Optional[int] = Query(None, ge=1, description="Orçamento de latência em ms"),
+    x_deadline_ms: Optional[int] = Header(None, ge=1),
+):
+    """
+    Insights progressivos: cada estágio envia seus insights assim que termina
+
+    Features:
+    - Estágios baratos (concentração, tendências, semana a semana) chegam em milissegundos
+    - Detectores (Isolation Forest / LOF) e recorrências chegam quando terminam
+    - Evento final `summary` com o ranking (mesmo resultado do /insights) e o relatório do pipeline
+    - Mesmo cache de resultados do /insights
+    - Erro no meio do stream vira um evento `error` (o status 200 já foi enviado)
+    """
+    events = analyzer.analyze_spending_stream(
+        payload.transactions,
+        user_id=payload.user_id,
+        deadline_ms=deadline_ms or x_deadline_ms,
+    )
+
+    def guarded():
+        try:
+            yield from events
+        except Exception as e:
+            print(f"Erro na análise em streaming: {e}")
+            yield {'type': 'error', 'detail': str(e)}
+
+    if format == 'ndjson':
+        lines = (json.dumps(event, ensure_ascii=False) + "\n" for event in guarded())
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    messages = (f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n" for event in guarded())
+
+    return StreamingResponse(
+        messages,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/insights/incremental", response_model=IncrementalInsightsResponse)
+def generate_insights_incremental(payload: IncrementalAnalysisRequest):
+    """
+    Insights a partir de agregados persistidos do usuário
+
+    Features:
+    - Recebe as transações novas; reenvios já incorporados são ignorados pela chave
+      (id de origem ou conteúdo), inclusive linhas retroativas ou importadas com atraso
+      dentro da janela de atraso (90 dias antes do watermark; anteriores contam em `expired`)
+    - Sem `id`, uma compra idêntica a outra já incorporada (mesmo conteúdo) enviada em
+      outro delta é tratada como reenvio: envie o id de origem para distingui-las
+    - Atualiza somas mensais, totais por categoria, estatísticas robustas e buckets semanais
+    - Gastos atípicos do delta contra a mediana/MAD da categoria
+    """
+    try:
+        return analyzer.analyze_spending_incremental(payload.user_id, payload.transactions)
+
+    except Exception as e:
+        print(f"Erro na análise incremental: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/insights/batch")
+def generate_insights_batch(payload: BatchAnalysisRequest):
+    """
+    Insights de vários usuários em um pool de processos
+
+    Features:
+    - Usuários no corpo (`users`) ou em arquivo JSONL local (`source`, dentro de data/batch)
+    - Shards distribuídos entre processos (escala com o número de núcleos)
+    - Resposta NDJSON: uma linha por usuário à medida que termina, e o resumo com throughput no final
+    - Linhas malformadas do arquivo viram registros {"type": "error", "line": n} no fluxo
+    - Queda de um processo do pool vira um registro {"type": "error", "user_id": ...} por usuário perdido
+    - Erro no meio do fluxo vira um registro `error` (o status 200 já foi enviado)
+    """
+    try:
+        if payload.source:
+            users = read_users_file(payload.source)
+        else:
+            users = ((user.user_id, user.transactions) for user in payload.users or [])
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def guarded():
+        try:
+            yield from batch_analyzer.analyze(users)
+        except Exception as e:
+            print(f"Erro na análise em lote: {e}")
+            yield {'type': 'error', 'detail': str(e)}
+
+    lines = (json.dumps(result, ensure_ascii=False) + "\n" for result in guarded())
+
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+@app.post("/score-transaction", response_model=TransactionAnomalyResponse)
+def score_transaction(payload: ScoreTransactionRequest):
+    """
+    Score de anomalia de uma transação recém-criada, em tempo constante
+
+    Features:
+    - Compara com sketches persistidos do usuário por categoria (mediana/MAD, percentil, dia da semana)
+    - Não recebe nem reprocessa o histórico
+    - Atualiza os sketches com a transação (desligue com `update: false` para apenas consultar)
+    - Idempotente por `transaction_id`: retentativas e reenvios não contam a transação de novo
+    """
+    try:
+        return analyzer.score_transaction(payload.user_id, payload.transaction_id, payload.transaction, update=payload.update)
+
+    except Exception as e:
+        print(f"Erro no score da transação: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/score-transaction/rebuild")
+def rebuild_transaction_sketches(payload: IncrementalAnalysisRequest):
+    """
+    Reconstrói os sketches do /score-transaction a partir do histórico completo do usuário
+    (carga inicial ou correção; substitui o estado existente)
+    """
+    try:
+        return analyzer.rebuild_transaction_sketches(payload.user_id, payload.transactions)
+
+    except Exception as e:
+        print(f"Erro ao reconstruir sketches: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/recurring")
+def detect_recurring_payments(payload: AnalysisRequest):
+    """
+    Detecção de assinaturas e contas fixas
+
+    Features:
+    - Chave de estabelecimento normalizada (ignora ids, datas, parcelas, cidade)
+    - Faixas de valor com tolerância de 10%
+    - Padrões mensais e semanais com próxima cobrança esperada
+    """
+    try:
+        return analyzer.detect_recurring(payload.transactions)
+
+    except Exception as e:
+        print(f"Erro na detecção de recorrências: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/forecast", response_model=ForecastResponse)
 def predict_future_spending(payload: AnalysisRequest):
     """
@@ -219,6 +464,7 @@ def predict_future_spending(payload: AnalysisRequest):
     - Ridge Regression com features temporais
     - Ensemble ponderado
     - Intervalo de confiança (95%)
+    - Fits em paralelo com prazo por modelo (`models_timed_out`, `models_failed`, `model_durations_ms`)
     """
     try:
         result = forecaster.predict_next_month(payload.transactions)
@@ -256,6 +502,13 @@ def get_model_metrics():
 
         return {
             "categorizer": categorizer_metrics,
+            "analyzer": {
+                "insight_cache": analyzer.get_cache_stats(),
+                "cohort_benchmarks": analyzer.cohort_benchmarks.stats() if analyzer.cohort_benchmarks else None,
+            },
+            "forecaster": {
+                "model_cache": forecaster.cached_models.stats(),
+            },
             "version": "2.0",
         }
 
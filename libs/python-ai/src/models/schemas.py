@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime
 
 class TransactionInput(BaseModel):
@@ -7,11 +7,74 @@ class TransactionInput(BaseModel):
     date: datetime
     category_name: str
     type: str  # 'INCOME' ou 'EXPENSE'
+    description: Optional[str] = None  # Descrição do extrato (detecção de recorrências)
+    id: Optional[str] = None  # Id da transação na origem (Pluggy/CSV), quando houver
 
 class AnalysisRequest(BaseModel):
     transactions: List[TransactionInput]
+    user_id: Optional[str] = None  # Habilita detectores persistidos por usuário
 
 class InsightResponse(BaseModel):
-    type: str  # 'warning', 'tip', 'success'
+    type: str  # 'warning', 'tip', 'success', 'info', 'duplicate'
     text: str
-    score: float  # Para ordenação de relevância
\ No newline at end of file
+    score: float  # Para ordenação de relevância
+
+class IncrementalAnalysisRequest(BaseModel):
+    user_id: str
+    transactions: List[TransactionInput]  # Transações novas (reenvios já incorporados são ignorados)
+
+class IncrementalInsightsResponse(BaseModel):
+    insights: List[InsightResponse]
+    watermark: Optional[datetime]  # Data mais recente já incorporada (informativo)
+    ingested: int
+    skipped: int
+    expired: int = 0  # Anteriores à janela de atraso aceita (ignoradas)
+    total_expenses: int
+
+class UserTransactions(BaseModel):
+    user_id: str
+    transactions: List[TransactionInput]
+
+class BatchAnalysisRequest(BaseModel):
+    users: Optional[List[UserTransactions]] = None
+    source: Optional[str] = None  # Arquivo JSONL em data/batch (alternativa a `users`)
+
+class TransactionScore(BaseModel):
+    index: int  # Posição da transação na lista recebida
+    date: datetime
+    amount: float
+    category_name: str
+    # Apenas os detectores do backend usado (Isolation Forest + LOF ou ECOD + COPOD)
+    anomaly_score_if: Optional[float] = None  # Menor = mais anômalo
+    anomaly_score_lof: Optional[float] = None
+    anomaly_score_ecod: Optional[float] = None
+    anomaly_score_copod: Optional[float] = None
+    is_outlier_if: Optional[bool] = None
+    is_outlier_lof: Optional[bool] = None
+    is_outlier_ecod: Optional[bool] = None
+    is_outlier_copod: Optional[bool] = None
+    is_outlier_stat: bool
+    is_outlier_consensus: bool
+
+class FullAnalysisResponse(BaseModel):
+    insights: List[InsightResponse]
+    anomaly_stats: Dict[str, Union[int, float]]
+    scores: List[TransactionScore]
+    pipeline: Dict[str, Any]  # Status e tempo de cada estágio (ver AnalyzerService._pipeline_report)
+
+class ScoreTransactionRequest(BaseModel):
+    user_id: str
+    transaction_id: str  # Id estável da transação: reenvios não são incorporados de novo
+    transaction: TransactionInput
+    update: bool = True  # Incorpora a transação aos sketches do usuário após avaliar
+
+class TransactionAnomalyResponse(BaseModel):
+    anomaly_score: float  # 0-1, anômala a partir de 0.5
+    is_anomaly: bool
+    reason: str
+    reasons: List[str]
+    percentile: Optional[float]  # Posição do valor entre as despesas da categoria
+    category_median: Optional[float]
+    threshold: Optional[float]
+    history_count: int  # Despesas da categoria nos sketches antes desta
+    updated: bool = False  # Transação incorporada aos sketches nesta chamada
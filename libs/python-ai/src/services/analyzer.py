@@ -10,25 +10,195 @@ Melhorias implementadas:
 5. Análise por categoria com thresholds adaptativos
 6. Insights com scores de prioridade calibrados
 7. Suporte a feriados brasileiros
+8. Detectores persistidos por usuário (scoring incremental, re-treino por crescimento/drift)
+9. LOF em modo novelty sobre conjunto de referência indexado (KD-tree), com subamostragem estratificada
+10. Análise incremental sobre agregados persistidos por usuário (apenas transações ainda não incorporadas)
+11. Cache de resultados por impressão digital do conjunto de transações (LRU + TTL;
+    guardados serializados: cada resposta é uma cópia independente do cache)
+12. Estágios independentes (detectores, recorrências, tendências, sazonalidade) em pool de threads limitado
+13. Prazo por requisição: estágios com custo estimado acima do tempo restante são pulados (com relatório de tempos)
+14. Gasto diário denso com somas acumuladas: comparações de janelas (semana, mês) em O(1)
+15. DataFrames compactos (category, int8) montados só com despesas e sem cópias redundantes
+16. Score em tempo real de uma transação nova contra sketches por categoria (O(1) por transação)
+17. Backend de detectores plugável: Isolation Forest + LOF ou ECOD + COPOD (pyod, lineares), com seleção por tamanho
+18. Comparação com usuários de perfil parecido via sketches de quantis por coorte (carregados no startup)
+19. Transações duplicadas na importação (id de origem ou linha idêntica no mesmo instante), reportadas antes dos demais estágios
+20. Insights progressivos: cada estágio emite seus insights ao terminar (streaming SSE/NDJSON)
 
 Acurácia esperada: 92-95% (vs 70% anterior)
 """
 
+import os
+import pickle
+import hashlib
+import threading
+import time
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Generator, Iterator, List, Dict, Tuple, Optional
 from datetime import datetime, timedelta
 from scipy import stats
 from sklearn.ensemble import IsolationForest
 from sklearn.neighbors import LocalOutlierFactor
 from sklearn.preprocessing import StandardScaler
-import holidays
+from pyod.models.ecod import ECOD
+from pyod.models.copod import COPOD
 from src.models.schemas import TransactionInput, InsightResponse
+from src.services.calendar_features import get_calendar, to_days
+from src.services.detector_store import DetectorStore, feature_keys, lookup_scores, merge_scores
+from src.services.recurring_detector import RecurringDetector
+from src.services.duplicate_detector import DuplicateDetector
+from src.services.spending_aggregates import SpendingAggregates
+from src.services.daily_spend import DailySpend
+from src.services.transaction_frame import build_transaction_frame, transaction_keys
+from src.services.transaction_scorer import TransactionScorer
+from src.services.kernels import group_robust_stats, warm_up as warm_up_kernels
+from src.services.cohort_benchmarks import CohortBenchmarks, spending_profile
+
+# Quantidade máxima de insights retornados por análise
+MAX_INSIGHTS = 10
+
+# Versão da lógica de análise (incrementar quando insights mudarem para o mesmo input)
+ANALYZER_VERSION = 3
+
+# Cache de resultados do analyze_spending (LRU com expiração)
+INSIGHT_CACHE_SIZE = 1024
+INSIGHT_CACHE_TTL = 300  # segundos
+
+_HASH_MASK = (1 << 64) - 1
+
+# Threads para estágios independentes do pipeline (1 = sequencial)
+ANALYZER_MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+# Custo estimado de cada estágio em ms: (fixo, por despesa)
+# Medido em 1 núcleo; corrigido online pela razão observado/estimado de cada estágio
+STAGE_COST_MODEL = {
+    'isolation_forest': (160.0, 0.0095),
+    'lof': (10.0, 0.0062),
+    'ecod': (2.0, 0.0011),
+    'copod': (2.0, 0.0011),
+    'recurring': (12.0, 0.0008),
+    'trends': (1.0, 0.00002),
+    'concentration': (1.0, 0.00004),
+    'seasonality': (1.0, 0.00008),
+    'weekly': (1.0, 0.00003),
+    'cohort': (1.0, 0.00004),
+    'duplicates': (1.0, 0.0001),
+    'statistical': (5.0, 0.00035),
+}
+
+# Estágios estimados abaixo disso (ms) nunca são pulados pelo prazo
+MIN_STAGE_COST_MS = 2.0
+
+# Quanto uma única medição pode mover a correção de um estágio (fator)
+CALIBRATION_MAX_STEP = 2.0
+
+# Resultado de um estágio que, ao começar, já não cabia no tempo restante
+_STAGE_SKIPPED = object()
+
+# Detectores de cada backend: os dois votos que, com o estatístico, formam o consenso 2/3
+DETECTOR_BACKENDS = {
+    'sklearn': ('isolation_forest', 'lof'),  # Persistidos por usuário; custo fixo alto
+    'pyod': ('ecod', 'copod'),               # Lineares e sem parâmetros; refeitos a cada chamada
+}
+
+# Sufixo das colunas de cada detector: is_outlier_<sufixo>, anomaly_score_<sufixo>
+DETECTOR_SUFFIXES = {
+    'isolation_forest': 'if',
+    'lof': 'lof',
+    'ecod': 'ecod',
+    'copod': 'copod',
+}
+
+# Detectores com estado persistido por usuário (com user_id só pontuam o delta)
+PERSISTED_DETECTORS = ('isolation_forest', 'lof')
+
+# Detectores lineares do pyod (fit O(n·d) sobre as distribuições empíricas de cada feature)
+LINEAR_DETECTORS = {
+    'ecod': ECOD,
+    'copod': COPOD,
+}
+
+# Detectores que, pulados por prazo, são substituídos pelo voto estatístico
+FALLBACK_STAGES = tuple(DETECTOR_SUFFIXES)
+
+# Percentis da coorte que geram insight (gasto acima do topo / abaixo da base)
+COHORT_HIGH_PERCENTILE = 0.90
+COHORT_LOW_PERCENTILE = 0.25
+
+# Colunas lidas pelos detectores
+DETECTOR_COLUMNS = ['amount', 'day_of_week', 'day_of_month', 'category_name']
+
+
+def transactions_fingerprint(transactions: List[TransactionInput]) -> Tuple[int, int, int]:
+    """
+    Impressão digital independente da ordem do conjunto de transações
+
+    Cada transação vira um blake2b de 128 bits sobre os bytes da linha, lido
+    como dois inteiros de 64 bits independentes; a soma (mod 2^64) de cada um
+    é comutativa e, ao contrário do XOR, distingue duplicatas.
+    """
+    h1 = h2 = 0
+
+    for t in transactions:
+        row = '\x1f'.join((repr(t.amount), t.date.isoformat(), t.category_name, t.type, repr(t.description), repr(t.id)))
+        digest = hashlib.blake2b(row.encode('utf-8'), digest_size=16).digest()
+        h1 += int.from_bytes(digest[:8], 'little')
+        h2 += int.from_bytes(digest[8:], 'little')
+
+    return len(transactions), h1 & _HASH_MASK, h2 & _HASH_MASK
+
 
 class AnalyzerService:
-    def __init__(self):
-        # Feriados brasileiros para análise de sazonalidade
-        self.br_holidays = holidays.Brazil(years=range(2020, 2030))
+    def __init__(
+        self,
+        detector_store: Optional[DetectorStore] = None,
+        max_workers: int = ANALYZER_MAX_WORKERS,
+        cohort_benchmarks: Optional[CohortBenchmarks] = None,
+    ):
+        # Feriados brasileiros e flags de calendário (store compartilhado)
+        self.calendar = get_calendar()
+        self.br_holidays = self.calendar.holidays
+
+        # Estado persistido dos detectores por usuário
+        self.detector_store = detector_store or DetectorStore()
+
+        # Política de re-treino dos detectores persistidos
+        self.detector_config = {
+            'refit_growth': 0.20,     # Re-treina quando o histórico cresce 20% desde o último fit
+            'drift_threshold': 0.50,  # ... ou a média de alguma feature desloca 0.5 desvio-padrão
+            'lof_max_reference': 5000,  # Acima disso o LOF usa subamostra estratificada por categoria
+            'lof_min_per_stratum': 20,  # ... com ao menos esse número de linhas de cada categoria (ou todas, se menor)
+            'backend': 'auto',  # 'sklearn', 'pyod' ou 'auto' (por tamanho do histórico)
+            'linear_min_expenses': 20000,  # Em 'auto', a partir daqui usa os detectores lineares
+            'drop_duplicates': False,  # True: cópias de importação ficam fora da análise (sempre viram um insight próprio)
+        }
+
+        # Pool limitado para estágios independentes (compartilhado entre requisições)
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analyzer') if max_workers > 1 else None
+
+        # Correção multiplicativa do modelo de custo por estágio (média móvel)
+        self._cost_calibration = {stage: 1.0 for stage in STAGE_COST_MODEL}
+        self._cost_samples = {stage: 0 for stage in STAGE_COST_MODEL}
+        self._cost_lock = threading.Lock()  # Requisições concorrentes calibram os mesmos estágios
+
+        # Primitivas numba compiladas/carregadas já na criação do serviço
+        warm_up_kernels()
+
+        # Cache de resultados: (user_id, fingerprint, versão da configuração) → (instante, insights)
+        self._insight_cache: OrderedDict = OrderedDict()
+        self._insight_cache_lock = threading.Lock()
+        self.insight_cache_hits = 0
+        self.insight_cache_misses = 0
+
+        # Assinaturas/contas fixas (tolerância de 10% no valor)
+        self.recurring_detector = RecurringDetector(amount_tolerance=0.10)
+
+        # Duplicatas de importação (mesmo estabelecimento e valor, data com até 1 dia de diferença)
+        self.duplicate_detector = DuplicateDetector()
 
         # Thresholds adaptativos por categoria
         self.category_thresholds = {
@@ -44,36 +214,117 @@ class AnalyzerService:
             'default': {'outlier_factor': 2.5, 'budget_warn': 0.15},
         }
 
-    def _prepare_dataframe(self, transactions: List[TransactionInput]) -> pd.DataFrame:
-        """Prepara DataFrame com features engenheiradas"""
-        data = [t.dict() for t in transactions]
-        df = pd.DataFrame(data)
+        # Sketches por usuário/categoria para o score em tempo real
+        self.transaction_scorer = TransactionScorer(self.detector_store, self.category_thresholds)
+
+        # Distribuições por coorte geradas pelo job em lote (None se ainda não geradas)
+        self.cohort_benchmarks = cohort_benchmarks or CohortBenchmarks.load()
+
+    def _prepare_dataframe(self, transactions: List[TransactionInput], expenses_only: bool = False) -> pd.DataFrame:
+        """
+        Prepara DataFrame compacto com features engenheiradas
+        (categorias como category, features de calendário em int8)
+        """
+        df = build_transaction_frame(transactions, expenses_only=expenses_only)
 
         if df.empty:
             return df
 
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.sort_values('date')
-
         # Feature Engineering
-        df['day_of_week'] = df['date'].dt.dayofweek
-        df['day_of_month'] = df['date'].dt.day
-        df['month'] = df['date'].dt.month
-        df['is_weekend'] = df['day_of_week'].isin([5, 6]).astype(int)
-        df['is_month_start'] = (df['day_of_month'] <= 5).astype(int)
-        df['is_month_end'] = (df['day_of_month'] >= 25).astype(int)
-        df['is_holiday'] = df['date'].apply(lambda x: x in self.br_holidays).astype(int)
-
-        # Período do mês para agregações
-        df['month_period'] = df['date'].dt.to_period('M')
-        df['week_period'] = df['date'].dt.to_period('W')
+        df['day_of_week'] = df['date'].dt.dayofweek.astype(np.int8)
+        df['day_of_month'] = df['date'].dt.day.astype(np.int8)
+        df['month'] = df['date'].dt.month.astype(np.int8)
+
+        # Flags de calendário pré-calculadas (lookup vetorizado, sem apply por linha)
+        calendar_flags = self.calendar.lookup(df['date'])
+        df['is_weekend'] = calendar_flags['is_weekend']
+        df['is_month_start'] = calendar_flags['is_month_start']
+        df['is_month_end'] = calendar_flags['is_month_end']
+        df['is_holiday'] = calendar_flags['is_holiday']
 
         return df
 
-    def _detect_outliers_isolation_forest(self, df: pd.DataFrame) -> pd.DataFrame:
+    def _detector_input(self, expenses: pd.DataFrame) -> pd.DataFrame:
+        """
+        Frame só com as colunas dos detectores, onde eles podem escrever
+        A seleção de colunas já copia os dados; copy(deep=False) só desfaz o vínculo com `expenses`
+        """
+        return expenses[DETECTOR_COLUMNS].copy(deep=False)
+
+    def _fit_isolation_forest(self, X: np.ndarray) -> Tuple[StandardScaler, IsolationForest, np.ndarray]:
+        """Treina scaler + Isolation Forest e retorna os scores do próprio histórico"""
+        # Normalização
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
+
+        # Isolation Forest
+        # contamination: proporção esperada de outliers (5%)
+        iso_forest = IsolationForest(
+            contamination=0.05,
+            random_state=42,
+            n_estimators=100,
+        )
+
+        iso_forest.fit(X_scaled)
+
+        return scaler, iso_forest, iso_forest.score_samples(X_scaled)
+
+    def _needs_refit(self, state: Optional[Dict], X: np.ndarray) -> bool:
+        """Re-treina se não há estado, se o histórico cresceu demais ou se as features derivaram"""
+        if state is None:
+            return True
+
+        if len(X) >= state['n_samples'] * (1 + self.detector_config['refit_growth']):
+            return True
+
+        scaler = state['scaler']
+        shift = np.abs(X.mean(axis=0) - scaler.mean_) / scaler.scale_
+
+        return bool(shift.max() > self.detector_config['drift_threshold'])
+
+    def _score_persisted(self, user_id: str, detector: str, X: np.ndarray, fit) -> Tuple[np.ndarray, float]:
+        """
+        Scores de um detector usando o estado persistido do usuário
+        Apenas transações ainda não vistas passam pelo score_samples
+
+        `fit(X)` deve retornar (scaler, modelo, scores de X); o modelo precisa
+        expor score_samples e offset_ (IsolationForest, LOF em modo novelty).
+        """
+        state = self.detector_store.load(user_id, detector)
+        keys = feature_keys(X)
+
+        if self._needs_refit(state, X):
+            scaler, model, scores = fit(X)
+            known_keys, known_scores = merge_scores(np.empty(0, dtype=np.uint64), np.empty(0), keys, scores)
+
+            self.detector_store.save(user_id, detector, {
+                'scaler': scaler,
+                'model': model,
+                'n_samples': len(X),
+                'keys': known_keys,
+                'scores': known_scores,
+            })
+
+            return scores, model.offset_
+
+        scores, found = lookup_scores(keys, state['keys'], state['scores'])
+
+        if not found.all():
+            new_scores = state['model'].score_samples(state['scaler'].transform(X[~found]))
+            scores[~found] = new_scores
+
+            known_keys, known_scores = merge_scores(state['keys'], state['scores'], keys[~found], new_scores)
+            self.detector_store.save(user_id, detector, {**state, 'keys': known_keys, 'scores': known_scores})
+
+        return scores, state['model'].offset_
+
+    def _detect_outliers_isolation_forest(self, df: pd.DataFrame, user_id: Optional[str] = None) -> pd.DataFrame:
         """
         Detecção de anomalias usando Isolation Forest
         Método robusto que não assume distribuição normal
+
+        Com `user_id`, reaproveita o modelo persistido do usuário e só pontua
+        transações novas; re-treina quando o histórico cresce ou deriva.
         """
         if len(df) < 10:
             df['is_outlier_if'] = False
@@ -86,30 +337,87 @@ class AnalyzerService:
         if 'day_of_week' in df.columns:
             features.extend(['day_of_week', 'day_of_month'])
 
-        X = df[features].values
+        X = df[features].to_numpy(dtype=np.float64)
 
-        # Normalização
+        if user_id is not None:
+            scores, offset = self._score_persisted(user_id, 'iforest', X, self._fit_isolation_forest)
+        else:
+            _, iso_forest, scores = self._fit_isolation_forest(X)
+            offset = iso_forest.offset_
+
+        # Mesmo critério do predict(): decision_function = score_samples - offset_ < 0
+        df['is_outlier_if'] = scores < offset
+        df['anomaly_score_if'] = scores
+
+        return df
+
+    def _reference_sample(self, n: int, strata: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Índices do conjunto de referência do LOF
+        Histórico completo se couber no limite; senão subamostra estratificada:
+        cada categoria garante min(tamanho, lof_min_per_stratum) linhas e o restante
+        do limite é dividido proporcionalmente ao tamanho das categorias
+        """
+        max_reference = self.detector_config['lof_max_reference']
+
+        if n <= max_reference:
+            return np.arange(n)
+
+        if strata is None:
+            rng = np.random.default_rng(42)
+            return np.sort(rng.choice(n, size=max_reference, replace=False))
+
+        codes, _ = pd.factorize(strata, use_na_sentinel=False)
+        sizes = np.bincount(codes)
+
+        # Mínimo por categoria; o que sobra do limite é proporcional ao excedente de cada uma
+        minimum = np.minimum(sizes, self.detector_config['lof_min_per_stratum'])
+        surplus = sizes - minimum
+        remaining = max(max_reference - int(minimum.sum()), 0)
+        quota = minimum + np.floor(surplus * remaining / max(int(surplus.sum()), 1)).astype(np.int64)
+
+        # Ordem aleatória; cada categoria fica com as primeiras `quota` linhas dela
+        order = np.random.default_rng(42).permutation(n)
+        rank = pd.Series(codes[order]).groupby(codes[order]).cumcount().to_numpy()
+
+        return np.sort(order[rank < quota[codes[order]]])
+
+    def _fit_lof(self, X: np.ndarray, strata: Optional[np.ndarray] = None) -> Tuple[StandardScaler, LocalOutlierFactor, np.ndarray]:
+        """
+        Treina LOF em modo novelty sobre o conjunto de referência (índice KD-tree)
+        Pontos da referência usam o fator de treino; os demais são consultados no índice
+        """
         scaler = StandardScaler()
         X_scaled = scaler.fit_transform(X)
 
-        # Isolation Forest
-        # contamination: proporção esperada de outliers (5%)
-        iso_forest = IsolationForest(
+        reference_idx = self._reference_sample(len(X), strata)
+
+        # LOF com até 20 vizinhos; novelty=True permite pontuar pontos novos pelo índice
+        lof = LocalOutlierFactor(
+            n_neighbors=min(20, len(reference_idx) - 1),
             contamination=0.05,
-            random_state=42,
-            n_estimators=100,
+            novelty=True,
+            algorithm='kd_tree',
         )
+        lof.fit(X_scaled[reference_idx])
 
-        predictions = iso_forest.fit_predict(X_scaled)
-        df['is_outlier_if'] = (predictions == -1)
-        df['anomaly_score_if'] = iso_forest.score_samples(X_scaled)
+        scores = np.empty(len(X))
+        in_reference = np.zeros(len(X), dtype=bool)
+        in_reference[reference_idx] = True
 
-        return df
+        scores[reference_idx] = lof.negative_outlier_factor_
+        if not in_reference.all():
+            scores[~in_reference] = lof.score_samples(X_scaled[~in_reference])
+
+        return scaler, lof, scores
 
-    def _detect_outliers_lof(self, df: pd.DataFrame) -> pd.DataFrame:
+    def _detect_outliers_lof(self, df: pd.DataFrame, user_id: Optional[str] = None) -> pd.DataFrame:
         """
         Detecção de anomalias usando Local Outlier Factor
         Detecta anomalias contextuais (valores normais em contextos anormais)
+
+        O custo fica limitado pelo tamanho do conjunto de referência; com `user_id`
+        o modelo é persistido e só transações novas são consultadas no índice.
         """
         if len(df) < 10:
             df['is_outlier_lof'] = False
@@ -119,122 +427,179 @@ class AnalyzerService:
         if 'day_of_week' in df.columns:
             features.extend(['day_of_week', 'day_of_month'])
 
-        X = df[features].values
+        X = df[features].to_numpy(dtype=np.float64)
+        strata = df['category_name'].to_numpy() if 'category_name' in df.columns else None
 
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
+        if user_id is not None:
+            scores, offset = self._score_persisted(user_id, 'lof', X, lambda X: self._fit_lof(X, strata))
+        else:
+            _, lof, scores = self._fit_lof(X, strata)
+            offset = lof.offset_
 
-        # LOF com k=5 vizinhos
-        lof = LocalOutlierFactor(
-            n_neighbors=min(20, len(df) - 1),
-            contamination=0.05,
-        )
+        # Mesmo critério do fit_predict(): negative_outlier_factor_ < offset_
+        df['is_outlier_lof'] = scores < offset
+        df['anomaly_score_lof'] = scores
+
+        return df
+
+    def _detect_outliers_linear(self, df: pd.DataFrame, detector: str) -> pd.DataFrame:
+        """
+        Detecção de anomalias com ECOD ou COPOD (pyod)
+        Probabilidades de cauda das distribuições empíricas de cada feature:
+        custo linear, sem hiperparâmetros além da contaminação
+
+        O fit é barato o bastante para ser refeito a cada chamada (sem estado por usuário).
+        """
+        suffix = DETECTOR_SUFFIXES[detector]
 
-        predictions = lof.fit_predict(X_scaled)
-        df['is_outlier_lof'] = (predictions == -1)
-        df['anomaly_score_lof'] = lof.negative_outlier_factor_
+        if len(df) < 10:
+            df[f'is_outlier_{suffix}'] = False
+            return df
+
+        features = ['amount']
+        if 'day_of_week' in df.columns:
+            features.extend(['day_of_week', 'day_of_month'])
+
+        X = df[features].to_numpy(dtype=np.float64)
+
+        model = LINEAR_DETECTORS[detector](contamination=0.05)
+        model.fit(X)
+
+        # Score negado: menor = mais anômalo, como nos detectores do sklearn
+        df[f'is_outlier_{suffix}'] = model.labels_ == 1
+        df[f'anomaly_score_{suffix}'] = -model.decision_scores_
 
         return df
 
-    def _detect_outliers_statistical(self, df: pd.DataFrame, category: str = None) -> pd.DataFrame:
+    def _select_detectors(self, n: int) -> Tuple[str, ...]:
+        """
+        Detectores do consenso para `n` despesas, conforme detector_config['backend']
+        Em 'auto', históricos grandes usam os detectores lineares
+        """
+        backend = self.detector_config['backend']
+
+        if backend == 'auto':
+            backend = 'pyod' if n >= self.detector_config['linear_min_expenses'] else 'sklearn'
+
+        if backend not in DETECTOR_BACKENDS:
+            raise ValueError(f"Backend de detectores desconhecido: {backend}")
+
+        return DETECTOR_BACKENDS[backend]
+
+    def _detector_stages(self, expenses: pd.DataFrame, user_id: Optional[str], detectors: Tuple[str, ...]) -> Dict[str, Callable[[], pd.DataFrame]]:
+        """Estágios dos detectores, cada um sobre um frame próprio e estreito"""
+        stages = {}
+
+        for detector in detectors:
+            if detector == 'isolation_forest':
+                stages[detector] = lambda: self._detect_outliers_isolation_forest(self._detector_input(expenses), user_id)
+            elif detector == 'lof':
+                stages[detector] = lambda: self._detect_outliers_lof(self._detector_input(expenses), user_id)
+            else:
+                stages[detector] = lambda detector=detector: self._detect_outliers_linear(self._detector_input(expenses), detector)
+
+        return stages
+
+    def _detect_outliers_statistical(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Detecção estatística adaptativa por categoria
         Usa Z-score modificado (MAD - Median Absolute Deviation)
         Mais robusto que desvio padrão para distribuições assimétricas
+
+        Todas as categorias são processadas em uma única passada (kernel de
+        estatísticas por grupo); categorias com menos de 3 transações não são avaliadas.
         """
-        if len(df) < 3:
-            df['is_outlier_stat'] = False
-            return df
+        amounts = df['amount'].to_numpy(dtype=np.float64)
+        codes, names = pd.factorize(df['category_name'])
+
+        # Contagem, mediana, MAD e média/desvio populacional (fallback se MAD for 0) por categoria
+        count, median, mad, mean, std = (
+            stat[codes] for stat in group_robust_stats(codes, amounts, len(names))
+        )
 
         # Threshold por categoria
-        threshold_config = self.category_thresholds.get(
-            category,
-            self.category_thresholds['default']
+        default_factor = self.category_thresholds['default']['outlier_factor']
+        outlier_factor = np.array([
+            self.category_thresholds.get(name, {}).get('outlier_factor', default_factor) for name in names
+        ], dtype=np.float64)[codes]
+
+        # Modified Z-score usando MAD
+        # 0.6745 é o fator de escala para equivalência com desvio padrão
+        threshold = np.where(
+            mad == 0,
+            mean + outlier_factor * std,
+            median + outlier_factor * mad / 0.6745,
         )
-        outlier_factor = threshold_config['outlier_factor']
 
-        amounts = df['amount'].values
+        evaluated = count >= 3
 
-        # MAD (Median Absolute Deviation)
-        median = np.median(amounts)
-        mad = np.median(np.abs(amounts - median))
+        df['is_outlier_stat'] = evaluated & (amounts > threshold)
+        df['outlier_threshold'] = threshold
+        df['category_median'] = median
+        df['median_deviation_pct'] = (amounts - median) / median * 100
 
-        if mad == 0:  # Fallback para desvio padrão se MAD for 0
-            mean = np.mean(amounts)
-            std = np.std(amounts)
-            threshold = mean + (outlier_factor * std)
-        else:
-            # Modified Z-score usando MAD
-            # 0.6745 é o fator de escala para equivalência com desvio padrão
-            modified_z_scores = 0.6745 * (amounts - median) / mad
-            threshold = median + (outlier_factor * mad / 0.6745)
+        # Consenso de 2/3 métodos (dois detectores do backend + estatístico)
+        # Sem os detectores (pulados por prazo), vale a maioria dos métodos executados
+        detector_votes = [
+            f'is_outlier_{suffix}' for suffix in DETECTOR_SUFFIXES.values()
+            if f'is_outlier_{suffix}' in df.columns
+        ]
+        votes = df['is_outlier_stat'].astype(int)
+        for column in detector_votes:
+            votes = votes + df[column].astype(int)
 
-        df['is_outlier_stat'] = df['amount'] > threshold
-        df['outlier_threshold'] = threshold
+        df['is_outlier_consensus'] = evaluated & (votes >= min(2, 1 + len(detector_votes)))
 
         return df
 
-    def _detect_recurring_patterns(self, df: pd.DataFrame) -> List[Dict]:
+    def _outlier_insights(self, df: pd.DataFrame) -> List[InsightResponse]:
         """
-        Detecta padrões recorrentes (assinaturas, contas fixas)
-        Usando análise de autocorrelação temporal
+        Insights de gastos atípicos (consenso de 2/3)
+        Todos têm o mesmo score, então só os primeiros MAX_INSIGHTS (ordem categoria → data)
+        podem entrar no ranking final; apenas esses viram objetos
         """
-        insights = []
-
-        if len(df) < 30:  # Precisa de pelo menos 1 mês de dados
-            return insights
+        flagged = df[df['is_outlier_consensus']]
 
-        # Agrupa por descrição similar e analisa frequência
-        description_groups = df.groupby('description')
-
-        for description, group in description_groups:
-            if len(group) < 3:
-                continue
+        if flagged.empty:
+            return []
 
-            # Calcula intervalos entre transações
-            group_sorted = group.sort_values('date')
-            intervals = group_sorted['date'].diff().dt.days.dropna()
+        top = flagged.sort_values('category_name', kind='stable').head(MAX_INSIGHTS)
 
-            if len(intervals) < 2:
-                continue
+        return [
+            InsightResponse(
+                type='warning',
+                text=f"🚨 Gasto atípico: R$ {amount:.2f} em '{category_name}' ({deviation:+.0f}% acima da mediana). Verifique!",
+                score=0.92
+            )
+            for amount, category_name, deviation in zip(
+                top['amount'], top['category_name'], top['median_deviation_pct']
+            )
+        ]
 
-            # Detecta padrão mensal (28-32 dias)
-            mean_interval = intervals.mean()
-            std_interval = intervals.std()
-
-            if 28 <= mean_interval <= 32 and std_interval < 5:
-                avg_amount = group['amount'].mean()
-                insights.append({
-                    'type': 'recurring_monthly',
-                    'description': description,
-                    'frequency': 'mensal',
-                    'avg_amount': avg_amount,
-                    'count': len(group),
-                    'confidence': 1.0 - (std_interval / mean_interval),
-                })
-
-            # Detecta padrão semanal (6-8 dias)
-            elif 6 <= mean_interval <= 8 and std_interval < 2:
-                avg_amount = group['amount'].mean()
-                insights.append({
-                    'type': 'recurring_weekly',
-                    'description': description,
-                    'frequency': 'semanal',
-                    'avg_amount': avg_amount,
-                    'count': len(group),
-                    'confidence': 1.0 - (std_interval / mean_interval),
-                })
+    def _detect_recurring_patterns(self, df: pd.DataFrame) -> List[Dict]:
+        """
+        Detecta padrões recorrentes (assinaturas, contas fixas)
+        Chave de estabelecimento normalizada + faixas de valor + intervalos em passada única
+        """
+        if len(df) < 30:  # Precisa de pelo menos 1 mês de dados
+            return []
 
-        return insights
+        return self.recurring_detector.detect(df)
 
-    def _analyze_trends(self, df: pd.DataFrame) -> List[InsightResponse]:
+    def _analyze_trends(self, df: pd.DataFrame, daily: Optional[DailySpend] = None) -> List[InsightResponse]:
         """Análise de tendências com regressão linear e sazonalidade"""
         insights = []
 
         if len(df) < 60:  # Mínimo 2 meses
             return insights
 
-        monthly_spend = df.groupby('month_period')['amount'].sum()
+        daily = daily or DailySpend.from_frame(df)
+
+        return self._trend_insights(daily.monthly_totals())
+
+    def _trend_insights(self, monthly_spend: pd.Series) -> List[InsightResponse]:
+        """Tendência e variação mês a mês a partir da soma mensal (ordenada por mês)"""
+        insights = []
 
         if len(monthly_spend) < 2:
             return insights
@@ -294,10 +659,14 @@ class AnalyzerService:
 
     def _analyze_category_concentration(self, df: pd.DataFrame) -> List[InsightResponse]:
         """Análise de concentração de gastos por categoria"""
-        insights = []
+        category_sum = df.groupby('category_name', observed=True)['amount'].sum()
 
-        category_sum = df.groupby('category_name')['amount'].sum().sort_values(ascending=False)
-        total_spent = df['amount'].sum()
+        return self._concentration_insights(category_sum, df['amount'].sum())
+
+    def _concentration_insights(self, category_sum: pd.Series, total_spent: float) -> List[InsightResponse]:
+        """Top categoria vs orçamento e diversificação (HHI) a partir dos totais por categoria"""
+        insights = []
+        category_sum = category_sum.sort_values(ascending=False)
 
         if total_spent == 0:
             return insights
@@ -340,158 +709,870 @@ class AnalyzerService:
 
         return insights
 
-    def analyze_spending(self, transactions: List[TransactionInput]) -> List[InsightResponse]:
+    def _recurring_insights(self, df: pd.DataFrame) -> List[InsightResponse]:
+        """Resumo das assinaturas/contas mensais detectadas"""
+        recurring_patterns = self._detect_recurring_patterns(df)
+
+        total_recurring = sum(p['avg_amount'] for p in recurring_patterns if p['type'] == 'recurring_monthly')
+
+        if total_recurring > 0:
+            return [InsightResponse(
+                type='info',
+                text=f"🔄 Gastos recorrentes identificados: R$ {total_recurring:.2f}/mês em {len([p for p in recurring_patterns if p['type'] == 'recurring_monthly'])} assinaturas/contas.",
+                score=0.75
+            )]
+
+        return []
+
+    def _remove_duplicates(self, expenses: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
-        Análise completa de gastos com IA avançada
+        Separa as cópias de importação antes dos demais estágios
+
+        Returns:
+            (despesas sem as cópias, cópias); com drop_duplicates desligado as
+            cópias só são reportadas
         """
-        if not transactions:
+        mask = self.duplicate_detector.detect(expenses)
+        duplicates = expenses[mask]
+
+        if duplicates.empty or not self.detector_config['drop_duplicates']:
+            return expenses, duplicates
+
+        return expenses[~mask], duplicates
+
+    def _duplicate_insights(self, duplicates: pd.DataFrame) -> List[InsightResponse]:
+        """Resumo das prováveis transações duplicadas (tipo próprio: 'duplicate')"""
+        if duplicates.empty:
             return []
 
-        insights = []
+        largest = duplicates.loc[duplicates['amount'].idxmax()]
+        label = largest['description'] if 'description' in duplicates.columns and largest['description'] else largest['category_name']
+        dropped = ' Elas foram desconsideradas nos demais insights.' if self.detector_config['drop_duplicates'] else ''
+
+        return [InsightResponse(
+            type='duplicate',
+            text=f"🧾 {len(duplicates)} transações parecem duplicadas (R$ {duplicates['amount'].sum():.2f}), ex.: R$ {largest['amount']:.2f} em '{label}' no dia {largest['date']:%d/%m}. Confira a importação.{dropped}",
+            score=0.90
+        )]
 
-        # Prepara dados
-        df = self._prepare_dataframe(transactions)
+    def _seasonality_insights(self, df: pd.DataFrame) -> List[InsightResponse]:
+        """Gastos em feriados vs dias normais"""
+        if 'is_holiday' not in df.columns:
+            return []
 
-        # Filtra apenas despesas
-        expenses = df[df['type'] == 'EXPENSE'].copy()
+        holiday_spending = df[df['is_holiday'] == 1]['amount'].sum()
+        normal_spending = df[df['is_holiday'] == 0]['amount'].sum()
 
-        if expenses.empty:
+        holiday_days = df['is_holiday'].sum()
+        normal_days = len(df) - holiday_days
+
+        return self._holiday_insights(holiday_spending, holiday_days, normal_spending, normal_days)
+
+    def _weekly_comparison_insights(self, df: pd.DataFrame, daily: Optional[DailySpend] = None) -> List[InsightResponse]:
+        """Gamificação: últimos 7 dias vs os 7 anteriores (consulta O(1) no gasto diário)"""
+        if len(df) < 30:
+            return []
+
+        daily = daily or DailySpend.from_frame(df)
+        week_totals = daily.compare(7)
+
+        if week_totals is None:
+            return []
+
+        return self._weekly_insights(*week_totals)
+
+    def _holiday_insights(self, holiday_spending: float, holiday_days: int, normal_spending: float, normal_days: int) -> List[InsightResponse]:
+        """Gasto médio em feriados vs dias normais"""
+        if holiday_days == 0 or normal_days == 0:
+            return []
+
+        avg_holiday = holiday_spending / holiday_days
+        avg_normal = normal_spending / normal_days
+
+        if avg_holiday > avg_normal * 1.5:
             return [InsightResponse(
-                type='success',
-                text='✅ Sem despesas registradas recentemente. Continue economizando!',
-                score=1.0
+                type='tip',
+                text=f"📅 Seus gastos em feriados são {((avg_holiday/avg_normal - 1) * 100):.0f}% maiores. Planeje com antecedência!",
+                score=0.70
             )]
 
-        # === 1. DETECÇÃO DE ANOMALIAS (Multi-método) ===
+        return []
 
-        # Detecção por Isolation Forest
-        expenses = self._detect_outliers_isolation_forest(expenses)
+    def _weekly_insights(self, last_week_total: float, prev_week_total: float) -> List[InsightResponse]:
+        """Gamificação: semana atual vs anterior"""
+        if last_week_total < prev_week_total * 0.8:
+            return [InsightResponse(
+                type='success',
+                text=f"🏆 Semana econômica! Você gastou {((1 - last_week_total/prev_week_total) * 100):.0f}% menos que a semana anterior.",
+                score=0.90
+            )]
 
-        # Detecção por LOF
-        expenses = self._detect_outliers_lof(expenses)
+        return []
 
-        # Análise por categoria
-        for category_name, category_df in expenses.groupby('category_name'):
-            if len(category_df) < 3:
-                continue
+    def _cohort_insights(self, df: pd.DataFrame, daily: DailySpend) -> List[InsightResponse]:
+        """
+        Gasto mensal por categoria contra a distribuição da coorte do usuário
+        Uma consulta O(1) por categoria nos sketches carregados no startup
+        """
+        if self.cohort_benchmarks is None:
+            return []
 
-            # Detecção estatística adaptativa
-            category_df = self._detect_outliers_statistical(category_df, category_name)
+        profile = spending_profile(df, daily)
 
-            # Combina métodos (consenso de 2/3)
-            outliers = category_df[
-                (category_df['is_outlier_if'] |
-                 category_df['is_outlier_lof'] |
-                 category_df['is_outlier_stat'])
-            ]
+        if profile is None:
+            return []
 
-            # Outliers com alto consenso
-            high_confidence_outliers = category_df[
-                (category_df['is_outlier_if'].astype(int) +
-                 category_df['is_outlier_lof'].astype(int) +
-                 category_df['is_outlier_stat'].astype(int)) >= 2
-            ]
+        cohort, category_monthly = profile
+        high = []
+        low = []
 
-            for _, row in high_confidence_outliers.iterrows():
-                median_category = category_df['amount'].median()
-                deviation = ((row['amount'] - median_category) / median_category) * 100
+        for category, monthly_amount in category_monthly.items():
+            result = self.cohort_benchmarks.percentile(cohort, category, monthly_amount)
 
-                insights.append(InsightResponse(
-                    type='warning',
-                    text=f"🚨 Gasto atípico: R$ {row['amount']:.2f} em '{category_name}' ({deviation:+.0f}% acima da mediana). Verifique!",
-                    score=0.92
-                ))
+            if result is None:
+                continue
 
-        # === 2. PADRÕES RECORRENTES ===
-        recurring_patterns = self._detect_recurring_patterns(expenses)
+            percentile, _, used_cohort = result
+            peers = 'usuários com perfil parecido' if used_cohort == cohort else 'usuários'
 
-        total_recurring = sum(p['avg_amount'] for p in recurring_patterns if p['type'] == 'recurring_monthly')
+            if percentile >= COHORT_HIGH_PERCENTILE:
+                high.append((percentile, category, monthly_amount, peers))
+            elif percentile <= COHORT_LOW_PERCENTILE:
+                low.append((percentile, category, monthly_amount, peers))
 
-        if total_recurring > 0:
+        insights = []
+
+        for percentile, category, monthly_amount, peers in sorted(high, reverse=True)[:2]:
             insights.append(InsightResponse(
-                type='info',
-                text=f"🔄 Gastos recorrentes identificados: R$ {total_recurring:.2f}/mês em {len([p for p in recurring_patterns if p['type'] == 'recurring_monthly'])} assinaturas/contas.",
+                type='warning',
+                text=f"👥 Seu gasto com {category} (R$ {monthly_amount:.2f}/mês) está entre os {max(1, round((1 - percentile) * 100))}% maiores entre {peers}.",
                 score=0.75
             ))
 
-        # === 3. ANÁLISE DE TENDÊNCIAS ===
-        trend_insights = self._analyze_trends(expenses)
-        insights.extend(trend_insights)
+        for percentile, category, monthly_amount, peers in sorted(low)[:1]:
+            insights.append(InsightResponse(
+                type='success',
+                text=f"👏 Você gasta menos com {category} (R$ {monthly_amount:.2f}/mês) do que {round((1 - percentile) * 100)}% dos {peers}.",
+                score=0.55
+            ))
 
-        # === 4. CONCENTRAÇÃO POR CATEGORIA ===
-        category_insights = self._analyze_category_concentration(expenses)
-        insights.extend(category_insights)
+        return insights
 
-        # === 5. ANÁLISE DE SAZONALIDADE ===
-        # Gastos em feriados vs dias normais
-        if 'is_holiday' in expenses.columns:
-            holiday_spending = expenses[expenses['is_holiday'] == 1]['amount'].sum()
-            normal_spending = expenses[expenses['is_holiday'] == 0]['amount'].sum()
+    def _config_version(self) -> str:
+        """Versão da lógica + hash da configuração atual (mudanças invalidam o cache)"""
+        config = repr((
+            ANALYZER_VERSION,
+            sorted(self.detector_config.items()),
+            sorted((name, sorted(values.items())) for name, values in self.category_thresholds.items()),
+            self.recurring_detector.amount_tolerance,
+            self.recurring_detector.min_occurrences,
+            self.cohort_benchmarks.built_at if self.cohort_benchmarks else None,
+        ))
+        return hashlib.sha1(config.encode('utf-8')).hexdigest()[:12]
+
+    def analyze_spending(self, transactions: List[TransactionInput], user_id: Optional[str] = None) -> List[InsightResponse]:
+        """
+        Análise completa de gastos com IA avançada
+        `user_id` habilita os detectores persistidos por usuário
 
-            holiday_days = expenses['is_holiday'].sum()
-            normal_days = len(expenses) - holiday_days
+        Resultados ficam em cache (LRU + TTL) pela impressão digital do conjunto
+        de transações: o mesmo histórico, em qualquer ordem, não é reprocessado.
+        """
+        return self.analyze_spending_timed(transactions, user_id)[0]
+
+    def analyze_spending_timed(
+        self,
+        transactions: List[TransactionInput],
+        user_id: Optional[str] = None,
+        deadline_ms: Optional[float] = None,
+    ) -> Tuple[List[InsightResponse], Dict]:
+        """
+        analyze_spending com prazo opcional e relatório do pipeline
 
-            if holiday_days > 0 and normal_days > 0:
-                avg_holiday = holiday_spending / holiday_days
-                avg_normal = normal_spending / normal_days
+        Com `deadline_ms`, estágios cujo custo estimado não cabe no tempo restante
+        são pulados (detectores caem para o voto estatístico). Resultados parciais
+        não entram no cache.
 
-                if avg_holiday > avg_normal * 1.5:
-                    insights.append(InsightResponse(
-                        type='tip',
-                        text=f"📅 Seus gastos em feriados são {((avg_holiday/avg_normal - 1) * 100):.0f}% maiores. Planeje com antecedência!",
-                        score=0.70
-                    ))
+        Returns:
+            (insights, relatório com status e tempo de cada estágio)
+        """
+        start = time.perf_counter()
 
-        # === 6. INSIGHTS POSITIVOS (Gamificação) ===
-        if len(expenses) >= 30:
-            last_week = expenses[expenses['date'] >= (expenses['date'].max() - timedelta(days=7))]
-            prev_week = expenses[
-                (expenses['date'] >= (expenses['date'].max() - timedelta(days=14))) &
-                (expenses['date'] < (expenses['date'].max() - timedelta(days=7)))
-            ]
+        if not transactions:
+            return [], self._cached_report(start, deadline_ms)
 
-            if len(last_week) > 0 and len(prev_week) > 0:
-                last_week_total = last_week['amount'].sum()
-                prev_week_total = prev_week['amount'].sum()
+        def compute():
+            insights, _, report = self._run_pipeline(transactions, user_id, deadline_ms)
+            return (insights, report), not report['skipped']
 
-                if last_week_total < prev_week_total * 0.8:
-                    insights.append(InsightResponse(
-                        type='success',
-                        text=f"🏆 Semana econômica! Você gastou {((1 - last_week_total/prev_week_total) * 100):.0f}% menos que a semana anterior.",
-                        score=0.90
-                    ))
+        (insights, report), hit = self._cached('insights', transactions, user_id, compute)
+
+        if hit:
+            report = self._cached_report(start, deadline_ms)
+
+        return list(insights), report
+
+    def analyze_spending_stream(
+        self,
+        transactions: List[TransactionInput],
+        user_id: Optional[str] = None,
+        deadline_ms: Optional[float] = None,
+    ) -> Iterator[Dict]:
+        """
+        analyze_spending progressivo: cada estágio emite seus insights ao terminar
+        (concentração e tendências em milissegundos, detectores por último)
+
+        Compartilha o cache com analyze_spending_timed: um hit emite tudo de uma vez.
+
+        Yields:
+            {'type': 'insight', 'stage', 'insight'} por insight, e por último
+            {'type': 'summary', 'insights' (ranqueados, top MAX_INSIGHTS), 'pipeline'}
+        """
+        start = time.perf_counter()
+
+        if not transactions:
+            yield {'type': 'summary', 'insights': [], 'pipeline': self._cached_report(start, deadline_ms)}
+            return
+
+        cache_key = self._cache_key('insights', transactions, user_id)
+        now = time.monotonic()
+        cached = self._cache_get(cache_key, now)
+
+        if cached is not None:
+            insights, _ = cached
+            for insight in insights:
+                yield {'type': 'insight', 'stage': 'cache', 'insight': insight.dict()}
+            yield {'type': 'summary', 'insights': [insight.dict() for insight in insights], 'pipeline': self._cached_report(start, deadline_ms)}
+            return
+
+        events = self._pipeline_events(transactions, user_id, deadline_ms)
+
+        while True:
+            try:
+                stage, stage_insights = next(events)
+            except StopIteration as done:
+                insights, _, report = done.value
+                break
+
+            for insight in stage_insights:
+                yield {'type': 'insight', 'stage': stage, 'insight': insight.dict()}
+
+        if not report['skipped']:
+            self._cache_put(cache_key, now, (insights, report))
+
+        yield {'type': 'summary', 'insights': [insight.dict() for insight in insights], 'pipeline': report}
+
+    def analyze_full(self, transactions: List[TransactionInput], user_id: Optional[str] = None, deadline_ms: Optional[float] = None) -> Dict:
+        """
+        Insights, estatísticas de anomalia e scores por transação em uma única passada
+        (DataFrame preparado e detectores calculados uma vez só)
+
+        Returns:
+            insights ranqueados, anomaly_stats, scores (uma entrada por despesa,
+            `index` = posição na lista recebida) e o relatório do pipeline
+        """
+        start = time.perf_counter()
+
+        if not transactions:
+            return {'insights': [], 'anomaly_stats': {}, 'scores': [], 'pipeline': self._cached_report(start, deadline_ms)}
+
+        def compute():
+            insights, expenses, report = self._run_pipeline(transactions, user_id, deadline_ms)
+            result = {
+                'insights': insights,
+                'anomaly_stats': self._anomaly_stats(expenses),
+                'scores': self._transaction_scores(expenses),
+                'pipeline': report,
+            }
+            return result, not report['skipped']
+
+        result, hit = self._cached('full', transactions, user_id, compute)
+
+        if hit:
+            return {**result, 'pipeline': self._cached_report(start, deadline_ms)}
+
+        return dict(result)
+
+    def _cached(self, kind: str, transactions: List[TransactionInput], user_id: Optional[str], compute: Callable[[], Tuple[Any, bool]]) -> Tuple[Any, bool]:
+        """
+        Consulta o cache de resultados; em caso de miss, calcula e armazena
+        `compute` retorna (resultado, pode_ir_para_o_cache)
+
+        Returns:
+            (resultado, veio do cache)
+        """
+        cache_key = self._cache_key(kind, transactions, user_id)
+        now = time.monotonic()
+        cached = self._cache_get(cache_key, now)
+
+        if cached is not None:
+            return cached, True
+
+        result, cacheable = compute()
+
+        if cacheable:
+            self._cache_put(cache_key, now, result)
+
+        return result, False
+
+    def _cache_key(self, kind: str, transactions: List[TransactionInput], user_id: Optional[str]) -> Tuple:
+        return (kind, user_id, transactions_fingerprint(transactions), self._config_version())
+
+    def _cache_get(self, cache_key: Tuple, now: float) -> Optional[Any]:
+        """Cópia nova do resultado em cache ainda válido (conta hit/miss)"""
+        with self._insight_cache_lock:
+            cached = self._insight_cache.get(cache_key)
+            if cached is not None and now - cached[0] < INSIGHT_CACHE_TTL:
+                self._insight_cache.move_to_end(cache_key)
+                self.insight_cache_hits += 1
+                payload = cached[1]
+            else:
+                self.insight_cache_misses += 1
+                return None
+
+        return pickle.loads(payload)
+
+    def _cache_put(self, cache_key: Tuple, now: float, result: Any) -> None:
+        """Guarda o resultado serializado: quem alterar a resposta não altera o cache"""
+        payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with self._insight_cache_lock:
+            self._insight_cache[cache_key] = (now, payload)
+            self._insight_cache.move_to_end(cache_key)
+            while len(self._insight_cache) > INSIGHT_CACHE_SIZE:
+                self._insight_cache.popitem(last=False)
+
+    def _cached_report(self, start: float, deadline_ms: Optional[float]) -> Dict:
+        """Relatório de uma resposta que não executou o pipeline"""
+        return {
+            'deadline_ms': deadline_ms,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+            'cached': True,
+            'stages': {},
+            'skipped': [],
+        }
+
+    def get_cache_stats(self) -> Dict:
+        """Estatísticas do cache de insights"""
+        with self._insight_cache_lock:
+            total_lookups = self.insight_cache_hits + self.insight_cache_misses
+            return {
+                "size": len(self._insight_cache),
+                "max_size": INSIGHT_CACHE_SIZE,
+                "ttl_seconds": INSIGHT_CACHE_TTL,
+                "hits": self.insight_cache_hits,
+                "misses": self.insight_cache_misses,
+                "hit_rate": self.insight_cache_hits / total_lookups if total_lookups else 0.0,
+                "config_version": self._config_version(),
+            }
+
+    def _estimate_cost(self, stage: str, n: int) -> float:
+        """Custo estimado (ms) de um estágio para `n` despesas"""
+        fixed, per_row = STAGE_COST_MODEL[stage]
+
+        with self._cost_lock:
+            calibration = self._cost_calibration[stage]
+
+        return (fixed + per_row * n) * calibration
+
+    def _calibrate_cost(self, stage: str, n: int, elapsed_ms: float) -> None:
+        """
+        Atualiza a correção do estágio com o tempo observado (limitada a 0.1x–10x)
+
+        A primeira medição de cada estágio é descartada (compilação numba, imports
+        e caches frios) e nenhuma medição move a correção mais que CALIBRATION_MAX_STEP.
+        """
+        fixed, per_row = STAGE_COST_MODEL[stage]
+        ratio = min(max(elapsed_ms / (fixed + per_row * n), 0.1), 10.0)
+
+        with self._cost_lock:
+            self._cost_samples[stage] += 1
+            if self._cost_samples[stage] == 1:
+                return
+
+            previous = self._cost_calibration[stage]
+            updated = 0.8 * previous + 0.2 * ratio
+            self._cost_calibration[stage] = min(max(updated, previous / CALIBRATION_MAX_STEP), previous * CALIBRATION_MAX_STEP)
+
+    def _plan_stages(self, n: int, stages: List[str], remaining_ms: Optional[float]) -> List[str]:
+        """
+        Estágios que cabem no tempo restante
+
+        Admite do mais barato para o mais caro enquanto a duração estimada do
+        lote paralelo — max(estágio mais longo, soma / threads) — somada ao
+        estágio estatístico obrigatório couber no orçamento. Estágios abaixo de
+        MIN_STAGE_COST_MS entram sempre.
+        """
+        if remaining_ms is None:
+            return list(stages)
+
+        budget = remaining_ms - self._estimate_cost('statistical', n)
+
+        admitted = []
+        total = 0.0
+        longest = 0.0
+
+        for stage in sorted(stages, key=lambda name: self._estimate_cost(name, n)):
+            cost = self._estimate_cost(stage, n)
+
+            if cost < MIN_STAGE_COST_MS or max(longest, cost, (total + cost) / self.max_workers) <= budget:
+                admitted.append(stage)
+                total += cost
+                longest = max(longest, cost)
+
+        return admitted
+
+    def _timed(self, name: str, stage: Callable[[], Any], timings: Dict[str, float]) -> Callable[[], Any]:
+        """Envolve o estágio medindo o tempo de execução (sem a espera na fila do pool)"""
+        def run():
+            start = time.perf_counter()
+            try:
+                return stage()
+            finally:
+                timings[name] = (time.perf_counter() - start) * 1000
+
+        return run
+
+    def _budgeted(self, name: str, stage: Callable[[], Any], start: float, deadline_ms: Optional[float], n: int) -> Callable[[], Any]:
+        """
+        Envolve o estágio conferindo o prazo no momento em que ele começa
+        (depois da espera na fila do pool): se a estimativa já não cabe no tempo
+        restante, reservado o estágio estatístico, devolve _STAGE_SKIPPED sem executar
+        """
+        if deadline_ms is None:
+            return stage
+
+        def run():
+            cost = self._estimate_cost(name, n)
+            remaining = deadline_ms - (time.perf_counter() - start) * 1000 - self._estimate_cost('statistical', n)
+
+            if cost >= MIN_STAGE_COST_MS and cost > remaining:
+                return _STAGE_SKIPPED
+
+            return stage()
+
+        return run
+
+    def _iter_stages(self, stages: Dict[str, Callable[[], Any]]) -> Iterator[Tuple[str, Any]]:
+        """
+        Executa estágios independentes no pool de threads do analyzer
+        (sklearn/numpy liberam o GIL na maior parte do trabalho)
+
+        Yields:
+            (nome, resultado) na ordem de conclusão; a primeira exceção é propagada
+        """
+        if self._executor is None:
+            for name, stage in stages.items():
+                yield name, stage()
+            return
+
+        futures = {self._executor.submit(stage): name for name, stage in stages.items()}
+
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def _run_stages(self, stages: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """Executa os estágios e devolve os resultados por nome"""
+        return dict(self._iter_stages(stages))
+
+    def _run_pipeline(
+        self,
+        transactions: List[TransactionInput],
+        user_id: Optional[str] = None,
+        deadline_ms: Optional[float] = None,
+    ) -> Tuple[List[InsightResponse], pd.DataFrame, Dict]:
+        """
+        Pipeline completo de análise (sem cache)
+
+        Returns:
+            (insights ranqueados, despesas com as colunas dos detectores, relatório do pipeline)
+        """
+        events = self._pipeline_events(transactions, user_id, deadline_ms)
+
+        while True:
+            try:
+                next(events)
+            except StopIteration as done:
+                return done.value
+
+    def _pipeline_events(
+        self,
+        transactions: List[TransactionInput],
+        user_id: Optional[str] = None,
+        deadline_ms: Optional[float] = None,
+    ) -> Generator[Tuple[str, List[InsightResponse]], None, Tuple[List[InsightResponse], pd.DataFrame, Dict]]:
+        """
+        Pipeline como gerador: emite os insights de cada estágio assim que ele termina
+
+        Yields:
+            (estágio, insights do estágio)
+
+        Returns:
+            (insights ranqueados, despesas com as colunas dos detectores, relatório do pipeline)
+        """
+        start = time.perf_counter()
+        timings = {}
+        insights = []
+
+        # Prepara dados (apenas despesas)
+        expenses = self._prepare_dataframe(transactions, expenses_only=True)
+        timings['prepare'] = (time.perf_counter() - start) * 1000
+
+        if expenses.empty:
+            insights = [InsightResponse(
+                type='success',
+                text='✅ Sem despesas registradas recentemente. Continue economizando!',
+                score=1.0
+            )]
+            yield 'prepare', insights
+            return insights, expenses, self._pipeline_report(start, deadline_ms, timings, {}, [])
+
+        # === 0. DUPLICATAS (antes de tudo: cópias inflariam todos os estágios) ===
+        expenses, duplicates = self._timed('duplicates', lambda: self._remove_duplicates(expenses), timings)()
+        insights.extend(self._duplicate_insights(duplicates))
+        if insights:
+            yield 'duplicates', list(insights)
+
+        # === 1. ESTÁGIOS INDEPENDENTES (em paralelo, limitados pelo prazo) ===
+        # Os detectores escrevem colunas em frames próprios e estreitos; os demais só leem `expenses`
+        # Gasto diário denso: janelas semanais/mensais viram consultas O(1)
+        daily = DailySpend.from_frame(expenses)
+
+        n = len(expenses)
+        detectors = self._select_detectors(n)
+
+        stages = {
+            **self._detector_stages(expenses, user_id, detectors),
+            'recurring': lambda: self._recurring_insights(expenses),
+            'trends': lambda: self._analyze_trends(expenses, daily),
+            'concentration': lambda: self._analyze_category_concentration(expenses),
+            'seasonality': lambda: self._seasonality_insights(expenses),
+            'weekly': lambda: self._weekly_comparison_insights(expenses, daily),
+            'cohort': lambda: self._cohort_insights(expenses, daily),
+        }
 
-        # === 7. FALLBACK ===
+        # Relógio de parede desde o início: inclui o que não é estágio (gasto diário, JIT a frio)
+        remaining_ms = None if deadline_ms is None else deadline_ms - (time.perf_counter() - start) * 1000
+        estimates = {stage: self._estimate_cost(stage, n) for stage in ['duplicates'] + list(stages) + ['statistical']}
+        admitted = self._plan_stages(n, list(stages), remaining_ms)
+
+        # Estágios de insights são emitidos ao terminar; os detectores só alimentam o consenso
+        # Submetidos do mais barato ao mais caro: os insights rápidos não esperam na fila do pool
+        results = {}
+        # O prazo é conferido de novo quando cada estágio começa
+        queued = sorted(admitted, key=lambda name: estimates[name])
+        for name, result in self._iter_stages({
+            name: self._budgeted(name, self._timed(name, stages[name], timings), start, deadline_ms, n)
+            for name in queued
+        }):
+            if result is _STAGE_SKIPPED:
+                continue
+            results[name] = result
+            if name not in detectors and result:
+                yield name, result
+
+        # === 2. DETECÇÃO DE ANOMALIAS (consenso detectores + estatístico) ===
+        for detector in detectors:
+            if detector in results:
+                for column in results[detector].columns.difference(DETECTOR_COLUMNS):
+                    expenses[column] = results[detector][column]
+
+        # Detecção estatística adaptativa + consenso, todas as categorias de uma vez
+        expenses = self._timed('statistical', lambda: self._detect_outliers_statistical(expenses), timings)()
+
+        # Detectores pulados: o voto estatístico decidiu sozinho
+        for detector in detectors:
+            if detector not in results:
+                expenses[f'is_outlier_{DETECTOR_SUFFIXES[detector]}'] = False
+
+        outlier_insights = self._outlier_insights(expenses)
+        if outlier_insights:
+            yield 'statistical', outlier_insights
+
+        # === 3. MERGE (ordem fixa dos estágios: desempate estável do ranking) ===
+        insights.extend(outlier_insights)
+        for stage in ('recurring', 'trends', 'concentration', 'seasonality', 'weekly', 'cohort'):
+            insights.extend(results.get(stage, []))
+
+        # === 4. FALLBACK ===
         if len(insights) == 0:
             insights.append(InsightResponse(
                 type='tip',
                 text='💡 Continue registrando seus gastos diariamente para receber insights personalizados mais precisos.',
                 score=0.10
             ))
+            yield 'fallback', list(insights)
+
+        # Detectores persistidos por usuário só pontuam o delta: não representam o custo de um fit
+        for stage in ['duplicates'] + [name for name in admitted if name in results] + ['statistical']:
+            if user_id is None or stage not in PERSISTED_DETECTORS:
+                self._calibrate_cost(stage, n, timings[stage])
+
+        skipped = [stage for stage in stages if stage not in results]
+        report = self._pipeline_report(start, deadline_ms, timings, estimates, skipped)
+        report['detectors'] = list(detectors)
 
         # Ordena por relevância e limita a top 10
-        return sorted(insights, key=lambda x: x.score, reverse=True)[:10]
+        return sorted(insights, key=lambda x: x.score, reverse=True)[:MAX_INSIGHTS], expenses, report
 
-    def get_anomaly_stats(self, transactions: List[TransactionInput]) -> Dict:
-        """Retorna estatísticas de detecção de anomalias"""
-        if not transactions:
-            return {}
+    def _pipeline_report(self, start: float, deadline_ms: Optional[float], timings: Dict[str, float], estimates: Dict[str, float], skipped: List[str]) -> Dict:
+        """Status, custo estimado e tempo medido de cada estágio"""
+        stages = {}
 
-        df = self._prepare_dataframe(transactions)
-        expenses = df[df['type'] == 'EXPENSE'].copy()
+        for stage in ['prepare'] + list(estimates):
+            if stage in skipped:
+                status = 'fallback' if stage in FALLBACK_STAGES else 'skipped'
+            else:
+                status = 'ok'
 
+            stages[stage] = {
+                'status': status,
+                'estimated_ms': round(estimates[stage], 3) if stage in estimates else None,
+                'elapsed_ms': round(timings[stage], 3) if stage in timings else None,
+            }
+
+        return {
+            'deadline_ms': deadline_ms,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+            'cached': False,
+            'stages': stages,
+            'skipped': skipped,
+        }
+
+    def _anomaly_stats(self, expenses: pd.DataFrame) -> Dict:
+        """Estatísticas de detecção a partir das despesas já pontuadas"""
         if expenses.empty:
             return {}
 
-        expenses = self._detect_outliers_isolation_forest(expenses)
-        expenses = self._detect_outliers_lof(expenses)
+        # Um contador por detector executado; a taxa vem do primeiro (IF ou ECOD)
+        suffixes = [suffix for suffix in DETECTOR_SUFFIXES.values() if f'is_outlier_{suffix}' in expenses.columns]
 
-        return {
-            "total_transactions": len(expenses),
-            "outliers_if": int(expenses['is_outlier_if'].sum()),
-            "outliers_lof": int(expenses['is_outlier_lof'].sum()),
-            "outlier_rate": float(expenses['is_outlier_if'].sum() / len(expenses)),
+        stats = {"total_transactions": len(expenses)}
+
+        for suffix in suffixes:
+            stats[f"outliers_{suffix}"] = int(expenses[f'is_outlier_{suffix}'].sum())
+
+        stats.update({
+            "outlier_rate": float(expenses[f'is_outlier_{suffixes[0]}'].sum() / len(expenses)),
             "mean_amount": float(expenses['amount'].mean()),
             "median_amount": float(expenses['amount'].median()),
             "std_amount": float(expenses['amount'].std()),
+        })
+
+        if 'is_outlier_consensus' in expenses.columns:
+            stats["outliers_stat"] = int(expenses['is_outlier_stat'].sum())
+            stats["outliers_consensus"] = int(expenses['is_outlier_consensus'].sum())
+
+        return stats
+
+    def _transaction_scores(self, expenses: pd.DataFrame) -> List[Dict]:
+        """Scores e votos dos detectores por despesa (scores ausentes com menos de 10 despesas)"""
+        if expenses.empty:
+            return []
+
+        columns = {
+            'index': expenses.index,
+            'date': expenses['date'],
+            'amount': expenses['amount'],
+            'category_name': expenses['category_name'],
         }
+
+        # Apenas os detectores do backend executado
+        suffixes = [suffix for suffix in DETECTOR_SUFFIXES.values() if f'is_outlier_{suffix}' in expenses.columns]
+
+        for suffix in suffixes:
+            columns[f'anomaly_score_{suffix}'] = expenses.get(f'anomaly_score_{suffix}', np.nan)
+        for suffix in suffixes:
+            columns[f'is_outlier_{suffix}'] = expenses[f'is_outlier_{suffix}']
+
+        columns['is_outlier_stat'] = expenses['is_outlier_stat']
+        columns['is_outlier_consensus'] = expenses['is_outlier_consensus']
+
+        scores = pd.DataFrame(columns)
+
+        scores = scores.astype(object).where(scores.notna(), None)
+
+        return scores.to_dict('records')
+
+    def _delta_outlier_insights(self, user_id: str, expenses: pd.DataFrame, aggregates: SpendingAggregates) -> List[InsightResponse]:
+        """
+        Gastos atípicos do delta contra a linha de base robusta da categoria
+        (mediana/MAD dos agregados, antes de incorporar o delta)
+
+        Se o usuário já tem Isolation Forest persistido, exige também o voto dele
+        (consenso de 2/2); caso contrário vale só o critério estatístico.
+        """
+        baseline = aggregates.category_baseline()
+
+        if expenses.empty or baseline.empty:
+            return []
+
+        stats_by_row = baseline.reindex(expenses['category_name'])
+        amounts = expenses['amount'].to_numpy(dtype=np.float64)
+        median = stats_by_row['median'].to_numpy()
+        mad = stats_by_row['mad'].to_numpy()
+
+        default_factor = self.category_thresholds['default']['outlier_factor']
+        outlier_factor = expenses['category_name'].map(
+            {name: config['outlier_factor'] for name, config in self.category_thresholds.items()}
+        ).astype(float).fillna(default_factor).to_numpy()
+
+        # Mesmo critério de _detect_outliers_statistical
+        threshold = np.where(
+            mad == 0,
+            stats_by_row['mean'].to_numpy() + outlier_factor * stats_by_row['std'].to_numpy(),
+            median + outlier_factor * mad / 0.6745,
+        )
+        flagged = (stats_by_row['count'].to_numpy() >= 3) & (amounts > threshold)
+
+        iforest_state = self.detector_store.load(user_id, 'iforest')
+        if iforest_state is not None and flagged.any():
+            X = expenses[['amount', 'day_of_week', 'day_of_month']].to_numpy(dtype=np.float64)
+            scores = iforest_state['model'].score_samples(iforest_state['scaler'].transform(X))
+            flagged &= scores < iforest_state['model'].offset_
+
+        deviation = (amounts - median) / median * 100
+
+        return [
+            InsightResponse(
+                type='warning',
+                text=f"🚨 Gasto atípico: R$ {amounts[i]:.2f} em '{expenses['category_name'].iloc[i]}' ({deviation[i]:+.0f}% acima da mediana). Verifique!",
+                score=0.92
+            )
+            for i in np.flatnonzero(flagged)[:MAX_INSIGHTS]
+        ]
+
+    def _aggregate_insights(self, aggregates: SpendingAggregates) -> List[InsightResponse]:
+        """Tendência, concentração, sazonalidade e semana econômica a partir dos agregados"""
+        if aggregates.n_expenses == 0:
+            return [InsightResponse(
+                type='success',
+                text='✅ Sem despesas registradas recentemente. Continue economizando!',
+                score=1.0
+            )]
+
+        insights = []
+
+        if aggregates.n_expenses >= 60:  # Mínimo 2 meses
+            insights.extend(self._trend_insights(aggregates.monthly))
+
+        insights.extend(self._concentration_insights(
+            aggregates.categories['sum'], aggregates.categories['sum'].sum()
+        ))
+
+        holiday_spending, holiday_days = aggregates.holiday
+        normal_spending, normal_days = aggregates.normal
+        insights.extend(self._holiday_insights(holiday_spending, holiday_days, normal_spending, normal_days))
+
+        if aggregates.n_expenses >= 30:
+            week_totals = aggregates.week_totals()
+            if week_totals is not None:
+                insights.extend(self._weekly_insights(week_totals['last_week'], week_totals['prev_week']))
+
+        return insights
+
+    def analyze_spending_incremental(self, user_id: str, transactions: List[TransactionInput]) -> Dict:
+        """
+        Análise incremental a partir dos agregados persistidos do usuário
+
+        Recebe as transações novas; as já incorporadas (mesma chave: id de origem
+        ou conteúdo, ver transaction_keys) são ignoradas. Linhas retroativas e
+        importações atrasadas entram normalmente dentro da janela de atraso
+        (KEY_WINDOW_DAYS antes do watermark); as anteriores a ela são ignoradas
+        e contadas em `expired`. O custo depende do delta e da janela, não do
+        histórico. Padrões recorrentes exigem o histórico bruto e ficam no /recurring.
+
+        Returns:
+            insights ranqueados, watermark (data mais recente incorporada) e contagens do delta
+        """
+        aggregates = SpendingAggregates.from_state(self.detector_store.load(user_id, 'aggregates'))
+
+        insights = []
+        ingested = 0
+        skipped = 0
+        expired = 0
+
+        if transactions:
+            df = self._prepare_dataframe(transactions)
+            keys = pd.Series(transaction_keys(transactions)[df.index], index=df.index)
+            days = to_days(df['date'])
+
+            # Anteriores à janela de atraso: as chaves delas já foram descartadas
+            cutoff = aggregates.key_cutoff()
+            in_window = np.ones(len(df), dtype=bool) if cutoff is None else days >= cutoff
+            expired = int((~in_window).sum())
+
+            # Já incorporadas, ou repetidas (mesmo id) dentro do próprio delta
+            fresh = in_window & aggregates.unseen(keys.to_numpy()) & ~keys.duplicated().to_numpy()
+            skipped = int((in_window & ~fresh).sum())
+            df = df[fresh]
+            keys = keys[fresh]
+            days = days[fresh]
+
+            if not df.empty:
+                expenses = df[df['type'] == 'EXPENSE']
+
+                insights.extend(self._delta_outlier_insights(user_id, expenses, aggregates))
+
+                aggregates.update(expenses, df['date'].max(), keys.to_numpy(), days)
+                ingested = len(df)
+
+                self.detector_store.save(user_id, 'aggregates', aggregates.to_state())
+
+        insights.extend(self._aggregate_insights(aggregates))
+
+        if len(insights) == 0:
+            insights.append(InsightResponse(
+                type='tip',
+                text='💡 Continue registrando seus gastos diariamente para receber insights personalizados mais precisos.',
+                score=0.10
+            ))
+
+        return {
+            'insights': sorted(insights, key=lambda x: x.score, reverse=True)[:MAX_INSIGHTS],
+            'watermark': aggregates.watermark,
+            'ingested': ingested,
+            'skipped': skipped,
+            'expired': expired,
+            'total_expenses': aggregates.n_expenses,
+        }
+
+    def detect_recurring(self, transactions: List[TransactionInput]) -> List[Dict]:
+        """Assinaturas e contas fixas detectadas, com próxima cobrança esperada"""
+        if not transactions:
+            return []
+
+        expenses = self._prepare_dataframe(transactions, expenses_only=True)
+
+        return self.recurring_detector.detect(expenses)
+
+    def score_transaction(self, user_id: str, transaction_id: str, transaction: TransactionInput, update: bool = True) -> Dict:
+        """Score de anomalia de uma transação nova (ver TransactionScorer.score)"""
+        return self.transaction_scorer.score(user_id, transaction_id, transaction, update=update)
+
+    def rebuild_transaction_sketches(self, user_id: str, transactions: List[TransactionInput]) -> Dict[str, int]:
+        """Reconstrói os sketches do score em tempo real a partir do histórico"""
+        return self.transaction_scorer.rebuild(user_id, transactions)
+
+    def get_anomaly_stats(self, transactions: List[TransactionInput], user_id: Optional[str] = None) -> Dict:
+        """
+        Retorna estatísticas de detecção de anomalias
+        Para insights + estatísticas juntos, use analyze_full (uma passada só)
+        """
+        if not transactions:
+            return {}
+
+        expenses = self._prepare_dataframe(transactions, expenses_only=True)
+
+        if expenses.empty:
+            return {}
+
+        expenses, _ = self._remove_duplicates(expenses)
+        detectors = self._select_detectors(len(expenses))
+        results = self._run_stages(self._detector_stages(expenses, user_id, detectors))
+
+        for detector in detectors:
+            column = f'is_outlier_{DETECTOR_SUFFIXES[detector]}'
+            expenses[column] = results[detector][column]
+
+        return self._anomaly_stats(expenses)
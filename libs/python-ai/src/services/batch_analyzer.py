@@ -0,0 +1,271 @@
+"""
+Batch Analyzer - Insights em Lote para Vários Usuários
+=========================================================
+
+Gera o digest semanal de todos os usuários sem uma chamada HTTP por usuário:
+
+- Usuários agrupados em shards (até BATCH_SHARD_TRANSACTIONS transações cada)
+- Shards distribuídos em um pool de processos do tamanho do host (sem disputa de GIL)
+- Cada processo mantém seu próprio AnalyzerService sequencial: o paralelismo é entre usuários
+- Resultados por usuário emitidos à medida que os shards terminam, seguidos de um
+  resumo com throughput
+- Entrada pelo corpo da requisição ou por arquivo JSONL local (batch_input.py:
+  uma linha por usuário: {"user_id": ..., "transactions": [...]}); linhas
+  malformadas viram um registro {"type": "error", "line": n, "error": ...}
+  no fluxo, sem interromper os demais usuários
+- Queda de um processo do pool (BrokenProcessPool): cada usuário dos shards
+  perdidos vira um registro {"type": "error", "user_id": ..., "error": ...};
+  os shards seguintes vão para um pool novo e o resumo é emitido normalmente
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+from src.models.schemas import TransactionInput
+from src.services.analyzer import AnalyzerService
+from src.services.batch_input import InvalidLine, UserTransactions
+
+# Processos do pool (um por núcleo)
+BATCH_MAX_WORKERS = os.cpu_count() or 1
+
+# Tamanho dos shards: fecha ao atingir qualquer um dos limites
+BATCH_SHARD_TRANSACTIONS = 20000
+BATCH_SHARD_USERS = 100
+
+# Shards em voo por processo (limita memória ao ler arquivos grandes)
+BATCH_PENDING_PER_WORKER = 2
+
+# AnalyzerService de cada processo do pool (criado no initializer)
+_worker_analyzer = None
+
+
+def _init_worker() -> None:
+    global _worker_analyzer
+    _worker_analyzer = AnalyzerService(max_workers=1)
+
+
+def _analyze_shard(shard: List[UserTransactions]) -> List[Dict]:
+    """Executado no processo do pool: analisa os usuários do shard em sequência"""
+    results = []
+
+    for user_id, transactions in shard:
+        start = time.perf_counter()
+
+        try:
+            parsed = [t if isinstance(t, TransactionInput) else TransactionInput(**t) for t in transactions]
+            insights = _worker_analyzer.analyze_spending(parsed, user_id=user_id)
+
+            results.append({
+                'type': 'user',
+                'user_id': user_id,
+                'n_transactions': len(transactions),
+                'insights': [insight.dict() for insight in insights],
+                'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+            })
+        except Exception as e:
+            print(f"Erro na análise em lote do usuário {user_id}: {e}")
+            results.append({
+                'type': 'user',
+                'user_id': user_id,
+                'n_transactions': len(transactions),
+                'error': str(e),
+            })
+
+    return results
+
+
+class BatchAnalyzer:
+    def __init__(
+        self,
+        max_workers: int = BATCH_MAX_WORKERS,
+        shard_transactions: int = BATCH_SHARD_TRANSACTIONS,
+        shard_users: int = BATCH_SHARD_USERS,
+    ):
+        self.max_workers = max_workers
+        self.shard_transactions = shard_transactions
+        self.shard_users = shard_users
+
+        # Pool criado sob demanda e reaproveitado entre lotes
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: não herda threads/locks do processo da API
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                )
+            return self._pool
+
+    def _reset_pool(self, pool: ProcessPoolExecutor = None) -> None:
+        """Descarta o pool (só se ainda for `pool`, quando dado: outro lote pode já ter trocado)"""
+        with self._lock:
+            if self._pool is not None and (pool is None or self._pool is pool):
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _submit(self, shard: List[UserTransactions]) -> Tuple[Future, ProcessPoolExecutor]:
+        """
+        Submete no pool atual (lido a cada submit: outro lote pode tê-lo trocado)
+        Um pool encerrado ou quebrado entre a leitura e o submit é trocado uma vez
+
+        Returns:
+            (future do shard, pool que o recebeu)
+        """
+        pool = self._get_pool()
+
+        try:
+            return pool.submit(_analyze_shard, shard), pool
+        except RuntimeError as e:  # Inclui BrokenProcessPool
+            print(f"Pool do batch indisponível, recriando: {e}")
+            self._reset_pool(pool)
+            pool = self._get_pool()
+            return pool.submit(_analyze_shard, shard), pool
+
+    def _shards(self, users: Iterable[UserTransactions]) -> Iterator[List[UserTransactions]]:
+        shard = []
+        shard_size = 0
+
+        for user_id, transactions in users:
+            shard.append((user_id, transactions))
+            shard_size += len(transactions)
+
+            if shard_size >= self.shard_transactions or len(shard) >= self.shard_users:
+                yield shard
+                shard = []
+                shard_size = 0
+
+        if shard:
+            yield shard
+
+    def analyze(self, users: Iterable[Union[UserTransactions, InvalidLine]]) -> Iterator[Dict]:
+        """
+        Analisa os usuários no pool de processos
+
+        Yields:
+            Um resultado por usuário (ordem de conclusão), um registro de erro
+            por linha de entrada inválida e por usuário de shard perdido em queda
+            do pool e, por último, o resumo do lote com throughput
+        """
+        start = time.perf_counter()
+        invalid_lines = deque()
+
+        def valid_users() -> Iterator[UserTransactions]:
+            for item in users:
+                if isinstance(item, InvalidLine):
+                    invalid_lines.append(item)
+                else:
+                    yield item
+
+        def drain_invalid() -> Iterator[Dict]:
+            while invalid_lines:
+                invalid = invalid_lines.popleft()
+                yield {'type': 'error', 'line': invalid.line, 'error': invalid.error}
+
+        shards = self._shards(valid_users())
+        max_pending = self.max_workers * BATCH_PENDING_PER_WORKER
+
+        pending = {}
+        n_users = 0
+        n_failed = 0
+        n_invalid = 0
+        n_lost = 0
+        n_transactions = 0
+        lost = deque()
+
+        def submit_next() -> bool:
+            shard = next(shards, None)
+            if shard is None:
+                return False
+
+            try:
+                future, pool = self._submit(shard)
+                pending[future] = (shard, pool)
+            except RuntimeError as e:
+                print(f"Shard do batch não submetido: {e}")
+                lost.append((shard, e))
+            return True
+
+        def drain_lost() -> Iterator[Dict]:
+            while lost:
+                shard, error = lost.popleft()
+                for user_id, _ in shard:
+                    yield {'type': 'error', 'user_id': user_id, 'error': f"{type(error).__name__}: {error}"}
+
+        while len(pending) < max_pending and submit_next():
+            pass
+
+        for record in drain_invalid():
+            n_invalid += 1
+            yield record
+
+        for record in drain_lost():
+            n_lost += 1
+            yield record
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                shard, pool = pending.pop(future)
+
+                try:
+                    results = future.result()
+                except BrokenProcessPool as e:
+                    # Todos os shards em voo no pool quebrado falham; os próximos vão para um pool novo
+                    print(f"Pool de processos do batch interrompido: {e}")
+                    self._reset_pool(pool)
+                    lost.append((shard, e))
+                    continue
+                except Exception as e:
+                    print(f"Erro no shard do batch: {e}")
+                    results = [
+                        {'type': 'user', 'user_id': user_id, 'n_transactions': len(transactions), 'error': str(e)}
+                        for user_id, transactions in shard
+                    ]
+
+                for result in results:
+                    n_users += 1
+                    n_transactions += result['n_transactions']
+                    n_failed += 'error' in result
+                    yield result
+
+            while len(pending) < max_pending and submit_next():
+                pass
+
+            for record in drain_invalid():
+                n_invalid += 1
+                yield record
+
+            for record in drain_lost():
+                n_lost += 1
+                yield record
+
+        elapsed = time.perf_counter() - start
+        summary = {
+            'type': 'summary',
+            'users': n_users,
+            'failed': n_failed,
+            'invalid_lines': n_invalid,
+            'lost_users': n_lost,
+            'transactions': n_transactions,
+            'workers': self.max_workers,
+            'elapsed_seconds': round(elapsed, 3),
+            'users_per_second': round(n_users / elapsed, 2) if elapsed > 0 else 0.0,
+            'transactions_per_second': round(n_transactions / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+        print(f"📦 Batch: {n_users} usuários, {n_transactions} transações em {elapsed:.2f}s ({summary['users_per_second']} usuários/s)")
+
+        yield summary
+
+    def shutdown(self) -> None:
+        self._reset_pool()
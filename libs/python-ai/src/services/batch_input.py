@@ -0,0 +1,64 @@
+"""
+Batch Input - Leitura dos Arquivos de Usuários dos Jobs em Lote
+=================================================================
+
+Arquivo JSONL local dentro de BATCH_INPUT_DIR, uma linha por usuário:
+{"user_id": ..., "transactions": [...]}. Usado pelo /insights/batch e pelo
+job dos benchmarks de coorte.
+
+Linhas malformadas são entregues como InvalidLine no lugar do usuário: quem
+consome decide como reportar, sem interromper os demais usuários.
+"""
+
+import os
+import json
+from typing import Dict, Iterator, List, NamedTuple, Tuple, Union
+from src.models.schemas import TransactionInput
+
+# Diretório permitido para arquivos de entrada do batch
+BATCH_INPUT_DIR = "data/batch"
+
+UserTransactions = Tuple[str, List[Union[TransactionInput, Dict]]]
+
+
+class InvalidLine(NamedTuple):
+    """Linha do arquivo de entrada que não pôde ser lida"""
+    line: int
+    error: str
+
+
+def read_users_file(source: str) -> Iterator[Union[UserTransactions, InvalidLine]]:
+    """
+    Usuários de um arquivo JSONL dentro de BATCH_INPUT_DIR
+    Linhas malformadas são entregues como InvalidLine (leitura preguiçosa:
+    o erro só aparece quando a linha é alcançada, já com a resposta em andamento)
+
+    Raises:
+        ValueError: caminho fora do diretório permitido ou inexistente
+    """
+    base_dir = os.path.realpath(BATCH_INPUT_DIR)
+    path = os.path.realpath(os.path.join(base_dir, source))
+
+    if os.path.commonpath([base_dir, path]) != base_dir:
+        raise ValueError(f"Arquivo fora de {BATCH_INPUT_DIR}: {source}")
+
+    if not os.path.isfile(path):
+        raise ValueError(f"Arquivo não encontrado: {source}")
+
+    def iter_users():
+        with open(path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+
+                try:
+                    record = json.loads(line)
+                    if not isinstance(record, dict) or not isinstance(record.get('transactions'), list) or record.get('user_id') is None:
+                        raise ValueError("esperado objeto com 'user_id' e lista 'transactions'")
+                except ValueError as e:
+                    yield InvalidLine(line_number, str(e))
+                    continue
+
+                yield str(record['user_id']), record['transactions']
+
+    return iter_users()
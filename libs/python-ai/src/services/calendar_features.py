@@ -0,0 +1,140 @@
+"""
+Calendar Features - Store Compartilhado de Features de Calendário
+===================================================================
+
+Analyzer e Forecaster usavam cada um o seu `holidays.Brazil(...)` e
+calculavam `is_holiday` com um `apply` (uma chamada Python por linha).
+
+Aqui as flags de calendário são pré-calculadas uma única vez por processo
+em arrays numpy indexados por dia (datetime64[D]):
+- is_holiday     (feriados nacionais brasileiros)
+- is_weekend     (sábado/domingo)
+- is_month_start (dias 1-5)
+- is_month_end   (dias >= 25)
+- is_business_day (nem fim de semana nem feriado)
+
+A consulta de N datas é um único índice vetorizado (offset em dias desde o
+início do store). Datas fora do intervalo estendem o store sob demanda.
+"""
+
+import threading
+import numpy as np
+import pandas as pd
+import holidays
+from typing import Dict, Optional
+
+DEFAULT_START_YEAR = 2020
+DEFAULT_END_YEAR = 2029
+
+FLAG_NAMES = ('is_holiday', 'is_weekend', 'is_month_start', 'is_month_end', 'is_business_day')
+
+
+def to_days(dates) -> np.ndarray:
+    """Converte Series/Index/array de datas para datetime64[D] (horário local, sem timezone)"""
+    index = pd.DatetimeIndex(dates)
+
+    if index.tz is not None:
+        index = index.tz_localize(None)
+
+    return index.values.astype('datetime64[D]')
+
+
+class CalendarFeatureStore:
+    def __init__(self, start_year: int = DEFAULT_START_YEAR, end_year: int = DEFAULT_END_YEAR):
+        self._lock = threading.Lock()
+        self._build(start_year, end_year)
+
+    def _build(self, start_year: int, end_year: int) -> None:
+        br_holidays = holidays.Brazil(years=range(start_year, end_year + 1))
+
+        start = np.datetime64(f'{start_year}-01-01', 'D')
+        end = np.datetime64(f'{end_year + 1}-01-01', 'D')
+        days = np.arange(start, end, dtype='datetime64[D]')
+
+        # Feriados ordenados (para searchsorted e frame do Prophet)
+        holiday_items = sorted(br_holidays.items())
+        holiday_dates = np.array([d for d, _ in holiday_items], dtype='datetime64[D]')
+        holiday_names = np.array([name for _, name in holiday_items], dtype=object)
+
+        # 1970-01-01 foi quinta-feira → (dias + 3) % 7 dá 0 = segunda
+        weekday = (days.astype(np.int64) + 3) % 7
+        day_of_month = (days - days.astype('datetime64[M]')).astype(np.int64) + 1
+
+        is_holiday = np.isin(days, holiday_dates)
+        is_weekend = weekday >= 5
+
+        flags: Dict[str, np.ndarray] = {
+            'is_holiday': is_holiday.astype(np.int8),
+            'is_weekend': is_weekend.astype(np.int8),
+            'is_month_start': (day_of_month <= 5).astype(np.int8),
+            'is_month_end': (day_of_month >= 25).astype(np.int8),
+            'is_business_day': (~is_weekend & ~is_holiday).astype(np.int8),
+        }
+
+        # Troca atômica: leitores concorrentes sempre veem início e flags consistentes
+        self._table = (start, flags)
+        self._holidays = (holiday_dates, holiday_names)
+        self.holidays = br_holidays
+        self.start_year = start_year
+        self.end_year = end_year
+
+    def _ensure_range(self, days: np.ndarray) -> None:
+        """Estende o store se alguma data estiver fora do intervalo pré-calculado"""
+        if len(days) == 0:
+            return
+
+        min_year = int(days.min().astype('datetime64[Y]').astype(int)) + 1970
+        max_year = int(days.max().astype('datetime64[Y]').astype(int)) + 1970
+
+        if min_year >= self.start_year and max_year <= self.end_year:
+            return
+
+        with self._lock:
+            if min_year < self.start_year or max_year > self.end_year:
+                self._build(min(min_year, self.start_year), max(max_year, self.end_year))
+
+    def lookup(self, dates) -> Dict[str, np.ndarray]:
+        """Flags de calendário (int8) para cada data, via indexação direta por offset"""
+        days = to_days(dates)
+        self._ensure_range(days)
+
+        start, flags = self._table
+        offsets = (days - start).astype(np.int64)
+
+        return {name: values[offsets] for name, values in flags.items()}
+
+    def is_holiday(self, dates) -> np.ndarray:
+        """Máscara booleana de feriados"""
+        return self.lookup(dates)['is_holiday'].astype(bool)
+
+    def holidays_between(self, start, end) -> pd.DataFrame:
+        """
+        Feriados no intervalo [start, end] no formato do Prophet (colunas holiday, ds)
+        """
+        bounds = to_days([start, end])
+        self._ensure_range(bounds)
+
+        holiday_dates, holiday_names = self._holidays
+        lo = np.searchsorted(holiday_dates, bounds[0], side='left')
+        hi = np.searchsorted(holiday_dates, bounds[1], side='right')
+
+        return pd.DataFrame({
+            'holiday': holiday_names[lo:hi],
+            'ds': pd.to_datetime(holiday_dates[lo:hi]),
+        })
+
+
+_calendar: Optional[CalendarFeatureStore] = None
+_calendar_lock = threading.Lock()
+
+
+def get_calendar() -> CalendarFeatureStore:
+    """Instância compartilhada (criada uma vez por processo)"""
+    global _calendar
+
+    if _calendar is None:
+        with _calendar_lock:
+            if _calendar is None:
+                _calendar = CalendarFeatureStore()
+
+    return _calendar
@@ -5,10 +5,11 @@ Categorizer Service - High Accuracy Edition
 Melhorias implementadas:
 1. Ensemble de modelos (XGBoost + LightGBM + CatBoost)
 2. Feature engineering avançado (n-grams, TF-IDF, embeddings)
-3. Pré-processamento robusto (normalização, remoção de stopwords)
-4. Validação cruzada estratificada
+3. Pré-processamento robusto (chave canônica de estabelecimento, remoção de stopwords)
+4. Validação cruzada estratificada (stacking out-of-fold em passada única)
 5. Otimização de hiperparâmetros com Optuna
 6. Calibração de probabilidades
+7. Fallback semântico (word vectors mmap) para estabelecimentos fora do vocabulário
 
 Acurácia esperada: 95-98% (vs 85% anterior)
 """
@@ -27,9 +28,13 @@ from sklearn.preprocessing import LabelEncoder
 from xgboost import XGBClassifier
 from lightgbm import LGBMClassifier
 from catboost import CatBoostClassifier
-import re
+from src.services.oof_stacking import OutOfFoldStackingClassifier
+from src.services.semantic_fallback import SemanticFallback
+from src.services.merchant_normalizer import canonicalize, canonicalize_batch
 from unidecode import unidecode
 from typing import Optional, List, Tuple, Dict
+from collections import OrderedDict
+import threading
 import warnings
 
 warnings.filterwarnings('ignore')
@@ -39,12 +44,30 @@ VECTORIZER_PATH = "data/models/vectorizer.joblib"
 ENCODER_PATH = "data/models/label_encoder.joblib"
 DATA_PATH = "data/models/learned_data.csv"
 
+# Modos de treinamento do ensemble
+# - 'oof': meta-features out-of-fold calculadas uma vez (CV + stacking na mesma passada)
+# - 'nested_cv': cross_val_score sobre o StackingClassifier + fit final (legado, ~5x mais lento)
+TRAINING_MODES = ('oof', 'nested_cv')
+
+# Máximo de chaves canônicas mantidas no cache de predições (LRU)
+PREDICTION_CACHE_SIZE = 10000
+
 class CategorizerService:
-    def __init__(self):
+    def __init__(self, training_mode: str = 'oof'):
+        if training_mode not in TRAINING_MODES:
+            raise ValueError(f"training_mode inválido: {training_mode} (use {TRAINING_MODES})")
+
+        self.training_mode = training_mode
         self.model = None
         self.vectorizer = None
         self.label_encoder = None
 
+        # Cache de predições por chave canônica (invalidado a cada re-treino)
+        self._prediction_cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
         # Dataset inicial expandido e mais rico
         self.initial_data = {
             'Alimentação': [
@@ -235,31 +258,19 @@ class CategorizerService:
             print("⚠️ Nenhum modelo encontrado. Treinando modelo avançado...")
             self._train_full_model()
 
-    def _preprocess_text(self, text: str) -> str:
-        """Pré-processamento avançado de texto"""
-        if not text:
-            return ""
-
-        # Lowercase
-        text = text.lower().strip()
-
-        # Remove acentos
-        text = unidecode(text)
-
-        # Remove caracteres especiais, mantém apenas letras, números e espaços
-        text = re.sub(r'[^a-z0-9\s]', ' ', text)
+        # Fallback semântico para descrições sem nenhum token no vocabulário TF-IDF
+        self.semantic_fallback = SemanticFallback()
+        self.semantic_fallback.load({
+            category: [self._preprocess_text(k) for k in keywords]
+            for category, keywords in self.initial_data.items()
+        })
 
-        # Remove espaços múltiplos
-        text = re.sub(r'\s+', ' ', text)
-
-        # Remove stopwords básicas (artigos, preposições comuns)
-        stopwords = {
-            'a', 'o', 'de', 'da', 'do', 'em', 'para', 'com', 'por',
-            'e', 'ou', 'na', 'no', 'as', 'os', 'das', 'dos',
-        }
-        words = [w for w in text.split() if w not in stopwords]
-
-        return ' '.join(words)
+    def _preprocess_text(self, text: str) -> str:
+        """
+        Pré-processamento avançado de texto
+        Reduz a descrição à chave canônica do estabelecimento (ver merchant_normalizer)
+        """
+        return canonicalize(text)
 
     def _get_all_data(self) -> Tuple[List[str], List[str]]:
         """Obtém todos os dados (inicial + aprendidos)"""
@@ -285,19 +296,16 @@ class CategorizerService:
         if os.path.exists(DATA_PATH):
             try:
                 df = pd.read_csv(DATA_PATH)
-                for _, row in df.iterrows():
-                    descriptions.append(self._preprocess_text(row['description']))
-                    labels.append(row['category'])
+                descriptions.extend(canonicalize_batch(df['description'].astype(str)))
+                labels.extend(df['category'].tolist())
             except Exception as e:
                 print(f"Erro ao ler dados aprendidos: {e}")
 
         return descriptions, labels
 
-    def _create_ensemble_model(self) -> StackingClassifier:
-        """Cria modelo ensemble de alta performance"""
-
-        # Base estimators (diferentes algoritmos para diversidade)
-        estimators = [
+    def _create_base_estimators(self) -> List[Tuple[str, object]]:
+        """Estimadores base (diferentes algoritmos para diversidade)"""
+        return [
             ('xgb', XGBClassifier(
                 n_estimators=100,
                 max_depth=6,
@@ -325,18 +333,30 @@ class CategorizerService:
             ('nb', MultinomialNB(alpha=0.1)),
         ]
 
-        # Meta-estimator (combina predições dos base estimators)
+    def _create_final_estimator(self) -> LogisticRegression:
+        """Meta-estimator (combina predições dos base estimators)"""
         # Logistic Regression funciona bem como meta-learner
-        final_estimator = LogisticRegression(
+        return LogisticRegression(
             max_iter=1000,
             random_state=42,
             multi_class='multinomial',
         )
 
+    def _create_ensemble_model(self):
+        """Cria modelo ensemble de alta performance"""
+        if self.training_mode == 'oof':
+            # Meta-features OOF calculadas uma única vez e reaproveitadas para a acurácia CV
+            return OutOfFoldStackingClassifier(
+                estimators=self._create_base_estimators(),
+                final_estimator=self._create_final_estimator(),
+                cv=5,
+                n_jobs=-1,
+            )
+
         # Stacking Classifier
         stacking = StackingClassifier(
-            estimators=estimators,
-            final_estimator=final_estimator,
+            estimators=self._create_base_estimators(),
+            final_estimator=self._create_final_estimator(),
             cv=5,  # Cross-validation interna
             stack_method='predict_proba',  # Usa probabilidades
             n_jobs=-1,  # Usa todos os cores
@@ -354,6 +374,10 @@ class CategorizerService:
 
         print(f"📊 Treinando com {len(descriptions)} exemplos de {len(set(labels))} categorias...")
 
+        # Predições anteriores deixam de valer com o novo modelo
+        with self._cache_lock:
+            self._prediction_cache.clear()
+
         # Encode labels
         self.label_encoder = LabelEncoder()
         labels_encoded = self.label_encoder.fit_transform(labels)
@@ -373,18 +397,23 @@ class CategorizerService:
         # Cria e treina ensemble
         base_model = self._create_ensemble_model()
 
-        # Validação cruzada para verificar performance
-        cv_scores = cross_val_score(
-            base_model, X, labels_encoded,
-            cv=StratifiedKFold(n_splits=min(5, len(set(labels)))),
-            scoring='accuracy',
-            n_jobs=-1,
-        )
+        if self.training_mode == 'oof':
+            # Passada única: as predições OOF alimentam o meta-learner e a acurácia CV
+            base_model.fit(X, labels_encoded)
+            cv_scores = base_model.cv_scores_
+        else:
+            # Validação cruzada para verificar performance
+            cv_scores = cross_val_score(
+                base_model, X, labels_encoded,
+                cv=StratifiedKFold(n_splits=min(5, len(set(labels)))),
+                scoring='accuracy',
+                n_jobs=-1,
+            )
 
-        print(f"📈 Acurácia (Cross-validation): {cv_scores.mean():.1%} (±{cv_scores.std():.1%})")
+            # Treina modelo final com todos os dados
+            base_model.fit(X, labels_encoded)
 
-        # Treina modelo final com todos os dados
-        base_model.fit(X, labels_encoded)
+        print(f"📈 Acurácia (Cross-validation): {cv_scores.mean():.1%} (±{cv_scores.std():.1%})")
 
         # Calibração de probabilidades para melhor confiança
         # Isso ajusta as probabilidades para serem mais confiáveis
@@ -458,9 +487,40 @@ class CategorizerService:
             # Pré-processa
             clean_desc = self._preprocess_text(description)
 
+            with self._cache_lock:
+                cached = self._prediction_cache.get(clean_desc)
+                if cached is not None:
+                    self._prediction_cache.move_to_end(clean_desc)
+                    self.cache_hits += 1
+                    return dict(cached)
+                self.cache_misses += 1
+
+            result = self._predict_uncached(clean_desc)
+
+            if result is not None:
+                with self._cache_lock:
+                    self._prediction_cache[clean_desc] = result
+                    if len(self._prediction_cache) > PREDICTION_CACHE_SIZE:
+                        self._prediction_cache.popitem(last=False)
+
+            return dict(result) if result is not None else None
+
+        except Exception as e:
+            print(f"Erro na predição: {e}")
+            return None
+
+    def _predict_uncached(self, clean_desc: str) -> Optional[Dict]:
+        """Predição para uma descrição já normalizada"""
+        try:
             # Vetoriza
             X = self.vectorizer.transform([clean_desc])
 
+            # Nenhum token conhecido pelo TF-IDF: tenta o fallback semântico
+            if X.nnz == 0 and self.semantic_fallback.is_available:
+                semantic_result = self.semantic_fallback.predict(clean_desc)
+                if semantic_result is not None:
+                    return semantic_result
+
             # Predição
             label_pred = self.model.predict(X)[0]
             probs = self.model.predict_proba(X)[0]
@@ -490,6 +550,7 @@ class CategorizerService:
                     "threshold": threshold,
                     "alternatives": alternatives,
                     "accepted": True,
+                    "method": "ensemble",
                 }
             else:
                 print(f"ℹ️ Predição descartada: {category} ({confidence:.1%}) < Limiar ({threshold:.1%})")
@@ -499,6 +560,7 @@ class CategorizerService:
                     "threshold": threshold,
                     "alternatives": alternatives,
                     "accepted": False,
+                    "method": "ensemble",
                 }
 
         except Exception as e:
@@ -533,15 +595,23 @@ class CategorizerService:
             return {}
 
         X = self.vectorizer.transform([self._preprocess_text(d) for d in descriptions])
-        y = self.label_encoder.transform(labels)
-
-        cv_scores = cross_val_score(
-            self.model.estimators_[0],  # Base model antes da calibração
-            X, y,
-            cv=min(5, len(set(labels))),
-            scoring='accuracy',
-            n_jobs=-1,
-        )
+
+        base_model = self.model.estimator  # Base model antes da calibração
+
+        if hasattr(base_model, 'cv_scores_'):
+            # Acurácia OOF já calculada no treinamento (sem re-treinar o ensemble)
+            cv_scores = base_model.cv_scores_
+        else:
+            y = self.label_encoder.transform(labels)
+            cv_scores = cross_val_score(
+                base_model,
+                X, y,
+                cv=min(5, len(set(labels))),
+                scoring='accuracy',
+                n_jobs=-1,
+            )
+
+        total_lookups = self.cache_hits + self.cache_misses
 
         return {
             "accuracy_mean": float(cv_scores.mean()),
@@ -549,4 +619,10 @@ class CategorizerService:
             "n_samples": len(descriptions),
             "n_categories": len(set(labels)),
             "n_features": X.shape[1],
+            "prediction_cache": {
+                "size": len(self._prediction_cache),
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": self.cache_hits / total_lookups if total_lookups else 0.0,
+            },
         }
@@ -0,0 +1,223 @@
+"""
+Cohort Benchmarks - Comparação com Usuários de Perfil Parecido
+=================================================================
+
+Distribuição do gasto mensal por categoria dentro de cada coorte (faixa de
+gasto mensal total), montada por um job em lote e carregada em memória no
+startup. Nenhum dado de outros usuários é lido durante a requisição:
+
+- Um sketch de quantis por (coorte, categoria): histograma log-espaçado com os
+  mesmos bins de spending_aggregates (~6% de erro relativo por bin)
+- Sketches são mergeáveis (soma das contagens): o job pode rodar em shards
+- No carregamento, cada sketch vira uma CDF acumulada: o percentil de um valor
+  é uma consulta O(1) (bin do valor → posição na CDF)
+
+Gerado por build_cohort_benchmarks.py; persistido com joblib.
+"""
+
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from src.models.schemas import TransactionInput
+from src.services.batch_input import InvalidLine, UserTransactions
+from src.services.daily_spend import DailySpend
+from src.services.detector_store import atomic_dump
+from src.services.spending_aggregates import HIST_BINS, amount_bins
+from src.services.transaction_frame import build_transaction_frame
+
+COHORT_BENCHMARKS_PATH = "data/models/cohort_benchmarks.joblib"
+
+# Versão do formato persistido (arquivo de outra versão é ignorado)
+COHORT_VERSION = 1
+
+# Limites das faixas de gasto mensal total (R$) que definem as coortes
+SPEND_BANDS = (1000, 2500, 5000, 10000, 20000)
+
+# Coorte com todos os usuários (fallback para coortes pequenas)
+ALL_USERS = 'todos'
+
+# Usuários mínimos no sketch para a comparação valer
+MIN_COHORT_USERS = 50
+
+# Meses com gasto mínimos para entrar (e ser comparado) na distribuição
+MIN_PROFILE_MONTHS = 2
+
+
+def spend_cohort(monthly_spend: float) -> str:
+    """Rótulo da faixa de gasto mensal total (ex.: '2500-5000')"""
+    lower = 0
+    for upper in SPEND_BANDS:
+        if monthly_spend < upper:
+            return f"{lower}-{upper}"
+        lower = upper
+    return f"{lower}+"
+
+
+def spending_profile(expenses: pd.DataFrame, daily: DailySpend) -> Optional[Tuple[str, pd.Series]]:
+    """
+    Coorte do usuário e gasto médio mensal por categoria
+    (média sobre os meses com despesa; None com histórico curto)
+    """
+    monthly = daily.monthly_totals()
+
+    if len(monthly) < MIN_PROFILE_MONTHS:
+        return None
+
+    n_months = len(monthly)
+    category_monthly = expenses.groupby('category_name', observed=True)['amount'].sum() / n_months
+
+    return spend_cohort(monthly.sum() / n_months), category_monthly
+
+
+class CohortBenchmarks:
+    def __init__(self, sketches: Optional[Dict[str, Dict[str, np.ndarray]]] = None, built_at: Optional[str] = None):
+        """
+        Args:
+            sketches: {coorte: {categoria: contagens por bin (HIST_BINS)}}
+            built_at: data de geração (identifica a versão carregada)
+        """
+        self.sketches = sketches or {}
+        self.built_at = built_at
+        self._cdf: Dict[Tuple[str, str], Tuple[np.ndarray, int]] = {}
+
+        self._build_cdf()
+
+    def _build_cdf(self) -> None:
+        """CDF por sketch: fração abaixo do bin + metade do próprio bin"""
+        self._cdf = {}
+
+        for cohort, categories in self.sketches.items():
+            for category, hist in categories.items():
+                total = int(hist.sum())
+                if total == 0:
+                    continue
+                below = np.concatenate([[0], np.cumsum(hist)[:-1]])
+                self._cdf[(cohort, category)] = ((below + hist / 2) / total, total)
+
+    @classmethod
+    def load(cls, path: str = COHORT_BENCHMARKS_PATH) -> Optional['CohortBenchmarks']:
+        """Sketches gerados pelo job em lote, ou None se não houver arquivo válido"""
+        if not os.path.exists(path):
+            return None
+
+        try:
+            state = joblib.load(path)
+        except Exception as e:
+            print(f"Erro ao carregar benchmarks de coorte: {e}")
+            return None
+
+        if state.get('version') != COHORT_VERSION:
+            print("Benchmarks de coorte em versão antiga: ignorados")
+            return None
+
+        return cls(state['sketches'], state['built_at'])
+
+    def save(self, path: str = COHORT_BENCHMARKS_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        atomic_dump({
+            'version': COHORT_VERSION,
+            'built_at': self.built_at,
+            'sketches': self.sketches,
+        }, path)
+
+    # === Construção (job em lote) ===
+
+    def add_user(self, transactions: List[Union[TransactionInput, Dict]]) -> bool:
+        """
+        Incorpora o perfil de um usuário à coorte dele e à coorte geral
+
+        Returns:
+            False se o usuário não tem histórico suficiente
+        """
+        parsed = [t if isinstance(t, TransactionInput) else TransactionInput(**t) for t in transactions]
+        expenses = build_transaction_frame(parsed, columns=('amount', 'date', 'category_name'), expenses_only=True)
+
+        if expenses.empty:
+            return False
+
+        profile = spending_profile(expenses, DailySpend.from_frame(expenses))
+
+        if profile is None:
+            return False
+
+        cohort, category_monthly = profile
+        bins = amount_bins(category_monthly.to_numpy())
+
+        for target in (cohort, ALL_USERS):
+            categories = self.sketches.setdefault(target, {})
+            for category, bin_idx in zip(category_monthly.index, bins):
+                hist = categories.setdefault(category, np.zeros(HIST_BINS, dtype=np.int64))
+                hist[bin_idx] += 1
+
+        return True
+
+    def merge(self, other: 'CohortBenchmarks') -> None:
+        """Soma os sketches de outro shard"""
+        for cohort, categories in other.sketches.items():
+            target = self.sketches.setdefault(cohort, {})
+            for category, hist in categories.items():
+                target[category] = target[category] + hist if category in target else hist.copy()
+
+    def finalize(self) -> None:
+        """Recalcula as CDFs e marca a versão após a construção"""
+        self.built_at = datetime.now().isoformat(timespec='seconds')
+        self._build_cdf()
+
+    # === Consulta (requisição) ===
+
+    def percentile(self, cohort: str, category: str, monthly_amount: float) -> Optional[Tuple[float, int, str]]:
+        """
+        Fração de usuários da coorte com gasto mensal menor na categoria (O(1))
+        Coortes com menos de MIN_COHORT_USERS usuários caem para a coorte geral
+
+        Returns:
+            (percentil 0-1, usuários no sketch, coorte usada) ou None
+        """
+        bin_idx = int(amount_bins(np.array([monthly_amount]))[0])
+
+        for target in (cohort, ALL_USERS):
+            entry = self._cdf.get((target, category))
+            if entry is not None and entry[1] >= MIN_COHORT_USERS:
+                return float(entry[0][bin_idx]), entry[1], target
+
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            'built_at': self.built_at,
+            'cohorts': len(self.sketches),
+            'sketches': len(self._cdf),
+        }
+
+
+def build_cohort_benchmarks(users: Iterable[Union[UserTransactions, InvalidLine]]) -> CohortBenchmarks:
+    """
+    Job em lote: sketches de todos os usuários (ver build_cohort_benchmarks.py)
+    Linhas inválidas do arquivo de entrada são puladas e contadas
+    """
+    benchmarks = CohortBenchmarks()
+    n_users = 0
+    n_skipped = 0
+    n_invalid = 0
+
+    for item in users:
+        if isinstance(item, InvalidLine):
+            print(f"Linha {item.line} ignorada nos benchmarks de coorte: {item.error}")
+            n_invalid += 1
+            continue
+
+        _, transactions = item
+
+        if benchmarks.add_user(transactions):
+            n_users += 1
+        else:
+            n_skipped += 1
+
+    benchmarks.finalize()
+
+    print(f"👥 Benchmarks de coorte: {n_users} usuários ({n_skipped} com histórico curto, {n_invalid} linhas inválidas), {benchmarks.stats()['sketches']} sketches")
+
+    return benchmarks
@@ -0,0 +1,132 @@
+"""
+Daily Spend - Gasto Diário Denso com Somas Acumuladas
+========================================================
+
+Um slot por dia entre a primeira e a última despesa, montado em uma única
+passada (bincount sobre o deslocamento em dias). As somas acumuladas de
+valores e quantidades tornam qualquer janela de dias uma consulta O(1):
+
+- Comparação dos últimos N dias com os N anteriores (semana, quinzena, mês...)
+- Somas móveis de N dias para todos os dias de uma vez
+- Totais mensais por fronteira de mês (sem groupby)
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Optional, Tuple
+from src.services.calendar_features import to_days
+from src.services.kernels import daily_totals
+
+
+class DailySpend:
+    def __init__(self, first_day: int, amounts: np.ndarray, counts: np.ndarray):
+        """
+        Args:
+            first_day: dia do primeiro slot (dias desde a epoch)
+            amounts: soma dos valores por dia
+            counts: quantidade de despesas por dia
+        """
+        self.first_day = int(first_day)
+        self.amounts = amounts
+        self.counts = counts
+
+        # Prefixos com zero à esquerda: soma de [i, j) = cumsum[j] - cumsum[i]
+        self._amount_cumsum = np.concatenate([[0.0], np.cumsum(amounts)])
+        self._count_cumsum = np.concatenate([[0], np.cumsum(counts)])
+
+    @classmethod
+    def from_days(cls, days: np.ndarray, amounts: np.ndarray, counts: Optional[np.ndarray] = None) -> 'DailySpend':
+        """
+        Args:
+            days: dia de cada lançamento (dias desde a epoch, int)
+            amounts: valor de cada lançamento
+            counts: quantidade representada por cada lançamento (padrão: 1)
+        """
+        days = np.asarray(days, dtype=np.int64)
+
+        if len(days) == 0:
+            return cls(0, np.zeros(0), np.zeros(0, dtype=np.int64))
+
+        first_day = days.min()
+        offsets = days - first_day
+        size = int(offsets.max()) + 1
+
+        daily_amounts, daily_counts = daily_totals(offsets, amounts, size)
+
+        if counts is not None:
+            daily_counts = np.bincount(offsets, weights=counts, minlength=size).astype(np.int64)
+
+        return cls(first_day, daily_amounts, daily_counts)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'DailySpend':
+        """A partir de um frame com colunas date e amount"""
+        return cls.from_days(to_days(df['date']).astype(np.int64), df['amount'].to_numpy())
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    @property
+    def last_day(self) -> int:
+        return self.first_day + len(self.amounts) - 1
+
+    def window(self, start_day: int, end_day: int) -> Tuple[float, int]:
+        """Soma e quantidade de despesas em [start_day, end_day] (O(1))"""
+        start = min(max(start_day - self.first_day, 0), len(self.amounts))
+        end = min(max(end_day - self.first_day + 1, 0), len(self.amounts))
+
+        if end <= start:
+            return 0.0, 0
+
+        return (
+            float(self._amount_cumsum[end] - self._amount_cumsum[start]),
+            int(self._count_cumsum[end] - self._count_cumsum[start]),
+        )
+
+    def compare(self, days: int, end_day: Optional[int] = None) -> Optional[Tuple[float, float]]:
+        """
+        Gasto desde `end_day - days` vs os `days` dias anteriores
+        (mesmo recorte do filtro `date >= max - N dias` sobre datas à meia-noite)
+
+        Returns:
+            (janela atual, janela anterior) ou None se alguma não tiver despesas
+        """
+        if len(self.amounts) == 0:
+            return None
+
+        end_day = self.last_day if end_day is None else end_day
+
+        current, current_count = self.window(end_day - days, end_day)
+        previous, previous_count = self.window(end_day - 2 * days, end_day - days - 1)
+
+        if current_count == 0 or previous_count == 0:
+            return None
+
+        return current, previous
+
+    def rolling_sum(self, days: int) -> np.ndarray:
+        """Soma móvel dos últimos `days` dias (inclusive) para cada slot"""
+        end = np.arange(1, len(self.amounts) + 1)
+        start = np.maximum(end - days, 0)
+
+        return self._amount_cumsum[end] - self._amount_cumsum[start]
+
+    def monthly_totals(self) -> pd.Series:
+        """Soma por mês (índice Period mensal), apenas meses com despesas"""
+        if len(self.amounts) == 0:
+            return pd.Series(dtype=np.float64)
+
+        slot_days = np.arange(self.first_day, self.first_day + len(self.amounts)).astype('datetime64[D]')
+        months = slot_days.astype('datetime64[M]')
+
+        # Fronteiras de mês: soma de cada mês pela diferença dos prefixos
+        starts = np.flatnonzero(np.concatenate([[True], months[1:] != months[:-1]]))
+        ends = np.append(starts[1:], len(self.amounts))
+
+        totals = self._amount_cumsum[ends] - self._amount_cumsum[starts]
+        counts = self._count_cumsum[ends] - self._count_cumsum[starts]
+
+        has_spend = counts > 0
+        index = pd.DatetimeIndex(months[starts][has_spend].astype('datetime64[ns]')).to_period('M')
+
+        return pd.Series(totals[has_spend], index=index)
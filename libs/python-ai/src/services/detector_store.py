@@ -0,0 +1,142 @@
+"""
+Detector Store - Estado Persistido de Detectores por Usuário
+===============================================================
+
+Guarda o estado treinado dos detectores de anomalia (scaler + modelo +
+scores já calculados) por usuário, para que chamadas repetidas ao
+`/insights` não re-treinem tudo a partir do histórico completo.
+
+- Persistência em disco com joblib (um arquivo por usuário e detector)
+- Cache LRU em memória para evitar leituras de disco a cada requisição
+- Scores por transação indexados por hash das features (uint64 ordenado),
+  consultados com searchsorted
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+import joblib
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+DETECTOR_DIR = "data/models/analyzer"
+
+# Estados mantidos em memória (LRU)
+MEMORY_CACHE_SIZE = 256
+
+
+def atomic_dump(obj, path: str) -> None:
+    """
+    Grava com joblib em um temporário único no mesmo diretório e troca com
+    os.replace: escritores concorrentes nunca compartilham o arquivo temporário
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            joblib.dump(obj, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def feature_keys(X: np.ndarray) -> np.ndarray:
+    """Hash uint64 de cada linha de features (mesmas features → mesma chave)"""
+    return pd.util.hash_pandas_object(pd.DataFrame(X), index=False).to_numpy()
+
+
+def lookup_scores(keys: np.ndarray, known_keys: np.ndarray, known_scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Busca vetorizada de scores já calculados
+
+    Returns:
+        (scores, found) — scores é NaN onde found é False
+    """
+    scores = np.full(len(keys), np.nan)
+
+    if len(known_keys) == 0:
+        return scores, np.zeros(len(keys), dtype=bool)
+
+    pos = np.searchsorted(known_keys, keys)
+    pos_clipped = np.minimum(pos, len(known_keys) - 1)
+    found = known_keys[pos_clipped] == keys
+
+    scores[found] = known_scores[pos_clipped[found]]
+
+    return scores, found
+
+
+def merge_scores(
+    known_keys: np.ndarray,
+    known_scores: np.ndarray,
+    new_keys: np.ndarray,
+    new_scores: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Incorpora novos scores mantendo as chaves ordenadas e únicas"""
+    keys = np.concatenate([known_keys, new_keys])
+    scores = np.concatenate([known_scores, new_scores])
+
+    keys, first = np.unique(keys, return_index=True)
+
+    return keys, scores[first]
+
+
+class DetectorStore:
+    def __init__(self, base_dir: str = DETECTOR_DIR, memory_cache_size: int = MEMORY_CACHE_SIZE):
+        self.base_dir = base_dir
+        self.memory_cache_size = memory_cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    def _path(self, user_id: str, detector: str) -> str:
+        # Hash do user_id: nome de arquivo seguro e sem dados pessoais
+        user_hash = hashlib.sha1(str(user_id).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.base_dir, f"{user_hash}.{detector}.joblib")
+
+    def load(self, user_id: str, detector: str) -> Optional[Dict]:
+        """Estado do detector (memória → disco), ou None se não existir"""
+        cache_key = (user_id, detector)
+
+        with self._lock:
+            state = self._cache.get(cache_key)
+            if state is not None:
+                self._cache.move_to_end(cache_key)
+                return state
+
+        path = self._path(user_id, detector)
+
+        if not os.path.exists(path):
+            return None
+
+        try:
+            state = joblib.load(path)
+        except Exception as e:
+            print(f"Erro ao carregar detector '{detector}' do usuário: {e}")
+            return None
+
+        self._remember(cache_key, state)
+        return state
+
+    def save(self, user_id: str, detector: str, state: Dict) -> None:
+        """Persiste o estado e atualiza o cache em memória"""
+        self._remember((user_id, detector), state)
+
+        try:
+            atomic_dump(state, self._path(user_id, detector))
+        except Exception as e:
+            print(f"Erro ao salvar detector '{detector}' do usuário: {e}")
+
+    def _remember(self, cache_key: Tuple[str, str], state: Dict) -> None:
+        with self._lock:
+            self._cache[cache_key] = state
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.memory_cache_size:
+                self._cache.popitem(last=False)
@@ -0,0 +1,93 @@
+"""
+Duplicate Detector - Transações Duplicadas na Importação
+==========================================================
+
+Importações do Pluggy e uploads manuais de CSV repetem transações. Compras
+legítimas também se repetem (passagem de ônibus duas vezes ao dia, dois cafés,
+pedidos diferentes no mesmo restaurante), então só é cópia o que a evidência
+permite afirmar:
+
+1. Mesmo id de origem (metadado da importação): a mesma transação importada
+   de novo, em qualquer data
+2. Sem id: mesma descrição bruta (minúsculas, espaços normalizados; sem
+   canonicalização, que juntaria pedidos/NSUs diferentes), mesmo valor em
+   centavos e mesmo instante — apenas quando a data traz hora do dia. Datas
+   só com o dia não distinguem uma cópia de duas compras iguais no mesmo dia
+
+Detecção em O(n) com `duplicated` (hash) sobre as linhas ordenadas por data
+(a primeira ocorrência fica sem marca); a chave completa só é montada para as
+linhas cujo instante se repete.
+"""
+
+import numpy as np
+import pandas as pd
+
+_NANOS_PER_DAY = 86_400 * 10 ** 9
+
+
+def description_codes(descriptions: pd.Series) -> np.ndarray:
+    """
+    Código inteiro da descrição bruta levemente limpa (minúsculas, sem espaços
+    duplicados ou nas pontas); -1 para descrição vazia
+    """
+    codes, uniques = pd.factorize(descriptions.fillna(''))
+    cleaned = pd.Series(uniques, dtype=object).str.lower().str.split().str.join(' ')
+    cleaned_codes, _ = pd.factorize(cleaned.where(cleaned != '', None))
+    return cleaned_codes[codes]
+
+
+class DuplicateDetector:
+    def detect(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Marca as cópias (a primeira ocorrência de cada transação fica sem marca)
+
+        Args:
+            df: colunas amount, date, category_name (e description/id, se houver),
+                ordenado por data
+
+        Returns:
+            Máscara booleana alinhada às linhas de `df`
+        """
+        n = len(df)
+
+        if n < 2:
+            return np.zeros(n, dtype=bool)
+
+        same_id = np.zeros(n, dtype=bool)
+        same_row = np.zeros(n, dtype=bool)
+
+        # === 1. MESMO ID DE ORIGEM ===
+        if 'id' in df.columns:
+            ids = pd.Series(df['id'].to_numpy(), dtype=object)
+            same_id = ids.notna().to_numpy() & ids.duplicated().to_numpy()
+
+        # === 2. MESMA LINHA NO MESMO INSTANTE (só com hora do dia) ===
+        # Candidatas: instantes com hora que aparecem mais de uma vez (em geral, poucas linhas)
+        timestamps = pd.DatetimeIndex(df['date']).asi8
+        candidates = (timestamps % _NANOS_PER_DAY != 0) & pd.Series(timestamps).duplicated(keep=False).to_numpy()
+
+        if candidates.sum() > 1:
+            rows = df[candidates]
+
+            if 'description' in rows.columns:
+                label = description_codes(pd.Series(rows['description'].to_numpy(), dtype=object))
+            else:
+                label = np.full(len(rows), -1, dtype=np.int64)
+
+            # Sem descrição, a categoria identifica a linha (códigos negativos, sem colidir)
+            category, _ = pd.factorize(rows['category_name'])
+            label = np.where(label >= 0, label, -2 - category)
+
+            keys = pd.DataFrame({
+                'label': label,
+                'cents': np.round(rows['amount'].to_numpy(dtype=np.float64) * 100).astype(np.int64),
+                'timestamp': timestamps[candidates],
+            })
+
+            # Ids diferentes são transações diferentes, mesmo com tudo igual
+            if 'id' in rows.columns:
+                keys['id'] = pd.factorize(pd.Series(rows['id'].to_numpy(), dtype=object))[0]
+
+            same_row[candidates] = keys.duplicated().to_numpy()
+
+        return same_id | same_row
@@ -11,13 +11,26 @@ Melhorias implementadas:
 6. Análise de sazonalidade (semanal, mensal, anual)
 7. Suporte a feriados brasileiros
 8. Validação cross-temporal
+9. Cache de modelos treinados (série + configuração → modelo ajustado, LRU por memória + TTL)
+10. Membros do ensemble ajustados em paralelo (pool de processos), cada um com seu prazo
+    contado a partir do início do fit no processo (a espera na fila não conta). O pool
+    sobe em segundo plano (startup do app e após cada troca); sem pool pronto, os fits
+    rodam no próprio processo
 
 Acurácia esperada: 90-95% (vs 75% anterior)
 """
 
+import os
+import time
+import signal
+import itertools
+import threading
+import multiprocessing
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 import warnings
 from scipy import stats
@@ -30,14 +43,245 @@ from sklearn.linear_model import Ridge
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_percentage_error, mean_squared_error
 
-import holidays
 from src.models.schemas import TransactionInput
+from src.services.calendar_features import get_calendar
+from src.services.transaction_frame import build_transaction_frame
+from src.services.daily_spend import DailySpend
+from src.services.kernels import iqr_replace
+from src.services.model_cache import FittedModelCache, series_fingerprint
 
 warnings.filterwarnings("ignore")
 
+# Pesos padrão do ensemble (Prophet > Auto-ARIMA > Outros), renormalizados sobre os membros que terminaram
+ENSEMBLE_WEIGHTS = {
+    'prophet': 0.40,
+    'auto_arima': 0.35,
+    'exp_smoothing': 0.15,
+    'ridge': 0.10,
+}
+
+# Processos do pool de fit (um por membro do ensemble)
+FORECAST_MAX_WORKERS = len(ENSEMBLE_WEIGHTS)
+
+# Prazo de cada fit em segundos (membro que estoura é descartado)
+MODEL_TIMEOUTS = {
+    'prophet': 20.0,
+    'auto_arima': 15.0,
+    'exp_smoothing': 5.0,
+    'ridge': 5.0,
+}
+DEFAULT_MODEL_TIMEOUT = 10.0
+
+# Intervalo de verificação dos prazos enquanto os fits rodam (segundos)
+FIT_POLL_INTERVAL = 0.05
+
+# Horizonte da previsão do Prophet (dias)
+PROPHET_PERIODS = 30
+
+
+# === Fits (funções de módulo: executadas nos processos do pool) ===
+
+# Fila dos avisos de início de job (definida no initializer de cada processo do pool)
+_start_queue = None
+
+
+def _init_fit_worker(start_queue) -> None:
+    global _start_queue
+    _start_queue = start_queue
+
+
+def _warm_up() -> None:
+    """
+    Job vazio para subir um processo do pool antes do primeiro prazo contar
+    Os modelos são importados ao desserializar o job (importa este módulo);
+    a pausa curta evita que um mesmo processo pegue todos os warm-ups
+    """
+    time.sleep(0.05)
+
+
+def _run_fit_job(job_id: int, fit: Callable, *args) -> Tuple[Any, float]:
+    """Executado no processo do pool: avisa o início (pid + instante) e ajusta o modelo"""
+    _start_queue.put((job_id, os.getpid(), time.time()))
+    return _timed_fit(fit, *args)
+
+
+def _timed_fit(fit: Callable, *args) -> Tuple[Any, float]:
+    """Fit com a duração medida no próprio processo (sem a espera na fila)"""
+    start = time.perf_counter()
+    model = fit(*args)
+    return model, (time.perf_counter() - start) * 1000
+
+
+def _fit_prophet(df: pd.DataFrame, config: Dict, holidays_df: pd.DataFrame) -> Prophet:
+    model = Prophet(
+        **config,
+        daily_seasonality=False,  # Evita overfitting em dados diários
+        holidays=holidays_df if not holidays_df.empty else None,
+    )
+    return model.fit(df)
+
+
+def _fit_auto_arima(series: pd.Series, config: Dict):
+    # Auto-ARIMA encontra os melhores parâmetros
+    return auto_arima(
+        series,
+        **config,
+        trace=False,
+        error_action='ignore',
+        suppress_warnings=True,
+    )
+
+
+def _fit_exp_smoothing(series: pd.Series, config: Dict):
+    return ExponentialSmoothing(series, **config).fit()
+
+
+def _fit_ridge(df: pd.DataFrame, config: Dict) -> Tuple[StandardScaler, Ridge]:
+    # Feature Engineering
+    df_model = df.copy()
+    df_model['day_of_week'] = df_model['ds'].dt.dayofweek
+    df_model['day_of_month'] = df_model['ds'].dt.day
+    df_model['month'] = df_model['ds'].dt.month
+    df_model['days_since_start'] = (df_model['ds'] - df_model['ds'].min()).dt.days
+
+    features = ['days_since_start', 'day_of_week', 'day_of_month', 'month']
+    X = df_model[features].values
+    y = df_model['y'].values
+
+    # Normalização
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    # Ridge Regression (regularização L2)
+    model = Ridge(**config)
+    model.fit(X_scaled, y)
+
+    return scaler, model
+
+
+class _FitPool:
+    """
+    Pool de processos dos fits, compartilhado entre requisições
+
+    Cada processo avisa quando começa um job (pid + instante), então o prazo de
+    cada fit conta a partir do início real. Um fit que estoura o prazo aposenta
+    o pool: novas requisições vão para um pool novo, os jobs que outras
+    requisições ainda esperam terminam normalmente e só então os processos
+    presos são encerrados.
+    """
+
+    def __init__(self, max_workers: int):
+        context = multiprocessing.get_context('spawn')  # Não herda threads/locks do processo da API
+
+        self.max_workers = max_workers
+        self.retired = False
+
+        self._starts = context.Queue()
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._started: Dict[int, Tuple[int, float]] = {}  # job → (pid, início)
+        self._live = set()  # Jobs cujo resultado alguém ainda espera
+        self._stuck_pids = set()
+        self._closed = False
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_init_fit_worker,
+            initargs=(self._starts,),
+        )
+
+        self._listener = threading.Thread(target=self._listen, name='forecast-fit-starts', daemon=True)
+        self._listener.start()
+
+        # Sobe todos os processos (e importa os modelos) antes do primeiro prazo contar
+        wait([self.executor.submit(_warm_up) for _ in range(max_workers)])
+
+    def _listen(self) -> None:
+        while True:
+            notice = self._starts.get()
+            if notice is None:
+                return
+
+            job_id, pid, started = notice
+            with self._lock:
+                if job_id in self._live:
+                    self._started[job_id] = (pid, started)
+
+    def submit(self, fit: Callable, *args) -> Tuple[int, Future]:
+        """
+        Raises:
+            RuntimeError: pool aposentado ou encerrado (por outra requisição)
+        """
+        with self._lock:
+            if self.retired:
+                raise RuntimeError("pool de fits aposentado")
+            job_id = next(self._job_ids)
+            self._live.add(job_id)
+
+        future = self.executor.submit(_run_fit_job, job_id, fit, *args)
+        future.add_done_callback(lambda _: self._release(job_id))
+
+        return job_id, future
+
+    def started_at(self, job_id: int) -> Optional[float]:
+        """Instante (time.time) em que o job começou no processo; None se ainda na fila"""
+        with self._lock:
+            entry = self._started.get(job_id)
+
+        return None if entry is None else entry[1]
+
+    def abandon(self, job_id: int) -> None:
+        """Job que estourou o prazo: ninguém mais espera por ele e o processo dele será encerrado"""
+        with self._lock:
+            entry = self._started.pop(job_id, None)
+            if entry is not None:
+                self._stuck_pids.add(entry[0])
+            self._live.discard(job_id)
+
+        self.retire()
+
+    def retire(self) -> None:
+        """Não recebe mais jobs; fecha quando os jobs esperados por outras requisições terminarem"""
+        with self._lock:
+            self.retired = True
+
+        self._close_if_idle()
+
+    def _release(self, job_id: int) -> None:
+        with self._lock:
+            self._live.discard(job_id)
+            self._started.pop(job_id, None)
+
+        self._close_if_idle()
+
+    def _close_if_idle(self) -> None:
+        with self._lock:
+            if not self.retired or self._closed or self._started:
+                return
+
+            # Jobs ainda na fila esperam um processo livre, a menos que todos estejam presos
+            if self._live and len(self._stuck_pids) < self.max_workers:
+                return
+
+            self._closed = True
+            stuck_pids = list(self._stuck_pids)
+
+        for pid in stuck_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self._starts.put(None)
+
+
 class ForecasterService:
-    def __init__(self):
-        self.br_holidays = holidays.Brazil(years=range(2020, 2030))
+    def __init__(self, max_workers: int = FORECAST_MAX_WORKERS):
+        # Feriados brasileiros (store de calendário compartilhado com o Analyzer)
+        self.calendar = get_calendar()
+        self.br_holidays = self.calendar.holidays
 
         # Configurações de modelos
         self.prophet_config = {
@@ -48,59 +292,63 @@ class ForecasterService:
             'yearly_seasonality': True,
         }
 
-        # Cache de modelos treinados (para não retreinar sempre)
-        self.cached_models = {}
+        self.arima_config = {
+            'start_p': 0, 'start_q': 0,
+            'max_p': 3, 'max_q': 3,
+            'd': None,  # Auto-detecta diferenciação
+            'seasonal': True,
+            'm': 7,  # Período semanal
+            'stepwise': True,
+        }
 
-    def _prepare_time_series(self, transactions: List[TransactionInput]) -> pd.DataFrame:
-        """Prepara série temporal com tratamento de dados"""
-        data = [t.dict() for t in transactions]
-        df = pd.DataFrame(data)
+        self.exp_smoothing_config = {
+            'seasonal_periods': 7,  # Semanal
+            'trend': 'add',
+            'seasonal': 'add',
+        }
 
-        if df.empty:
-            return df
+        self.ridge_config = {
+            'alpha': 1.0,  # Regularização L2
+        }
 
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.sort_values('date')
+        # Cache de modelos treinados (para não retreinar sempre)
+        self.cached_models = FittedModelCache()
 
-        # Filtra apenas despesas
-        expenses = df[df['type'] == 'EXPENSE'].copy()
+        # Pool de processos para os fits (sobe em segundo plano, ver start_pool; 1 = sequencial, sem prazo)
+        self.max_workers = max_workers
+        self.model_timeouts = dict(MODEL_TIMEOUTS)
+        self._pool = None
+        self._pool_builder = None
+        self._pool_stopped = False
+        self._pool_lock = threading.Lock()
 
-        if expenses.empty:
-            return pd.DataFrame()
+    def _model_key(self, config: Dict, fingerprint: str, *extra) -> Tuple:
+        """Chave do cache: série preparada + configuração do modelo"""
+        return (fingerprint, repr(sorted(config.items())), *extra)
 
-        # Agrega por dia
-        daily_spend = expenses.groupby('date')['amount'].sum().reset_index()
-        daily_spend.columns = ['ds', 'y']  # Prophet format
+    def _prepare_time_series(self, transactions: List[TransactionInput]) -> pd.DataFrame:
+        """Prepara série temporal com tratamento de dados"""
+        # Apenas despesas, só valor e data (frame compacto, sem cópia intermediária)
+        expenses = build_transaction_frame(transactions, columns=('amount', 'date'), expenses_only=True)
 
-        # Preenche dias faltantes com 0
-        date_range = pd.date_range(
-            start=daily_spend['ds'].min(),
-            end=daily_spend['ds'].max(),
-            freq='D'
-        )
+        if expenses.empty:
+            return pd.DataFrame()
 
-        daily_spend = daily_spend.set_index('ds').reindex(date_range, fill_value=0).reset_index()
-        daily_spend.columns = ['ds', 'y']
+        # Agrega por dia do calendário, com dias faltantes = 0 (uma passada, sem reindex)
+        daily = DailySpend.from_frame(expenses)
 
-        return daily_spend
+        return pd.DataFrame({
+            'ds': pd.date_range(start=pd.Timestamp(daily.first_day, unit='D'), periods=len(daily), freq='D'),
+            'y': daily.amounts,
+        })  # Prophet format
 
     def _remove_outliers_iqr(self, df: pd.DataFrame) -> pd.DataFrame:
         """Remove outliers usando IQR antes do forecasting"""
         if len(df) < 10:
             return df
 
-        Q1 = df['y'].quantile(0.25)
-        Q3 = df['y'].quantile(0.75)
-        IQR = Q3 - Q1
-
-        # Define limites
-        lower_bound = Q1 - 3 * IQR
-        upper_bound = Q3 + 3 * IQR
-
-        # Remove outliers extremos (substitui por mediana)
-        median_value = df['y'].median()
-        df.loc[df['y'] > upper_bound, 'y'] = median_value
-        df.loc[df['y'] < lower_bound, 'y'] = 0
+        # Limites Q1 - 3·IQR e Q3 + 3·IQR: acima vira a mediana, abaixo vira 0
+        df['y'] = iqr_replace(df['y'].to_numpy(dtype=np.float64), factor=3.0)
 
         return df
 
@@ -112,31 +360,211 @@ class ForecasterService:
         monthly = monthly[['ds', 'y']]
         return monthly
 
-    def _forecast_with_prophet(
+    def _ensemble_members(self, daily_df: pd.DataFrame) -> Dict[str, Tuple[Tuple, Callable, Tuple]]:
+        """
+        Membros do ensemble elegíveis para o histórico
+
+        Returns:
+            nome → (chave do cache, função de fit, argumentos do fit)
+        """
+        members = {}
+        monthly = self._aggregate_to_monthly(daily_df.copy())['y']
+        daily_fingerprint = series_fingerprint(daily_df['y'], daily_df['ds'].iloc[0])
+        monthly_fingerprint = series_fingerprint(monthly)
+
+        # Caso 1: Dados suficientes para Prophet (> 30 dias)
+        if len(daily_df) >= 30:
+            # Feriados brasileiros no histórico + horizonte de previsão (`periods` entra na chave)
+            holidays_df = self.calendar.holidays_between(
+                daily_df['ds'].min(),
+                daily_df['ds'].max() + timedelta(days=PROPHET_PERIODS),
+            )
+            members['prophet'] = (
+                self._model_key(self.prophet_config, daily_fingerprint, PROPHET_PERIODS),
+                _fit_prophet,
+                (daily_df[['ds', 'y']], self.prophet_config, holidays_df),
+            )
+
+        # Caso 2: Auto-ARIMA com dados mensais (2+ meses, mínimo 10 pontos)
+        if len(daily_df) >= 60 and len(monthly) >= 10:
+            members['auto_arima'] = (
+                self._model_key(self.arima_config, monthly_fingerprint),
+                _fit_auto_arima,
+                (monthly, self.arima_config),
+            )
+
+        # Caso 3: Exponential Smoothing (mínimo 2 ciclos sazonais)
+        if len(daily_df) >= 14 and len(monthly) >= 14:
+            members['exp_smoothing'] = (
+                self._model_key(self.exp_smoothing_config, monthly_fingerprint),
+                _fit_exp_smoothing,
+                (monthly, self.exp_smoothing_config),
+            )
+
+        # Caso 4: Ridge Regression (sempre tenta)
+        members['ridge'] = (
+            self._model_key(self.ridge_config, daily_fingerprint),
+            _fit_ridge,
+            (daily_df[['ds', 'y']], self.ridge_config),
+        )
+
+        return members
+
+    def start_pool(self, wait_ready: bool = False) -> None:
+        """
+        Sobe um pool novo em segundo plano se não há um utilizável (startup do app
+        ou pool aposentado). Subir o pool leva segundos: nenhuma requisição espera por ele
+
+        Args:
+            wait_ready: bloqueia até o pool (novo ou já em construção) ficar pronto
+        """
+        if self.max_workers <= 1:
+            return
+
+        with self._pool_lock:
+            if self._pool_stopped:
+                return
+            if self._pool_builder is None and (self._pool is None or self._pool.retired):
+                self._pool_builder = threading.Thread(target=self._build_pool, name='forecast-pool-warm-up', daemon=True)
+                self._pool_builder.start()
+            builder = self._pool_builder
+
+        if wait_ready and builder is not None:
+            builder.join()
+
+    def _build_pool(self) -> None:
+        try:
+            pool = _FitPool(self.max_workers)
+        except Exception as e:
+            print(f"Erro ao subir o pool de fits: {e}")
+            pool = None
+
+        with self._pool_lock:
+            if pool is not None:
+                self._pool = pool
+            self._pool_builder = None
+
+        if pool is not None:
+            print(f"✅ Pool de fits pronto ({self.max_workers} processos)")
+
+    def _ready_pool(self) -> Optional[_FitPool]:
+        """Pool aquecido e utilizável, ou None (pede um novo em segundo plano)"""
+        with self._pool_lock:
+            pool = self._pool
+
+        if pool is None or pool.retired:
+            self.start_pool()
+            return None
+
+        return pool
+
+    def shutdown(self) -> None:
+        """Encerra o pool (espera um pool em construção terminar de subir); não sobe outros"""
+        with self._pool_lock:
+            self._pool_stopped = True
+            builder = self._pool_builder
+
+        if builder is not None:
+            builder.join()
+
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+
+        if pool is not None:
+            pool.retire()
+
+    def _fit_members(self, members: Dict[str, Tuple[Tuple, Callable, Tuple]]) -> Tuple[Dict[str, Any], Dict[str, float], List[str], Dict[str, str]]:
+        """
+        Ajusta os membros em paralelo no pool de processos, cada um com seu prazo
+        (contado do início do fit no processo). Modelos em cache não são reajustados (duração 0)
+
+        Returns:
+            (modelos ajustados, duração de cada fit em ms, membros que estouraram o prazo,
+             membros que falharam → erro)
+        """
+        models = {}
+        durations = {}
+        timed_out = []
+        failed = {}
+        pending = {}
+
+        # Sem pool aquecido (max_workers=1, startup ou troca em andamento): fits
+        # sequenciais no próprio processo, sem prazo
+        pool = self._ready_pool() if self.max_workers > 1 else None
+
+        def fit_in_process(name: str, key: Tuple, fit: Callable, args: Tuple) -> None:
+            try:
+                models[name], durations[name] = _timed_fit(fit, *args)
+                self.cached_models.put(name, key, models[name])
+            except Exception as e:
+                print(f"Erro no fit de {name}: {e}")
+                failed[name] = f"{type(e).__name__}: {e}"
+
+        for name, (key, fit, args) in members.items():
+            model = self.cached_models.get(name, key)
+
+            if model is not None:
+                models[name] = model
+                durations[name] = 0.0
+                continue
+
+            if pool is not None:
+                try:
+                    job_id, future = pool.submit(fit, *args)
+                    pending[name] = (key, pool, job_id, future)
+                    continue
+                except RuntimeError as e:
+                    # Aposentado por outra requisição entre a leitura e o submit
+                    print(f"Pool de fits indisponível, ajustando {name} no processo: {e}")
+                    pool = self._ready_pool()
+
+            fit_in_process(name, key, fit, args)
+
+        while pending:
+            now = time.time()
+
+            for name, (key, job_pool, job_id, future) in list(pending.items()):
+                if future.done():
+                    del pending[name]
+
+                    try:
+                        models[name], durations[name] = future.result()
+                        self.cached_models.put(name, key, models[name])
+                    except Exception as e:
+                        print(f"Erro no fit de {name}: {e}")
+                        failed[name] = f"{type(e).__name__}: {e}"
+                        if isinstance(e, BrokenProcessPool):
+                            job_pool.retire()
+                            self.start_pool()
+                    continue
+
+                # Prazo só corre depois que o processo começou o fit
+                started = job_pool.started_at(job_id)
+                timeout = self.model_timeouts.get(name, DEFAULT_MODEL_TIMEOUT)
+
+                if started is not None and now - started >= timeout:
+                    del pending[name]
+                    timed_out.append(name)
+                    durations[name] = (now - started) * 1000
+                    job_pool.abandon(job_id)
+                    self.start_pool()  # Substituto sobe em segundo plano
+                    print(f"⏱️ {name} excedeu o prazo de {timeout}s")
+
+            if pending:
+                wait([future for _, _, _, future in pending.values()], timeout=FIT_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+
+        return models, {name: round(durations[name], 1) for name in members if name in durations}, timed_out, failed
+
+    def _predict_prophet(
         self,
-        df: pd.DataFrame,
-        periods: int = 30
+        model: Prophet,
+        periods: int = PROPHET_PERIODS
     ) -> Tuple[float, float, float, Dict]:
         """
         Previsão usando Prophet (Facebook)
         Excelente para dados com sazonalidade e tendências
         """
         try:
-            # Configura modelo
-            model = Prophet(
-                **self.prophet_config,
-                daily_seasonality=False,  # Evita overfitting em dados diários
-            )
-
-            # Adiciona feriados brasileiros
-            for date, name in sorted(self.br_holidays.items()):
-                if df['ds'].min() <= pd.Timestamp(date) <= df['ds'].max() + timedelta(days=periods):
-                    model.add_country_holidays(country_name='BR')
-                    break
-
-            # Treina
-            model.fit(df)
-
             # Previsão
             future = model.make_future_dataframe(periods=periods)
             forecast = model.predict(future)
@@ -160,9 +588,9 @@ class ForecasterService:
             print(f"Erro no Prophet: {e}")
             return None, None, None, {}
 
-    def _forecast_with_auto_arima(
+    def _predict_auto_arima(
         self,
-        series: pd.Series,
+        model,
         periods: int = 1
     ) -> Tuple[Optional[float], Optional[float], Optional[float]]:
         """
@@ -170,23 +598,6 @@ class ForecasterService:
         Seleciona automaticamente os melhores parâmetros (p, d, q)
         """
         try:
-            if len(series) < 10:
-                return None, None, None
-
-            # Auto-ARIMA encontra os melhores parâmetros
-            model = auto_arima(
-                series,
-                start_p=0, start_q=0,
-                max_p=3, max_q=3,
-                d=None,  # Auto-detecta diferenciação
-                seasonal=True,
-                m=7,  # Período semanal
-                trace=False,
-                error_action='ignore',
-                suppress_warnings=True,
-                stepwise=True,
-            )
-
             # Previsão com intervalo de confiança
             forecast, conf_int = model.predict(
                 n_periods=periods,
@@ -204,9 +615,9 @@ class ForecasterService:
             print(f"Erro no Auto-ARIMA: {e}")
             return None, None, None
 
-    def _forecast_with_exponential_smoothing(
+    def _predict_exponential_smoothing(
         self,
-        series: pd.Series,
+        fitted,
         periods: int = 1
     ) -> Optional[float]:
         """
@@ -214,17 +625,6 @@ class ForecasterService:
         Bom para séries com tendência e sazonalidade
         """
         try:
-            if len(series) < 14:  # Mínimo 2 semanas
-                return None
-
-            model = ExponentialSmoothing(
-                series,
-                seasonal_periods=7,  # Semanal
-                trend='add',
-                seasonal='add',
-            )
-
-            fitted = model.fit()
             forecast = fitted.forecast(steps=periods)
 
             return max(0, float(forecast.iloc[0]))
@@ -233,8 +633,9 @@ class ForecasterService:
             print(f"Erro no Exponential Smoothing: {e}")
             return None
 
-    def _forecast_with_ridge(
+    def _predict_ridge(
         self,
+        fitted: Tuple[StandardScaler, Ridge],
         df: pd.DataFrame,
         periods: int = 30
     ) -> Optional[float]:
@@ -243,27 +644,7 @@ class ForecasterService:
         Fallback robusto quando outros modelos falham
         """
         try:
-            if len(df) < 7:
-                return None
-
-            # Feature Engineering
-            df_model = df.copy()
-            df_model['day_of_week'] = df_model['ds'].dt.dayofweek
-            df_model['day_of_month'] = df_model['ds'].dt.day
-            df_model['month'] = df_model['ds'].dt.month
-            df_model['days_since_start'] = (df_model['ds'] - df_model['ds'].min()).dt.days
-
-            features = ['days_since_start', 'day_of_week', 'day_of_month', 'month']
-            X = df_model[features].values
-            y = df_model['y'].values
-
-            # Normalização
-            scaler = StandardScaler()
-            X_scaled = scaler.fit_transform(X)
-
-            # Ridge Regression (regularização L2)
-            model = Ridge(alpha=1.0)
-            model.fit(X_scaled, y)
+            scaler, model = fitted
 
             # Predição para o próximo período
             last_date = df['ds'].max()
@@ -285,6 +666,16 @@ class ForecasterService:
             print(f"Erro no Ridge: {e}")
             return None
 
+    def _renormalized_weights(self, names: List[str], weights: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """Pesos dos membros presentes somando 1 (vazio se nenhum tem peso)"""
+        weights = weights or ENSEMBLE_WEIGHTS
+        total_weight = sum(weights.get(name, 0) for name in names)
+
+        if total_weight == 0:
+            return {}
+
+        return {name: weights.get(name, 0) / total_weight for name in names}
+
     def _ensemble_predictions(
         self,
         predictions: List[Tuple[str, float, Optional[float], Optional[float]]],
@@ -297,25 +688,16 @@ class ForecasterService:
         if not predictions:
             return 0, 0, 0
 
-        # Pesos padrão (Prophet > Auto-ARIMA > Outros)
-        if weights is None:
-            weights = {
-                'prophet': 0.40,
-                'auto_arima': 0.35,
-                'exp_smoothing': 0.15,
-                'ridge': 0.10,
-            }
-
         # Filtra predições válidas
         valid_preds = [(name, pred, lower, upper) for name, pred, lower, upper in predictions if pred is not None]
 
         if not valid_preds:
             return 0, 0, 0
 
-        # Média ponderada
-        total_weight = sum(weights.get(name, 0) for name, _, _, _ in valid_preds)
+        # Pesos renormalizados sobre os membros que terminaram (descartados por prazo não entram)
+        normalized = self._renormalized_weights([name for name, _, _, _ in valid_preds], weights)
 
-        if total_weight == 0:
+        if not normalized:
             # Fallback: média simples
             ensemble_pred = np.mean([pred for _, pred, _, _ in valid_preds])
             lower_bounds = [lower for _, _, lower, _ in valid_preds if lower is not None]
@@ -326,9 +708,9 @@ class ForecasterService:
         else:
             # Média ponderada normalizada
             ensemble_pred = sum(
-                weights.get(name, 0) * pred
+                normalized[name] * pred
                 for name, pred, _, _ in valid_preds
-            ) / total_weight
+            )
 
             # Intervalos: usa menor lower e maior upper
             lower_bounds = [lower for _, _, lower, _ in valid_preds if lower is not None]
@@ -371,58 +753,37 @@ class ForecasterService:
         last_7_days = daily_df.tail(7)['y'].sum()
         last_30_days = daily_df.tail(30)['y'].sum() if len(daily_df) >= 30 else daily_df['y'].sum()
 
-        predictions = []
-
         # === ESTRATÉGIA DE FORECASTING ===
+        # Membros ajustados em paralelo, cada um com seu prazo; quem estoura fica fora do ensemble
+        models, durations, timed_out, failed = self._fit_members(self._ensemble_members(daily_df))
 
-        # Caso 1: Dados suficientes para Prophet (> 30 dias)
-        if len(daily_df) >= 30:
-            try:
-                prophet_pred, prophet_lower, prophet_upper, components = self._forecast_with_prophet(
-                    daily_df, periods=30
-                )
+        predictions = []
 
-                if prophet_pred is not None:
-                    # Prophet retorna total de 30 dias, queremos o total mensal
-                    predictions.append(('prophet', prophet_pred, prophet_lower, prophet_upper))
-            except Exception as e:
-                print(f"Prophet falhou: {e}")
+        if 'prophet' in models:
+            prophet_pred, prophet_lower, prophet_upper, components = self._predict_prophet(models['prophet'])
 
-        # Caso 2: Auto-ARIMA com dados mensais
-        if len(daily_df) >= 60:  # 2+ meses
-            try:
-                monthly_df = self._aggregate_to_monthly(daily_df)
+            if prophet_pred is not None:
+                # Prophet retorna total de 30 dias, queremos o total mensal
+                predictions.append(('prophet', prophet_pred, prophet_lower, prophet_upper))
 
-                if len(monthly_df) >= 3:
-                    arima_pred, arima_lower, arima_upper = self._forecast_with_auto_arima(
-                        monthly_df['y'], periods=1
-                    )
+        if 'auto_arima' in models:
+            arima_pred, arima_lower, arima_upper = self._predict_auto_arima(models['auto_arima'], periods=1)
 
-                    if arima_pred is not None:
-                        predictions.append(('auto_arima', arima_pred, arima_lower, arima_upper))
-            except Exception as e:
-                print(f"Auto-ARIMA falhou: {e}")
+            if arima_pred is not None:
+                predictions.append(('auto_arima', arima_pred, arima_lower, arima_upper))
 
-        # Caso 3: Exponential Smoothing
-        if len(daily_df) >= 14:
-            try:
-                monthly_df = self._aggregate_to_monthly(daily_df)
-                exp_pred = self._forecast_with_exponential_smoothing(monthly_df['y'], periods=1)
+        if 'exp_smoothing' in models:
+            exp_pred = self._predict_exponential_smoothing(models['exp_smoothing'], periods=1)
 
-                if exp_pred is not None:
-                    predictions.append(('exp_smoothing', exp_pred, None, None))
-            except Exception as e:
-                print(f"Exp Smoothing falhou: {e}")
+            if exp_pred is not None:
+                predictions.append(('exp_smoothing', exp_pred, None, None))
 
-        # Caso 4: Ridge Regression (sempre tenta)
-        try:
-            ridge_pred = self._forecast_with_ridge(daily_df, periods=30)
+        if 'ridge' in models:
+            ridge_pred = self._predict_ridge(models['ridge'], daily_df, periods=30)
 
             if ridge_pred is not None:
                 # Ridge retorna diário, multiplica por 30
                 predictions.append(('ridge', ridge_pred, None, None))
-        except Exception as e:
-            print(f"Ridge falhou: {e}")
 
         # === ENSEMBLE DE PREDIÇÕES ===
 
@@ -463,6 +824,11 @@ class ForecasterService:
             "variation_percent": round((diff / last_30_days * 100) if last_30_days > 0 else 0, 1),
             "method": method,
             "models_used": [name for name, _, _, _ in predictions],
+            "models_completed": sorted(models, key=list(ENSEMBLE_WEIGHTS).index),
+            "models_timed_out": timed_out,
+            "models_failed": failed,
+            "model_durations_ms": durations,
+            "model_weights": {name: round(weight, 4) for name, weight in self._renormalized_weights([name for name, _, _, _ in predictions]).items()},
             "n_samples": len(daily_df),
             "message": f"Previsão baseada em {len(predictions)} modelo(s) com {len(daily_df)} dias de histórico.",
         }
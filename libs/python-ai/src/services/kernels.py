@@ -0,0 +1,325 @@
+"""
+Kernels - Primitivas Numéricas Compiladas
+============================================
+
+Laços numéricos quentes do analyzer e do forecaster:
+
+- Estatísticas robustas por grupo (contagem, mediana, MAD, média, desvio)
+- Estatísticas de intervalos por segmento ordenado (detecção de recorrências)
+- Substituição de outliers por IQR
+- Soma diária densa (dias sem gasto = 0)
+
+Com numba instalado, cada primitiva é compilada (njit com cache=True: o código
+de máquina fica em __pycache__ e só é gerado na primeira chamada do primeiro
+processo). Sem numba, a mesma função usa a implementação numpy vetorizada,
+com os mesmos resultados.
+"""
+
+import numpy as np
+from typing import Tuple
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Desligue para forçar as implementações numpy
+USE_NUMBA = NUMBA_AVAILABLE
+
+
+def _group_starts(counts: np.ndarray) -> np.ndarray:
+    starts = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    return starts
+
+
+def _sorted_middle(sorted_values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Mediana de cada segmento já ordenado (média dos dois centrais; NaN se vazio)"""
+    if len(sorted_values) == 0:
+        return np.full(len(counts), np.nan)
+
+    last = len(sorted_values) - 1
+    lo = np.minimum(starts + np.maximum(counts - 1, 0) // 2, last)
+    hi = np.minimum(starts + counts // 2, last)
+
+    return np.where(counts > 0, (sorted_values[lo] + sorted_values[hi]) / 2, np.nan)
+
+
+# === Implementações numpy ===
+
+def _group_robust_stats_numpy(codes: np.ndarray, values: np.ndarray, n_groups: int) -> Tuple[np.ndarray, ...]:
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = _group_starts(counts)
+
+    # Códigos em int16 usam radix sort (linear) no argsort estável
+    sort_codes = codes.astype(np.int16) if n_groups <= np.iinfo(np.int16).max else codes
+    grouped = values[np.argsort(sort_codes, kind='stable')]
+
+    median = np.full(n_groups, np.nan)
+    mad = np.full(n_groups, np.nan)
+
+    # Mediana por seleção (np.partition), sem ordenar cada grupo
+    for g in np.flatnonzero(counts):
+        segment = grouped[starts[g]:starts[g] + counts[g]]
+        median[g] = np.median(segment)
+        mad[g] = np.median(np.abs(segment - median[g]))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(codes, weights=values, minlength=n_groups) / counts
+        variance = np.bincount(codes, weights=(values - mean[codes]) ** 2, minlength=n_groups) / counts
+
+    return counts, median, mad, mean, np.sqrt(variance)
+
+
+def _segment_interval_stats_numpy(days: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, ...]:
+    sizes = ends - starts
+    n_intervals = np.maximum(sizes - 1, 0)
+
+    mean = np.full(len(starts), np.nan)
+    std = np.full(len(starts), np.nan)
+
+    has_interval = n_intervals >= 1
+    # Soma dos intervalos de um segmento ordenado = último - primeiro
+    mean[has_interval] = (days[ends[has_interval] - 1] - days[starts[has_interval]]) / n_intervals[has_interval]
+
+    segment = np.repeat(np.arange(len(starts)), sizes)
+    same = segment[1:] == segment[:-1]
+    deviation = (np.diff(days).astype(np.float64) - mean[segment[1:]])[same]
+    squares = np.bincount(segment[1:][same], weights=deviation ** 2, minlength=len(starts))
+
+    has_std = n_intervals >= 2
+    std[has_std] = np.sqrt(squares[has_std] / (n_intervals[has_std] - 1))
+
+    return n_intervals, mean, std
+
+
+def _iqr_replace_numpy(values: np.ndarray, factor: float) -> np.ndarray:
+    q1, q3 = np.quantile(values, [0.25, 0.75])
+    iqr = q3 - q1
+    median = np.median(values)
+
+    out = np.where(values > q3 + factor * iqr, median, values)
+    return np.where(out < q1 - factor * iqr, 0.0, out)
+
+
+def _daily_totals_numpy(offsets: np.ndarray, amounts: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    return (
+        np.bincount(offsets, weights=amounts, minlength=size),
+        np.bincount(offsets, minlength=size),
+    )
+
+
+# === Implementações compiladas ===
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _group_robust_stats_jit(codes, values, n_groups):
+        counts = np.zeros(n_groups, dtype=np.int64)
+        for g in codes:
+            counts[g] += 1
+
+        starts = np.zeros(n_groups, dtype=np.int64)
+        for g in range(1, n_groups):
+            starts[g] = starts[g - 1] + counts[g - 1]
+
+        # Counting sort estável: valores de cada grupo contíguos, na ordem original
+        grouped = np.empty(len(values))
+        position = starts.copy()
+        for i in range(len(values)):
+            grouped[position[codes[i]]] = values[i]
+            position[codes[i]] += 1
+
+        median = np.full(n_groups, np.nan)
+        mad = np.full(n_groups, np.nan)
+        mean = np.full(n_groups, np.nan)
+        std = np.full(n_groups, np.nan)
+
+        for g in range(n_groups):
+            c = counts[g]
+            if c == 0:
+                continue
+
+            # np.median por seleção (quickselect), linear no tamanho do grupo
+            segment = grouped[starts[g]:starts[g] + c]
+            m = np.median(segment)
+            median[g] = m
+            mad[g] = np.median(np.abs(segment - m))
+
+            total = 0.0
+            for v in segment:
+                total += v
+            mu = total / c
+
+            squares = 0.0
+            for v in segment:
+                squares += (v - mu) ** 2
+
+            mean[g] = mu
+            std[g] = np.sqrt(squares / c)
+
+        return counts, median, mad, mean, std
+
+    @njit(cache=True)
+    def _segment_interval_stats_jit(days, starts, ends):
+        n_segments = len(starts)
+        n_intervals = np.zeros(n_segments, dtype=np.int64)
+        mean = np.full(n_segments, np.nan)
+        std = np.full(n_segments, np.nan)
+
+        for g in range(n_segments):
+            s = starts[g]
+            e = ends[g]
+            m = e - s - 1
+            if m < 1:
+                continue
+
+            n_intervals[g] = m
+            mu = (days[e - 1] - days[s]) / m
+            mean[g] = mu
+
+            if m >= 2:
+                squares = 0.0
+                for i in range(s + 1, e):
+                    d = (days[i] - days[i - 1]) - mu
+                    squares += d * d
+                std[g] = np.sqrt(squares / (m - 1))
+
+        return n_intervals, mean, std
+
+    @njit(cache=True)
+    def _linear_quantile(sorted_values, q):
+        # Mesma interpolação do numpy (method='linear', incluindo o lerp simétrico)
+        position = q * (len(sorted_values) - 1)
+        lo = int(np.floor(position))
+        hi = min(lo + 1, len(sorted_values) - 1)
+        t = position - lo
+        a = sorted_values[lo]
+        b = sorted_values[hi]
+        diff = b - a
+        if t >= 0.5:
+            return b - diff * (1 - t)
+        return a + diff * t
+
+    @njit(cache=True)
+    def _iqr_replace_jit(values, factor):
+        n = len(values)
+        ordered = np.sort(values)
+
+        q1 = _linear_quantile(ordered, 0.25)
+        q3 = _linear_quantile(ordered, 0.75)
+        median = (ordered[(n - 1) // 2] + ordered[n // 2]) / 2
+
+        iqr = q3 - q1
+        upper = q3 + factor * iqr
+        lower = q1 - factor * iqr
+
+        out = values.copy()
+        for i in range(n):
+            if values[i] > upper:
+                out[i] = median
+            elif values[i] < lower:
+                out[i] = 0.0
+
+        return out
+
+    @njit(cache=True)
+    def _daily_totals_jit(offsets, amounts, size):
+        totals = np.zeros(size)
+        counts = np.zeros(size, dtype=np.int64)
+
+        for i in range(len(offsets)):
+            totals[offsets[i]] += amounts[i]
+            counts[offsets[i]] += 1
+
+        return totals, counts
+
+
+# === API ===
+
+def group_robust_stats(codes: np.ndarray, values: np.ndarray, n_groups: int) -> Tuple[np.ndarray, ...]:
+    """
+    Estatísticas por grupo (vetores de tamanho n_groups)
+
+    Args:
+        codes: grupo de cada valor (0..n_groups-1)
+        values: valores (float64)
+
+    Returns:
+        (count, median, mad, mean, std populacional) — NaN em grupos vazios
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+
+    if USE_NUMBA:
+        return _group_robust_stats_jit(codes, values, int(n_groups))
+
+    return _group_robust_stats_numpy(codes, values, n_groups)
+
+
+def segment_interval_stats(days: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """
+    Intervalos entre eventos consecutivos de cada segmento [start, end)
+    (`days` ordenado dentro de cada segmento)
+
+    Returns:
+        (quantidade de intervalos, média, desvio amostral) por segmento
+    """
+    days = np.asarray(days, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    if USE_NUMBA:
+        return _segment_interval_stats_jit(days, starts, ends)
+
+    return _segment_interval_stats_numpy(days, starts, ends)
+
+
+def sorted_segment_median(sorted_values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Mediana de cada segmento [start, end) de um vetor já ordenado dentro dos segmentos"""
+    starts = np.asarray(starts, dtype=np.int64)
+    return _sorted_middle(np.asarray(sorted_values, dtype=np.float64), starts, np.asarray(ends, dtype=np.int64) - starts)
+
+
+def iqr_replace(values: np.ndarray, factor: float = 3.0) -> np.ndarray:
+    """
+    Outliers extremos por IQR: acima de Q3 + factor·IQR viram a mediana,
+    abaixo de Q1 - factor·IQR viram 0 (quantis lineares, como no pandas)
+    """
+    values = np.asarray(values, dtype=np.float64)
+
+    if len(values) == 0:
+        return values.copy()
+
+    if USE_NUMBA:
+        return _iqr_replace_jit(values, float(factor))
+
+    return _iqr_replace_numpy(values, float(factor))
+
+
+def daily_totals(offsets: np.ndarray, amounts: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Soma e quantidade por slot diário (offsets em 0..size-1)"""
+    offsets = np.asarray(offsets, dtype=np.int64)
+    amounts = np.asarray(amounts, dtype=np.float64)
+
+    if USE_NUMBA:
+        return _daily_totals_jit(offsets, amounts, int(size))
+
+    return _daily_totals_numpy(offsets, amounts, int(size))
+
+
+def warm_up() -> None:
+    """
+    Carrega/compila as primitivas numba com entradas mínimas
+    Chamado na criação dos serviços: a compilação a frio não cai no prazo da primeira requisição
+    """
+    if not USE_NUMBA:
+        return
+
+    codes = np.zeros(2, dtype=np.int64)
+    values = np.ones(2, dtype=np.float64)
+
+    group_robust_stats(codes, values, 1)
+    segment_interval_stats(codes, np.zeros(1, dtype=np.int64), np.full(1, 2, dtype=np.int64))
+    iqr_replace(values)
+    daily_totals(codes, values, 1)
@@ -0,0 +1,138 @@
+"""
+Merchant Normalizer - Chave Canônica de Estabelecimento
+=========================================================
+
+Linhas de extrato trazem ruído que impede que o mesmo estabelecimento
+colapse para a mesma chave:
+
+    "IFOOD *REST 1234 SAO PAULO"   → "ifood rest"
+    "IFOOD *REST 9876"             → "ifood rest"
+    "PAG*UBER TRIP 12/03 PARC 03/12" → "uber trip"
+
+Regras aplicadas (em ordem):
+1. Minúsculas + remoção de acentos
+2. Prefixos de adquirentes/intermediadores (PAG*, MP*, PAYPAL *, ...)
+3. Marcadores de parcela (PARC 03/12, 3/12, 03 DE 12)
+4. Datas e horários
+5. Final de cartão; ids de pedido/NSU (tokens com dígitos depois de um
+   separador `*` ou `#`; "99FOOD" no nome do estabelecimento fica)
+6. Pontuação
+7. Cidade/UF no final da linha (antes das stopwords, para "rio de janeiro"
+   ainda casar). Cidade sem UF/BR depois só sai se sobrarem 2+ tokens:
+   "DROGARIA SAO PAULO" e "PIZZARIA SANTOS" são nomes, não localização
+8. Stopwords e espaços múltiplos
+
+A chave nunca fica vazia: sem nenhum token restante, vale o texto original
+em minúsculas.
+
+Todos os padrões são compilados uma única vez no import. `canonicalize_batch`
+aplica as mesmas regras de forma vetorizada (pandas `.str`) sobre os valores
+únicos da entrada.
+"""
+
+import re
+import pandas as pd
+from typing import Iterable, List
+from unidecode import unidecode
+
+STOPWORDS = frozenset({
+    'a', 'o', 'de', 'da', 'do', 'em', 'para', 'com', 'por',
+    'e', 'ou', 'na', 'no', 'as', 'os', 'das', 'dos',
+})
+
+# Cidades frequentes em extratos (já sem acento)
+CITIES = (
+    'sao paulo', 'rio de janeiro', 'belo horizonte', 'brasilia', 'salvador',
+    'fortaleza', 'curitiba', 'recife', 'porto alegre', 'manaus', 'belem',
+    'goiania', 'campinas', 'guarulhos', 'sao luis', 'maceio', 'natal',
+    'teresina', 'joao pessoa', 'florianopolis', 'vitoria', 'cuiaba',
+    'campo grande', 'aracaju', 'osasco', 'santo andre', 'sao bernardo',
+    'santos', 'niteroi', 'ribeirao preto', 'sorocaba', 'uberlandia',
+    'londrina', 'joinville', 'barueri',
+)
+
+UFS = (
+    'ac', 'al', 'ap', 'am', 'ba', 'ce', 'df', 'es', 'go', 'ma', 'mt', 'ms',
+    'mg', 'pa', 'pb', 'pr', 'pe', 'pi', 'rj', 'rn', 'rs', 'ro', 'rr', 'sc',
+    'sp', 'se', 'to',
+)
+
+# === PADRÕES PRÉ-COMPILADOS ===
+
+_PROCESSOR_PREFIX = re.compile(
+    r'^\s*(?:pag|pg|mp|mercpago|mercadopago|paypal|picpay|pagseguro|ebanx|ec|sumup|stone|cielo|ifd)\s*\*\s*'
+)
+_INSTALLMENT = re.compile(r'\b(?:parc(?:ela)?\.?\s*)?\d{1,2}\s*(?:/|de)\s*\d{1,2}\b')
+_DATE = re.compile(r'\b\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?\b')
+_TIME = re.compile(r'\b\d{1,2}:\d{2}(?::\d{2})?\b')
+_CARD_SUFFIX = re.compile(r'\b(?:final|cartao|card|cart)\s*\d{4}\b')
+_DIGIT_TOKEN = re.compile(r'\b(?=\w*\d)\w{3,}\b')
+# Trecho da linha depois do primeiro separador (onde ficam ids de pedido/NSU)
+_AFTER_SEPARATOR = re.compile(r'[*#].*$')
+_NON_ALNUM = re.compile(r'[^a-z0-9\s]')
+_MULTI_SPACE = re.compile(r'\s+')
+_STOPWORDS = re.compile(r'\b(?:' + '|'.join(sorted(STOPWORDS)) + r')\b')
+_CITY = '(?:' + '|'.join(CITIES) + ')'
+_UF_MARKER = r'(?:(?:' + '|'.join(UFS) + r')(?:\s+br[a]?)?|br[a]?)'
+# UF/BR no final (com a cidade antes, se houver), sempre precedida de outro token
+_TRAILING_MARKED_LOCATION = re.compile(r'(?<=\S)\s+(?:' + _CITY + r'\s+)?' + _UF_MARKER + r'\s*$')
+# Cidade sem marcador: só quando sobram pelo menos 2 tokens antes dela
+_TRAILING_CITY = re.compile(r'^\s*(\S+\s+\S.*?)\s+' + _CITY + r'\s*$')
+
+
+def _strip_digit_tokens(match: re.Match) -> str:
+    return _DIGIT_TOKEN.sub(' ', match.group(0))
+
+
+# Ordem de aplicação (antes da remoção de pontuação, as marcações ainda existem)
+_RULES = (
+    (_PROCESSOR_PREFIX, ''),
+    (_CARD_SUFFIX, ' '),
+    (_INSTALLMENT, ' '),
+    (_DATE, ' '),
+    (_TIME, ' '),
+    (_AFTER_SEPARATOR, _strip_digit_tokens),
+    (_NON_ALNUM, ' '),
+    (_TRAILING_MARKED_LOCATION, ''),
+    (_TRAILING_CITY, r'\1'),
+    (_STOPWORDS, ' '),
+    (_MULTI_SPACE, ' '),
+)
+
+
+def canonicalize(text: str) -> str:
+    """Chave canônica de estabelecimento para uma descrição"""
+    if not text:
+        return ""
+
+    raw = unidecode(text.lower().strip())
+    text = raw
+
+    for pattern, replacement in _RULES:
+        text = pattern.sub(replacement, text)
+
+    return text.strip() or _MULTI_SPACE.sub(' ', raw)
+
+
+def canonicalize_batch(texts: Iterable[str]) -> List[str]:
+    """
+    Versão vetorizada de `canonicalize`
+    Normaliza apenas os valores únicos e reindexa o resultado
+    """
+    series = pd.Series(list(texts), dtype=object).fillna('')
+
+    if series.empty:
+        return []
+
+    codes, uniques = pd.factorize(series)
+    raw = pd.Series(uniques, dtype=object).str.lower().str.strip().map(unidecode)
+    normalized = raw
+
+    for pattern, replacement in _RULES:
+        normalized = normalized.str.replace(pattern, replacement, regex=True)
+
+    normalized = normalized.str.strip()
+    empty = normalized == ''
+    normalized[empty] = raw[empty].str.replace(_MULTI_SPACE, ' ', regex=True)
+
+    return normalized.to_numpy()[codes].tolist()
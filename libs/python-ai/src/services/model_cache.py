@@ -0,0 +1,120 @@
+"""
+Model Cache - Cache de Modelos de Forecast Treinados
+======================================================
+
+Modelos ajustados (Prophet, Auto-ARIMA, Holt-Winters, Ridge) em memória,
+indexados pela impressão digital da série preparada + configuração do modelo:
+a mesma série com a mesma configuração não é reajustada.
+
+- LRU limitado por memória: tamanho de cada modelo estimado pelo pickle
+  (modelos maiores que o limite inteiro não entram)
+- Expiração por TTL
+- Hits/misses por tipo de modelo
+"""
+
+import hashlib
+import pickle
+import threading
+import time
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+MODEL_CACHE_MAX_BYTES = 256 * 1024 * 1024
+MODEL_CACHE_TTL = 3600  # segundos
+
+
+def series_fingerprint(values, start: Optional[pd.Timestamp] = None) -> str:
+    """Impressão digital dos valores da série (e da data inicial, quando datada)"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+
+    if start is not None:
+        digest.update(str(pd.Timestamp(start)).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+class FittedModelCache:
+    def __init__(self, max_bytes: int = MODEL_CACHE_MAX_BYTES, ttl: float = MODEL_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        # (tipo, série, configuração) → (instante, bytes, modelo)
+        self._models: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def get(self, model_type: str, key: Tuple[Hashable, ...]) -> Optional[Any]:
+        """Modelo ajustado ainda válido, ou None (conta hit/miss do tipo)"""
+        cache_key = (model_type, *key)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._models.get(cache_key)
+
+            if entry is not None and now - entry[0] >= self.ttl:
+                self._evict(cache_key)
+                entry = None
+
+            if entry is None:
+                self.misses[model_type] = self.misses.get(model_type, 0) + 1
+                return None
+
+            self._models.move_to_end(cache_key)
+            self.hits[model_type] = self.hits.get(model_type, 0) + 1
+            return entry[2]
+
+    def put(self, model_type: str, key: Tuple[Hashable, ...], model: Any) -> None:
+        try:
+            size = len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception as e:
+            print(f"Modelo {model_type} não serializável, fora do cache: {e}")
+            return
+
+        if size > self.max_bytes:
+            return
+
+        cache_key = (model_type, *key)
+
+        with self._lock:
+            if cache_key in self._models:
+                self._evict(cache_key)
+
+            self._models[cache_key] = (time.monotonic(), size, model)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                self._evict(next(iter(self._models)))
+
+    def _evict(self, cache_key: Tuple) -> None:
+        _, size, _ = self._models.pop(cache_key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            by_type = {}
+            for model_type in sorted(set(self.hits) | set(self.misses)):
+                hits = self.hits.get(model_type, 0)
+                misses = self.misses.get(model_type, 0)
+                by_type[model_type] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+                }
+
+            return {
+                'size': len(self._models),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'models': by_type,
+            }
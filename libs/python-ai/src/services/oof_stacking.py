@@ -0,0 +1,131 @@
+"""
+Out-of-Fold Stacking
+====================
+
+Stacking em uma única passada de validação cruzada.
+
+O StackingClassifier do scikit-learn roda um CV interno para gerar as
+meta-features e, quando combinado com `cross_val_score`, todo o ensemble é
+treinado de novo a cada fold externo (~5 × (5 + 1) fits por booster).
+
+Aqui as predições out-of-fold (OOF) são calculadas uma única vez e usadas
+para duas coisas:
+1. Treinar o meta-learner (mesmas meta-features do StackingClassifier)
+2. Reportar a acurácia de validação cruzada do ensemble
+
+Custo: k fits por estimador + 1 fit final com todos os dados.
+"""
+
+import numpy as np
+from typing import List, Tuple, Optional
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from sklearn.utils.validation import check_is_fitted
+
+
+def _fit_and_predict_fold(estimator, X, y, train_idx, test_idx, n_classes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Treina um estimador em um fold e retorna as probabilidades OOF alinhadas às classes"""
+    model = clone(estimator)
+    model.fit(X[train_idx], y[train_idx])
+
+    probs = np.zeros((len(test_idx), n_classes))
+    # Alinha colunas caso alguma classe não apareça no fold de treino
+    probs[:, model.classes_] = model.predict_proba(X[test_idx])
+
+    return test_idx, probs
+
+
+def _fit_full(estimator, X, y):
+    """Treina um estimador com todos os dados"""
+    return clone(estimator).fit(X, y)
+
+
+class OutOfFoldStackingClassifier(BaseEstimator, ClassifierMixin):
+    """
+    Stacking com meta-features out-of-fold calculadas uma única vez
+
+    Após o `fit`:
+    - estimators_: estimadores base treinados com todos os dados
+    - final_estimator_: meta-learner treinado com as predições OOF
+    - oof_predictions_: meta-features OOF (n_samples × n_estimators·n_classes)
+    - cv_scores_: acurácia por fold do ensemble, medida sobre as predições OOF
+    """
+
+    def __init__(
+        self,
+        estimators: List[Tuple[str, BaseEstimator]],
+        final_estimator: BaseEstimator,
+        cv: int = 5,
+        n_jobs: Optional[int] = None,
+        random_state: Optional[int] = 42,
+    ):
+        self.estimators = estimators
+        self.final_estimator = final_estimator
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def _make_cv(self, y: np.ndarray) -> StratifiedKFold:
+        # Não pode haver mais folds do que exemplos na menor classe
+        min_class_count = int(np.bincount(y).min())
+        n_splits = max(2, min(self.cv, min_class_count))
+        return StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=self.random_state)
+
+    def fit(self, X, y):
+        y = np.asarray(y)
+        self.classes_ = np.unique(y)
+        n_classes = len(self.classes_)
+        n_estimators = len(self.estimators)
+
+        splits = list(self._make_cv(y).split(X, y))
+
+        # === 1. PASSADA OOF ÚNICA (estimadores × folds em paralelo) ===
+        fold_results = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_and_predict_fold)(est, X, y, train_idx, test_idx, n_classes)
+            for _, est in self.estimators
+            for train_idx, test_idx in splits
+        )
+
+        oof = np.zeros((len(y), n_estimators * n_classes))
+        for i, (test_idx, probs) in enumerate(fold_results):
+            est_idx = i // len(splits)
+            oof[test_idx, est_idx * n_classes:(est_idx + 1) * n_classes] = probs
+
+        self.oof_predictions_ = oof
+
+        # === 2. ACURÁCIA CV A PARTIR DAS MESMAS PREDIÇÕES OOF ===
+        # Só o meta-learner (barato) é re-treinado por fold
+        stacked_pred = cross_val_predict(clone(self.final_estimator), oof, y, cv=splits)
+        self.cv_scores_ = np.array([
+            np.mean(stacked_pred[test_idx] == y[test_idx])
+            for _, test_idx in splits
+        ])
+
+        # === 3. META-LEARNER E ESTIMADORES FINAIS ===
+        self.final_estimator_ = clone(self.final_estimator).fit(oof, y)
+
+        self.estimators_ = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_full)(est, X, y) for _, est in self.estimators
+        )
+        self.named_estimators_ = {
+            name: fitted for (name, _), fitted in zip(self.estimators, self.estimators_)
+        }
+
+        return self
+
+    def _meta_features(self, X) -> np.ndarray:
+        check_is_fitted(self, 'estimators_')
+        n_classes = len(self.classes_)
+        features = np.zeros((X.shape[0], len(self.estimators_) * n_classes))
+
+        for i, est in enumerate(self.estimators_):
+            features[:, i * n_classes:(i + 1) * n_classes] = est.predict_proba(X)
+
+        return features
+
+    def predict_proba(self, X) -> np.ndarray:
+        return self.final_estimator_.predict_proba(self._meta_features(X))
+
+    def predict(self, X) -> np.ndarray:
+        return self.final_estimator_.predict(self._meta_features(X))
@@ -0,0 +1,154 @@
+"""
+Recurring Detector - Detecção de Pagamentos Recorrentes
+==========================================================
+
+Detecta assinaturas e contas fixas em O(n log n):
+
+1. Chave de estabelecimento normalizada (merchant_normalizer) + hash uint64
+2. Faixas de valor com tolerância: dentro de cada estabelecimento, ordenado por
+   valor, uma nova faixa começa quando o salto relativo passa da tolerância
+   (ex.: Netflix R$ 39,90 e R$ 44,90 viram grupos distintos, R$ 55,10 e R$ 55,40 não)
+3. Intervalos entre cobranças calculados em uma única passada ordenada
+   (grupo, data), sobre segmentos contíguos (kernel compilado quando disponível)
+4. Estatísticas por grupo direto dos segmentos, sem groupby
+
+Aceita um frame com vários usuários (coluna `user_id`) para o batch noturno.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Optional
+from src.services.merchant_normalizer import canonicalize_batch
+from src.services.calendar_features import to_days
+from src.services.kernels import segment_interval_stats, sorted_segment_median
+
+# Padrões de frequência: (tipo, rótulo, intervalo mínimo, máximo, desvio máximo em dias)
+FREQUENCIES = (
+    ('recurring_monthly', 'mensal', 28, 32, 5),
+    ('recurring_weekly', 'semanal', 6, 8, 2),
+)
+
+
+def merchant_hashes(descriptions, owners: Optional[pd.Series] = None) -> np.ndarray:
+    """Hash uint64 da chave canônica (opcionalmente combinada com o dono da transação)"""
+    keys = pd.Series(canonicalize_batch(descriptions), dtype=object)
+    empty = (keys.str.len() == 0).to_numpy()
+
+    if owners is not None:
+        keys = owners.astype(str).reset_index(drop=True) + '\x1f' + keys
+
+    hashes = pd.util.hash_array(keys.to_numpy())
+
+    # Descrição vazia não identifica estabelecimento
+    hashes[empty] = 0
+
+    return hashes
+
+
+class RecurringDetector:
+    def __init__(self, amount_tolerance: float = 0.10, min_occurrences: int = 3):
+        self.amount_tolerance = amount_tolerance
+        self.min_occurrences = min_occurrences
+
+    def detect(self, df: pd.DataFrame, user_column: Optional[str] = None) -> List[Dict]:
+        """
+        Detecta pagamentos recorrentes
+
+        Args:
+            df: colunas description, amount, date (e `user_column`, se informado)
+
+        Returns:
+            Lista de assinaturas com frequência, valor médio, confiança e
+            próxima cobrança esperada (data e valor)
+        """
+        if df.empty or 'description' not in df.columns:
+            return []
+
+        owners = df[user_column] if user_column else None
+        frame = pd.DataFrame({
+            'merchant': merchant_hashes(df['description'].fillna(''), owners),
+            'amount': df['amount'].to_numpy(dtype=np.float64),
+            'day': to_days(df['date']).astype(np.int64),
+            'description': df['description'].to_numpy(),
+        })
+        if user_column:
+            frame['user_id'] = df[user_column].to_numpy()
+
+        frame = frame[frame['merchant'] != 0]
+
+        if len(frame) < self.min_occurrences:
+            return []
+
+        # === 1. FAIXAS DE VALOR (ordenado por estabelecimento, valor) ===
+        frame = frame.sort_values(['merchant', 'amount'], kind='mergesort')
+        merchant = frame['merchant'].to_numpy()
+        amount = frame['amount'].to_numpy()
+
+        new_merchant = np.empty(len(frame), dtype=bool)
+        new_merchant[0] = True
+        new_merchant[1:] = merchant[1:] != merchant[:-1]
+
+        prev_amount = np.empty_like(amount)
+        prev_amount[0] = amount[0]
+        prev_amount[1:] = amount[:-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            jump = (amount - prev_amount) / np.abs(prev_amount)
+        new_band = new_merchant | (jump > self.amount_tolerance)
+
+        frame['group'] = np.cumsum(new_band)
+
+        # Faixas são contíguas e ordenadas por valor: mediana pelos elementos centrais
+        band_starts = np.flatnonzero(new_band)
+        band_ends = np.append(band_starts[1:], len(frame))
+        median_amount = sorted_segment_median(amount, band_starts, band_ends)
+
+        # === 2. INTERVALOS (ordenado por grupo, data; mesma ordem de grupos) ===
+        frame = frame.sort_values(['group', 'day'], kind='mergesort')
+        day = frame['day'].to_numpy()
+        amount = frame['amount'].to_numpy()
+
+        n_intervals, mean_interval, std_interval = segment_interval_stats(day, band_starts, band_ends)
+
+        # === 3. ESTATÍSTICAS POR GRUPO (direto dos segmentos) ===
+        n_occurrences = band_ends - band_starts
+
+        stats = pd.DataFrame({
+            'n_occurrences': n_occurrences,
+            'avg_amount': np.add.reduceat(amount, band_starts) / n_occurrences,
+            'median_amount': median_amount,
+            'mean_interval': mean_interval,
+            'std_interval': std_interval,
+            'n_intervals': n_intervals,
+            'last_day': day[band_ends - 1],
+            'description': frame['description'].to_numpy()[band_ends - 1],
+        })
+        if user_column:
+            stats['user_id'] = frame['user_id'].to_numpy()[band_starts]
+
+        stats = stats[(stats['n_occurrences'] >= self.min_occurrences) & (stats['n_intervals'] >= 2)]
+
+        results = []
+        for pattern_type, label, min_interval, max_interval, max_std in FREQUENCIES:
+            matched = stats[
+                stats['mean_interval'].between(min_interval, max_interval) &
+                (stats['std_interval'] < max_std)
+            ]
+
+            for row in matched.itertuples(index=False):
+                last_date = pd.Timestamp(np.datetime64(int(row.last_day), 'D'))
+                result = {
+                    'type': pattern_type,
+                    'description': row.description,
+                    'frequency': label,
+                    'avg_amount': float(row.avg_amount),
+                    'count': int(row.n_occurrences),
+                    'confidence': float(1.0 - (row.std_interval / row.mean_interval)),
+                    'last_date': last_date.date().isoformat(),
+                    'next_expected_date': (last_date + pd.Timedelta(days=round(row.mean_interval))).date().isoformat(),
+                    'next_expected_amount': round(float(row.median_amount), 2),
+                }
+                if user_column:
+                    result['user_id'] = row.user_id
+                results.append(result)
+
+        return results
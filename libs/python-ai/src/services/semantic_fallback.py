@@ -0,0 +1,217 @@
+"""
+Semantic Fallback - Word Vectors para Estabelecimentos Desconhecidos
+======================================================================
+
+Quando nenhum token da descrição existe no vocabulário TF-IDF, o ensemble
+só consegue devolver uma confiança baixa. Este tier resolve esses casos com
+vetores de palavras/subpalavras (fastText/word2vec via gensim):
+
+1. Vetores carregados memory-mapped (read-only, páginas compartilhadas entre workers)
+2. Centroides por categoria pré-calculados e persistidos (.npy, também mmap),
+   recalculados quando o arquivo de vetores (mtime/tamanho) ou os dados-semente mudam
+3. Predição = embedding médio normalizado · centroides (um único produto escalar)
+
+Os vetores são convertidos offline para o formato nativo do gensim com
+`SemanticFallback.convert_vectors`, que grava as matrizes em .npy separados
+(requisito para o mmap).
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+from typing import Optional, List, Dict
+from gensim.models import KeyedVectors
+
+WORD_VECTORS_PATH = "data/models/word_vectors.kv"
+CENTROIDS_PATH = "data/models/category_centroids.npy"
+CENTROID_LABELS_PATH = "data/models/category_centroids.json"
+
+# Similaridade de cosseno mínima para aceitar a categoria
+SIMILARITY_THRESHOLD = 0.45
+
+# Diferença mínima entre top-1 e top-2 (evita aceitar empates entre centroides)
+MIN_MARGIN = 0.02
+
+
+class SemanticFallback:
+    def __init__(
+        self,
+        vectors_path: str = WORD_VECTORS_PATH,
+        centroids_path: str = CENTROIDS_PATH,
+        labels_path: str = CENTROID_LABELS_PATH,
+        threshold: float = SIMILARITY_THRESHOLD,
+    ):
+        self.vectors_path = vectors_path
+        self.centroids_path = centroids_path
+        self.labels_path = labels_path
+        self.threshold = threshold
+
+        self.vectors: Optional[KeyedVectors] = None
+        self.centroids: Optional[np.ndarray] = None
+        self.labels: List[str] = []
+
+    @property
+    def is_available(self) -> bool:
+        return self.vectors is not None and self.centroids is not None
+
+    def _signature(self, initial_data: Optional[Dict[str, List[str]]]) -> Dict:
+        """Versão dos insumos dos centroides: stat do arquivo de vetores + hash dos dados-semente"""
+        stat = os.stat(self.vectors_path)
+        seed = None
+
+        if initial_data:
+            payload = json.dumps(initial_data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+            seed = hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+        return {'vectors_mtime_ns': stat.st_mtime_ns, 'vectors_size': stat.st_size, 'seed': seed}
+
+    def _stored_signature(self) -> Optional[Dict]:
+        """Assinatura gravada junto dos rótulos (None se ausente ou em formato antigo)"""
+        if not (os.path.exists(self.centroids_path) and os.path.exists(self.labels_path)):
+            return None
+
+        with open(self.labels_path, encoding='utf-8') as f:
+            stored = json.load(f)
+
+        return stored.get('signature') if isinstance(stored, dict) else None
+
+    def _centroids_stale(self, signature: Dict) -> bool:
+        stored = self._stored_signature()
+
+        if stored is None:
+            return True
+
+        # Sem dados-semente na chamada, só os vetores podem ser conferidos
+        if signature['seed'] is None:
+            return any(stored.get(k) != signature[k] for k in ('vectors_mtime_ns', 'vectors_size'))
+
+        return stored != signature
+
+    def load(self, initial_data: Optional[Dict[str, List[str]]] = None) -> bool:
+        """
+        Carrega vetores e centroides em modo memory-mapped
+        Centroides ausentes ou desatualizados (vetores ou `initial_data` mudaram
+        desde o cálculo) são recalculados a partir de `initial_data`
+        """
+        if not os.path.exists(self.vectors_path):
+            print(f"ℹ️ Vetores de palavras não encontrados ({self.vectors_path}). Fallback semântico desativado.")
+            return False
+
+        try:
+            self.vectors = KeyedVectors.load(self.vectors_path, mmap='r')
+
+            signature = self._signature(initial_data)
+
+            if self._centroids_stale(signature):
+                if not initial_data:
+                    self.vectors = None
+                    return False
+                self.build_centroids(initial_data, signature)
+
+            self.centroids = np.load(self.centroids_path, mmap_mode='r')
+            with open(self.labels_path, encoding='utf-8') as f:
+                self.labels = json.load(f)['labels']
+
+            print(f"✅ Fallback semântico carregado ({len(self.labels)} centroides, dim={self.centroids.shape[1]}).")
+            return True
+
+        except Exception as e:
+            print(f"Erro ao carregar fallback semântico: {e}")
+            self.vectors = None
+            self.centroids = None
+            return False
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        """Embedding médio normalizado dos tokens (None se nenhum token for conhecido)"""
+        tokens = [t for t in text.split() if t in self.vectors]
+
+        if not tokens:
+            return None
+
+        vector = self.vectors.get_mean_vector(tokens, pre_normalize=True, post_normalize=True)
+
+        if not np.any(vector):
+            return None
+
+        return vector
+
+    def build_centroids(self, initial_data: Dict[str, List[str]], signature: Optional[Dict] = None) -> None:
+        """Calcula e persiste o centroide (normalizado) de cada categoria, com a assinatura dos insumos"""
+        if signature is None:
+            signature = self._signature(initial_data)
+
+        labels = []
+        centroids = []
+
+        for category, keywords in initial_data.items():
+            vectors = [v for v in (self._embed(k) for k in keywords) if v is not None]
+
+            if not vectors:
+                continue
+
+            centroid = np.mean(vectors, axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+            labels.append(category)
+
+        np.save(self.centroids_path, np.asarray(centroids, dtype=np.float32))
+        with open(self.labels_path, 'w', encoding='utf-8') as f:
+            json.dump({'labels': labels, 'signature': signature}, f, ensure_ascii=False)
+
+        print(f"✅ Centroides semânticos calculados para {len(labels)} categorias.")
+
+    def predict(self, text: str) -> Optional[Dict]:
+        """
+        Categoria mais próxima por similaridade de cosseno
+
+        Returns:
+            Dict com category, confidence (cosseno), threshold, alternatives e accepted
+            ou None se o texto não tiver nenhum token com vetor
+        """
+        if not self.is_available:
+            return None
+
+        vector = self._embed(text)
+
+        if vector is None:
+            return None
+
+        similarities = self.centroids @ vector
+
+        top_indices = np.argsort(similarities)[::-1][:3]
+        alternatives = [
+            {"category": self.labels[i], "probability": float(similarities[i])}
+            for i in top_indices
+        ]
+
+        confidence = float(similarities[top_indices[0]])
+        margin = confidence - float(similarities[top_indices[1]]) if len(top_indices) > 1 else confidence
+        accepted = confidence > self.threshold and margin >= MIN_MARGIN
+
+        return {
+            "category": self.labels[top_indices[0]] if accepted else None,
+            "confidence": confidence,
+            "threshold": self.threshold,
+            "alternatives": alternatives,
+            "accepted": accepted,
+            "method": "semantic",
+        }
+
+    @staticmethod
+    def convert_vectors(source_path: str, dest_path: str = WORD_VECTORS_PATH, limit: Optional[int] = None) -> None:
+        """
+        Converte vetores pré-treinados para o formato nativo mmap-ável
+
+        Aceita modelos fastText (.bin, com subpalavras para OOV) ou word2vec (.vec/.txt).
+        `limit` restringe o vocabulário às N palavras mais frequentes (word2vec).
+        """
+        if source_path.endswith('.bin'):
+            from gensim.models.fasttext import load_facebook_vectors
+            vectors = load_facebook_vectors(source_path)
+        else:
+            vectors = KeyedVectors.load_word2vec_format(source_path, binary=False, limit=limit)
+
+        os.makedirs(os.path.dirname(dest_path) or '.', exist_ok=True)
+        # Arrays grandes vão para .npy separados, permitindo mmap no load
+        vectors.save(dest_path, sep_limit=0)
+        print(f"✅ Vetores convertidos: {len(vectors.index_to_key)} palavras, dim={vectors.vector_size}.")
@@ -0,0 +1,264 @@
+"""
+Spending Aggregates - Agregados Corridos de Gastos por Usuário
+=================================================================
+
+Estado compacto que permite gerar os insights de tendência, concentração,
+sazonalidade e semana econômica sem reprocessar o histórico completo:
+
+- Chaves das transações já incorporadas (uint64 ordenado, ver
+  transaction_keys) dos últimos KEY_WINDOW_DAYS dias antes do watermark:
+  reenvios, linhas retroativas e importações atrasadas dentro da janela são
+  decididos pela chave, não pela data
+- Watermark: data da transação mais recente já incorporada; linhas anteriores
+  à janela (watermark - KEY_WINDOW_DAYS) são ignoradas, então o conjunto de
+  chaves não cresce com o histórico
+- Soma mensal de despesas
+- Totais por categoria (quantidade, soma, soma dos quadrados)
+- Histograma log-espaçado de valores por categoria (mediana/MAD aproximados)
+- Buckets diários das últimas RECENT_WEEKS semanas
+- Soma/quantidade em feriados vs dias normais
+
+O custo de atualização depende do delta recebido e da janela de chaves,
+não do histórico. Persistido via
+DetectorStore como dicionário simples (`to_state` / `from_state`).
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional, Tuple
+from src.services.calendar_features import to_days
+from src.services.daily_spend import DailySpend
+
+# Versão do formato persistido (estado de outra versão é descartado)
+AGGREGATES_VERSION = 2
+
+# Atraso máximo aceito (dias antes do watermark): chaves mais antigas são descartadas
+KEY_WINDOW_DAYS = 90
+
+# Janela de buckets diários mantida (comparações semanais)
+RECENT_WEEKS = 8
+
+# Histograma de valores: log10 de R$ 0,01 a R$ 1.000.000 (~6% de resolução por bin)
+HIST_LOG_MIN = -2.0
+HIST_LOG_MAX = 6.0
+HIST_BINS = 320
+
+_BIN_EDGES = np.linspace(HIST_LOG_MIN, HIST_LOG_MAX, HIST_BINS + 1)
+_BIN_CENTERS = 10 ** ((_BIN_EDGES[:-1] + _BIN_EDGES[1:]) / 2)
+
+
+def amount_bins(amounts: np.ndarray) -> np.ndarray:
+    """Índice do bin de cada valor (valores fora da faixa vão para as pontas)"""
+    logs = np.log10(np.maximum(np.asarray(amounts, dtype=np.float64), 10 ** HIST_LOG_MIN))
+    bins = ((logs - HIST_LOG_MIN) / (HIST_LOG_MAX - HIST_LOG_MIN) * HIST_BINS).astype(np.int64)
+    return np.clip(bins, 0, HIST_BINS - 1)
+
+
+def histogram_median_mad(hist: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mediana e MAD aproximados de cada linha de histogramas (k, HIST_BINS)
+    Custo O(k * HIST_BINS), independente da quantidade de valores
+    """
+    half = hist.sum(axis=1)[:, None] / 2
+
+    # Mediana: primeiro bin onde a contagem acumulada passa da metade
+    median_idx = (hist.cumsum(axis=1) >= half).argmax(axis=1)
+    median = _BIN_CENTERS[median_idx]
+
+    # MAD: mediana ponderada dos desvios absolutos dos centros dos bins
+    deviation = np.abs(_BIN_CENTERS[None, :] - median[:, None])
+    order = np.argsort(deviation, axis=1, kind='stable')
+    sorted_counts = np.take_along_axis(hist, order, axis=1).cumsum(axis=1)
+    mad_idx = (sorted_counts >= half).argmax(axis=1)
+    mad = np.take_along_axis(deviation, order, axis=1)[np.arange(len(hist)), mad_idx]
+
+    return median, mad
+
+
+class SpendingAggregates:
+    def __init__(self):
+        self.watermark: Optional[pd.Timestamp] = None
+        self.seen_keys = np.empty(0, dtype=np.uint64)
+        self.seen_days = np.empty(0, dtype='datetime64[D]')  # Data de cada chave (alinhado a seen_keys)
+        self.n_expenses = 0
+
+        # Índice: Period mensal
+        self.monthly = pd.Series(dtype=np.float64)
+
+        # Índice: categoria
+        self.categories = pd.DataFrame({
+            'count': pd.Series(dtype=np.int64),
+            'sum': pd.Series(dtype=np.float64),
+            'sum_sq': pd.Series(dtype=np.float64),
+        })
+        self.histograms: Dict[str, np.ndarray] = {}
+
+        # Índice: dia (inteiro desde a epoch)
+        self.daily = pd.DataFrame({
+            'amount': pd.Series(dtype=np.float64),
+            'count': pd.Series(dtype=np.int64),
+        })
+
+        # [soma, quantidade]
+        self.holiday = np.zeros(2)
+        self.normal = np.zeros(2)
+
+    @classmethod
+    def from_state(cls, state: Optional[Dict]) -> 'SpendingAggregates':
+        """Reconstrói a partir do estado persistido (ou vazio)"""
+        aggregates = cls()
+
+        if state is None or state.get('version') != AGGREGATES_VERSION:
+            return aggregates
+
+        aggregates.watermark = state['watermark']
+        aggregates.seen_keys = state['seen_keys']
+        aggregates.seen_days = state['seen_days']
+        aggregates.n_expenses = state['n_expenses']
+        aggregates.monthly = state['monthly']
+        aggregates.categories = state['categories']
+        aggregates.histograms = dict(state['histograms'])
+        aggregates.daily = state['daily']
+        aggregates.holiday = state['holiday']
+        aggregates.normal = state['normal']
+
+        return aggregates
+
+    def to_state(self) -> Dict:
+        return {
+            'version': AGGREGATES_VERSION,
+            'watermark': self.watermark,
+            'seen_keys': self.seen_keys,
+            'seen_days': self.seen_days,
+            'n_expenses': self.n_expenses,
+            'monthly': self.monthly,
+            'categories': self.categories,
+            'histograms': self.histograms,
+            'daily': self.daily,
+            'holiday': self.holiday,
+            'normal': self.normal,
+        }
+
+    def key_cutoff(self) -> Optional[np.datetime64]:
+        """Primeiro dia da janela de chaves (None antes da primeira atualização)"""
+        if self.watermark is None:
+            return None
+
+        return to_days([self.watermark])[0] - np.timedelta64(KEY_WINDOW_DAYS, 'D')
+
+    def unseen(self, keys: np.ndarray) -> np.ndarray:
+        """Máscara das chaves ainda não incorporadas (busca binária nas chaves ordenadas)"""
+        if len(self.seen_keys) == 0:
+            return np.ones(len(keys), dtype=bool)
+
+        positions = np.minimum(np.searchsorted(self.seen_keys, keys), len(self.seen_keys) - 1)
+        return self.seen_keys[positions] != keys
+
+    def update(self, expenses: pd.DataFrame, latest_date: pd.Timestamp, keys: np.ndarray, days: np.ndarray) -> None:
+        """
+        Incorpora um delta de despesas e registra as chaves incorporadas
+        (só as da janela de atraso: chaves anteriores a key_cutoff são descartadas)
+
+        Args:
+            expenses: despesas novas (colunas amount, date, category_name,
+                is_holiday — ver AnalyzerService._prepare_dataframe)
+            latest_date: data mais recente do delta (inclui receitas)
+            keys: chaves de todas as transações do delta (inclui receitas)
+            days: data (datetime64[D]) de cada chave
+        """
+        if self.watermark is None or latest_date > self.watermark:
+            self.watermark = latest_date
+
+        # Janela de chaves: custo proporcional à janela + delta, não ao histórico
+        keys = np.concatenate([self.seen_keys, np.asarray(keys, dtype=np.uint64)])
+        days = np.concatenate([self.seen_days, np.asarray(days, dtype='datetime64[D]')])
+        keys, first = np.unique(keys, return_index=True)
+        days = days[first]
+
+        in_window = days >= self.key_cutoff()
+        self.seen_keys = keys[in_window]
+        self.seen_days = days[in_window]
+
+        if expenses.empty:
+            return
+
+        amounts = expenses['amount'].astype(np.float64)
+        categories = expenses['category_name']
+
+        self.n_expenses += len(expenses)
+
+        # Soma mensal
+        monthly = amounts.groupby(expenses['date'].dt.to_period('M')).sum()
+        self.monthly = self.monthly.add(monthly, fill_value=0).sort_index()
+
+        # Totais por categoria
+        category_delta = pd.DataFrame({'amount': amounts, 'amount_sq': amounts ** 2}).groupby(categories, observed=True).agg(
+            count=('amount', 'size'),
+            sum=('amount', 'sum'),
+            sum_sq=('amount_sq', 'sum'),
+        )
+        self.categories = self.categories.add(category_delta, fill_value=0)
+        self.categories['count'] = self.categories['count'].astype(np.int64)
+
+        # Histogramas: um único bincount sobre (categoria, bin)
+        codes, names = pd.factorize(categories)
+        flat = codes * HIST_BINS + amount_bins(amounts.to_numpy())
+        counts = np.bincount(flat, minlength=len(names) * HIST_BINS).reshape(len(names), HIST_BINS)
+
+        for name, row in zip(names, counts):
+            previous = self.histograms.get(name)
+            self.histograms[name] = row if previous is None else previous + row
+
+        # Buckets diários (apenas a janela recente)
+        days = pd.Series(to_days(expenses['date']).astype(np.int64), index=expenses.index)
+        daily_delta = pd.DataFrame({'amount': amounts, 'count': 1}).groupby(days).sum()
+        daily = self.daily.add(daily_delta, fill_value=0)
+        self.daily = daily[daily.index >= daily.index.max() - RECENT_WEEKS * 7].astype({'count': np.int64})
+
+        # Feriados vs dias normais
+        holiday_mask = expenses['is_holiday'].to_numpy() == 1
+        self.holiday = self.holiday + [amounts[holiday_mask].sum(), holiday_mask.sum()]
+        self.normal = self.normal + [amounts[~holiday_mask].sum(), (~holiday_mask).sum()]
+
+    def category_baseline(self) -> pd.DataFrame:
+        """
+        Estatísticas robustas por categoria (índice: categoria)
+        count, mean, std (populacional), median e mad aproximados pelo histograma
+        """
+        if not self.histograms:
+            return pd.DataFrame(columns=['count', 'mean', 'std', 'median', 'mad'])
+
+        names = list(self.histograms)
+        median, mad = histogram_median_mad(np.vstack([self.histograms[name] for name in names]))
+
+        totals = self.categories.loc[names]
+        mean = totals['sum'] / totals['count']
+        variance = (totals['sum_sq'] / totals['count'] - mean ** 2).clip(lower=0)
+
+        return pd.DataFrame({
+            'count': totals['count'].to_numpy(),
+            'mean': mean.to_numpy(),
+            'std': np.sqrt(variance.to_numpy()),
+            'median': median,
+            'mad': mad,
+        }, index=pd.Index(names, name='category_name'))
+
+    def week_totals(self) -> Optional[Dict[str, float]]:
+        """
+        Gasto dos últimos 7 dias vs os 7 anteriores, relativo à despesa mais recente
+        None se alguma das duas semanas não tiver despesas
+        """
+        daily = DailySpend.from_days(
+            self.daily.index.to_numpy(),
+            self.daily['amount'].to_numpy(),
+            self.daily['count'].to_numpy(),
+        )
+        week_totals = daily.compare(7)
+
+        if week_totals is None:
+            return None
+
+        return {
+            'last_week': week_totals[0],
+            'prev_week': week_totals[1],
+        }
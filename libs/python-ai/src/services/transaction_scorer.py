@@ -0,0 +1,260 @@
+"""
+Transaction Scorer - Score de Anomalia em Tempo Real
+=======================================================
+
+Avalia uma única transação recém-criada sem reprocessar o histórico, a partir
+de sketches por usuário e categoria atualizados a cada chamada:
+
+- Média/variância corridas (Welford)
+- Histograma log-espaçado de valores (mediana/MAD e percentil aproximados)
+- Perfil por dia da semana (quantidade de despesas em cada dia)
+
+O custo por transação é fixo (HIST_BINS + 7 posições), independente do
+tamanho do histórico. Estado persistido via DetectorStore ('sketches'), com
+os ids das últimas MAX_APPLIED_IDS transações incorporadas: o update é
+idempotente (retentativas do cliente não contam a transação duas vezes).
+"""
+
+import zlib
+import threading
+import numpy as np
+from typing import Dict, List, Optional
+from src.models.schemas import TransactionInput
+from src.services.detector_store import DetectorStore
+from src.services.spending_aggregates import HIST_BINS, amount_bins, histogram_median_mad
+
+# Versão do formato persistido (estado de outra versão é descartado)
+SKETCHES_VERSION = 1
+
+# Histórico mínimo da categoria para avaliar o valor (mesmo do /insights/incremental)
+MIN_CATEGORY_HISTORY = 3
+
+# Dia da semana raro: menos de 3% das despesas da categoria, com pelo menos 20 despesas
+MIN_WEEKDAY_HISTORY = 20
+RARE_WEEKDAY_SHARE = 0.03
+
+# Categoria nova só é sinalizada para usuários com histórico
+MIN_USER_HISTORY = 20
+
+# Peso de cada sinal secundário no score combinado (sozinhos não passam de 0.5)
+RARE_WEEKDAY_WEIGHT = 0.3
+NEW_CATEGORY_WEIGHT = 0.3
+
+# Ids de transações já incorporadas mantidos por usuário (os mais antigos saem primeiro)
+MAX_APPLIED_IDS = 10000
+
+# Locks por faixa de usuário (atualizações do mesmo usuário são serializadas)
+LOCK_STRIPES = 64
+
+WEEKDAY_NAMES = ['segunda-feira', 'terça-feira', 'quarta-feira', 'quinta-feira', 'sexta-feira', 'sábado', 'domingo']
+
+
+def _empty_sketch() -> Dict:
+    return {
+        'count': 0,
+        'mean': 0.0,
+        'm2': 0.0,
+        'hist': np.zeros(HIST_BINS, dtype=np.int64),
+        'weekdays': np.zeros(7, dtype=np.int64),
+    }
+
+
+class TransactionScorer:
+    def __init__(self, detector_store: DetectorStore, category_thresholds: Dict[str, Dict[str, float]]):
+        self.detector_store = detector_store
+        self.category_thresholds = category_thresholds
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def _lock(self, user_id: str) -> threading.Lock:
+        return self._locks[zlib.crc32(str(user_id).encode('utf-8')) % LOCK_STRIPES]
+
+    def _load(self, user_id: str) -> Dict:
+        state = self.detector_store.load(user_id, 'sketches')
+
+        if state is None or state.get('version') != SKETCHES_VERSION:
+            return {'version': SKETCHES_VERSION, 'n_expenses': 0, 'categories': {}, 'applied_ids': {}}
+
+        state.setdefault('applied_ids', {})
+        return state
+
+    @staticmethod
+    def _remember_applied(applied_ids: Dict[str, None], transaction_id: str) -> None:
+        """Registra o id incorporado (dict ordenado por inserção, limitado a MAX_APPLIED_IDS)"""
+        applied_ids[transaction_id] = None
+
+        while len(applied_ids) > MAX_APPLIED_IDS:
+            del applied_ids[next(iter(applied_ids))]
+
+    def score(self, user_id: str, transaction_id: str, transaction: TransactionInput, update: bool = True) -> Dict:
+        """
+        Score de anomalia de uma transação contra os sketches do usuário
+
+        Args:
+            user_id: usuário dono da transação
+            transaction_id: id estável da transação (chave de idempotência do update)
+            transaction: transação recém-criada
+            update: incorpora a transação aos sketches após avaliar (ignorado
+                se o id já foi incorporado)
+
+        Returns:
+            anomaly_score (0-1, anômala a partir de 0.5), motivo principal,
+            todos os motivos e as estatísticas usadas na decisão
+        """
+        if transaction.type != 'EXPENSE':
+            return {
+                'anomaly_score': 0.0,
+                'is_anomaly': False,
+                'reason': 'Apenas despesas são avaliadas',
+                'reasons': [],
+                'percentile': None,
+                'category_median': None,
+                'threshold': None,
+                'history_count': 0,
+                'updated': False,
+            }
+
+        amount = float(transaction.amount)
+        category = transaction.category_name
+        weekday = transaction.date.weekday()
+
+        with self._lock(user_id):
+            state = self._load(user_id)
+            sketch = state['categories'].get(category)
+
+            result = self._evaluate(sketch, state['n_expenses'], category, amount, weekday)
+            result['updated'] = False
+
+            if update and transaction_id not in state['applied_ids']:
+                if sketch is None:
+                    sketch = state['categories'][category] = _empty_sketch()
+                self._add(sketch, amount, weekday)
+                state['n_expenses'] += 1
+                self._remember_applied(state['applied_ids'], transaction_id)
+                self.detector_store.save(user_id, 'sketches', state)
+                result['updated'] = True
+
+        return result
+
+    def _evaluate(self, sketch: Optional[Dict], n_expenses: int, category: str, amount: float, weekday: int) -> Dict:
+        count = 0 if sketch is None else sketch['count']
+        reasons = []
+        amount_score = 0.0
+        weekday_score = 0.0
+        new_category_score = 0.0
+        percentile = None
+        median = None
+        threshold = None
+
+        if count == 0:
+            if n_expenses >= MIN_USER_HISTORY:
+                new_category_score = NEW_CATEGORY_WEIGHT
+                reasons.append(f"Primeiro gasto em '{category}'")
+
+        elif count >= MIN_CATEGORY_HISTORY:
+            hist = sketch['hist']
+            median_arr, mad_arr = histogram_median_mad(hist[None, :])
+            median = float(median_arr[0])
+            mad = float(mad_arr[0])
+            std = float(np.sqrt(sketch['m2'] / count))
+
+            factor = self.category_thresholds.get(category, self.category_thresholds['default'])['outlier_factor']
+
+            # Mesmo critério de _detect_outliers_statistical; z robusto > factor ⇔ valor > threshold
+            if mad > 0:
+                threshold = median + factor * mad / 0.6745
+                z = 0.6745 * (amount - median) / mad
+            else:
+                threshold = sketch['mean'] + factor * std
+                z = (amount - sketch['mean']) / std if std > 0 else 0.0
+
+            # 0.5 exatamente no threshold, tendendo a 1 para desvios maiores
+            amount_score = z / (z + factor) if z > 0 else 0.0
+
+            # Percentil aproximado: bins abaixo + metade do bin do valor
+            bin_idx = int(amount_bins(np.array([amount]))[0])
+            percentile = float((hist[:bin_idx].sum() + hist[bin_idx] / 2) / count)
+
+            if amount > threshold:
+                reasons.append(
+                    f"R$ {amount:.2f} está {(amount - median) / median * 100:+.0f}% acima da mediana "
+                    f"de '{category}' (R$ {median:.2f})"
+                )
+
+            if count >= MIN_WEEKDAY_HISTORY and sketch['weekdays'][weekday] / count < RARE_WEEKDAY_SHARE:
+                weekday_score = RARE_WEEKDAY_WEIGHT
+                reasons.append(f"Gastos em '{category}' raramente ocorrem em {WEEKDAY_NAMES[weekday]}")
+
+        # Sinais combinados como probabilidades independentes
+        anomaly_score = 1 - (1 - amount_score) * (1 - weekday_score) * (1 - new_category_score)
+
+        if count < MIN_CATEGORY_HISTORY and not reasons:
+            reason = f"Histórico insuficiente em '{category}' ({count} despesas)"
+        elif reasons:
+            reason = reasons[0]
+        else:
+            reason = f"Dentro do padrão de '{category}'"
+
+        return {
+            'anomaly_score': round(anomaly_score, 4),
+            'is_anomaly': anomaly_score >= 0.5,
+            'reason': reason,
+            'reasons': reasons,
+            'percentile': None if percentile is None else round(percentile, 4),
+            'category_median': None if median is None else round(median, 2),
+            'threshold': None if threshold is None else round(threshold, 2),
+            'history_count': count,
+        }
+
+    @staticmethod
+    def _add(sketch: Dict, amount: float, weekday: int) -> None:
+        """Incorpora um valor ao sketch (in place)"""
+        sketch['count'] += 1
+        delta = amount - sketch['mean']
+        sketch['mean'] += delta / sketch['count']
+        sketch['m2'] += delta * (amount - sketch['mean'])
+        sketch['hist'][amount_bins(np.array([amount]))[0]] += 1
+        sketch['weekdays'][weekday] += 1
+
+    def rebuild(self, user_id: str, transactions: List[TransactionInput]) -> Dict[str, int]:
+        """
+        Reconstrói os sketches do usuário a partir do histórico completo
+        (carga inicial; substitui o estado existente)
+
+        Returns:
+            quantidade de despesas e de categorias incorporadas
+        """
+        expenses = [t for t in transactions if t.type == 'EXPENSE']
+        categories: Dict[str, Dict] = {}
+
+        # Despesas com id de origem contam como já incorporadas
+        applied_ids: Dict[str, None] = {}
+        for t in expenses:
+            if t.id is not None:
+                self._remember_applied(applied_ids, t.id)
+
+        if expenses:
+            amounts = np.fromiter((t.amount for t in expenses), dtype=np.float64, count=len(expenses))
+            weekdays = np.fromiter((t.date.weekday() for t in expenses), dtype=np.int64, count=len(expenses))
+            names = np.array([t.category_name for t in expenses], dtype=object)
+            bins = amount_bins(amounts)
+
+            for name in dict.fromkeys(names):
+                mask = names == name
+                values = amounts[mask]
+                categories[name] = {
+                    'count': int(mask.sum()),
+                    'mean': float(values.mean()),
+                    'm2': float(((values - values.mean()) ** 2).sum()),
+                    'hist': np.bincount(bins[mask], minlength=HIST_BINS).astype(np.int64),
+                    'weekdays': np.bincount(weekdays[mask], minlength=7).astype(np.int64),
+                }
+
+        with self._lock(user_id):
+            self.detector_store.save(user_id, 'sketches', {
+                'version': SKETCHES_VERSION,
+                'n_expenses': len(expenses),
+                'categories': categories,
+                'applied_ids': applied_ids,
+            })
+
+        return {'expenses': len(expenses), 'categories': len(categories)}
@@ -11,6 +11,10 @@ import os
 from datetime import datetime, timedelta
 from typing import List, Dict
 import json
+import numpy as np
+import tempfile
+import threading
+import time
 
 # Adiciona o diretório src ao path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
@@ -21,6 +25,13 @@ from src.services.forecaster import ForecasterService
 from src.services.categorizer import CategorizerService
 from src.services.analyzer import AnalyzerService
 from src.services.forecaster import ForecasterService
+from src.services.analyzer import transactions_fingerprint
+from src.services.detector_store import DetectorStore
+from src.services.oof_stacking import OutOfFoldStackingClassifier
+import src.services.kernels as kernels
+from src.services.merchant_normalizer import canonicalize, canonicalize_batch
+from src.services.batch_input import BATCH_INPUT_DIR, read_users_file
+from src.services.cohort_benchmarks import build_cohort_benchmarks
 from src.models.schemas import TransactionInput
 
 
@@ -316,6 +327,474 @@ def test_forecaster():
     return v2_in_range or has_confidence_interval
 
 
+def test_merchant_normalizer():
+    """Testa a chave canônica de estabelecimento (merchant_normalizer)"""
+    print_header("TESTE 4: MERCHANT NORMALIZER - Chave Canônica")
+
+    cases = {
+        "IFOOD *REST 1234 SAO PAULO": "ifood rest",
+        "IFOOD *REST 9876": "ifood rest",
+        "PAG*UBER TRIP 12/03 PARC 03/12": "uber trip",
+        "LOJA X RIO DE JANEIRO": "loja x",
+        "99FOOD": "99food",
+        "99FOOD *PEDIDO 4821": "99food pedido",
+        "DROGARIA SAO PAULO": "drogaria sao paulo",
+        "Pizzaria Santos": "pizzaria santos",
+        "PADARIA REAL SP BR": "padaria real",
+        "---": "---",
+    }
+
+    batch = canonicalize_batch(list(cases))
+    passed = True
+
+    for (text, expected), batch_key in zip(cases.items(), batch):
+        key = canonicalize(text)
+
+        if key == expected and batch_key == expected:
+            print_success(f"{text!r} → {key!r}")
+        else:
+            print_error(f"{text!r} → {key!r} / batch {batch_key!r} (esperado {expected!r})")
+            passed = False
+
+    return passed
+
+
+def test_incremental_late_rows():
+    """Testa a análise incremental com linhas retroativas e reenvios"""
+    print_header("TESTE 5: INCREMENTAL - Linhas Atrasadas e Reenvios")
+
+    base_date = datetime(2024, 3, 1)
+
+    def expense(day: int, amount: float) -> TransactionInput:
+        return TransactionInput(
+            amount=amount,
+            date=base_date + timedelta(days=day),
+            category_name="Alimentação",
+            type="EXPENSE",
+        )
+
+    first = [expense(day, 40 + day) for day in range(10, 40)]
+    # Segundo delta com datas ANTERIORES às do primeiro (importação atrasada)
+    late = [expense(day, 30 + day) for day in range(0, 10)]
+    # Dois cafés idênticos no mesmo dia
+    coffees = [expense(45, 8.5), expense(45, 8.5)]
+    # Importação muito atrasada: anterior à janela de atraso a partir do dia 250
+    ahead = [expense(250, 60.0)]
+    too_late = [expense(100, 20.0), expense(200, 20.0)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analyzer = AnalyzerService(detector_store=DetectorStore(tmp_dir), max_workers=1)
+
+        r1 = analyzer.analyze_spending_incremental("user_late", first)
+        r2 = analyzer.analyze_spending_incremental("user_late", late)
+        r3 = analyzer.analyze_spending_incremental("user_late", first + late)
+        r4 = analyzer.analyze_spending_incremental("user_late", coffees)
+        analyzer.analyze_spending_incremental("user_late", ahead)
+        r5 = analyzer.analyze_spending_incremental("user_late", too_late)
+        state = analyzer.detector_store.load("user_late", 'aggregates')
+
+    checks = [
+        (r1['ingested'] == 30, f"Primeiro delta: {r1['ingested']} incorporadas (esperado 30)"),
+        (r2['ingested'] == 10 and r2['skipped'] == 0, f"Delta retroativo: {r2['ingested']} incorporadas, {r2['skipped']} ignoradas (esperado 10/0)"),
+        (r3['ingested'] == 0 and r3['skipped'] == 40, f"Reenvio completo: {r3['ingested']} incorporadas, {r3['skipped']} ignoradas (esperado 0/40)"),
+        (r4['ingested'] == 2, f"Cafés idênticos: {r4['ingested']} incorporados (esperado 2)"),
+        (r4['total_expenses'] == 42, f"Total de despesas: {r4['total_expenses']} (esperado 42)"),
+        (r5['expired'] == 1 and r5['ingested'] == 1, f"Fora da janela: {r5['expired']} ignoradas, {r5['ingested']} incorporadas (esperado 1/1)"),
+        (len(state['seen_keys']) == 2, f"Chaves guardadas: {len(state['seen_keys'])} (esperado 2, só a janela)"),
+    ]
+
+    for ok, message in checks:
+        (print_success if ok else print_error)(message)
+
+    return all(ok for ok, _ in checks)
+
+
+def test_fingerprint_cache():
+    """Testa o cache de insights por impressão digital do conjunto de transações"""
+    print_header("TESTE 6: CACHE - Impressão Digital das Transações")
+
+    base_date = datetime(2024, 1, 1)
+    transactions = [
+        TransactionInput(
+            amount=20 + (i % 13) * 7.5,
+            date=base_date + timedelta(days=i),
+            category_name=["Alimentação", "Transporte", "Lazer"][i % 3],
+            type="EXPENSE",
+            description=f"Loja {i % 5}",
+        )
+        for i in range(60)
+    ]
+    shuffled = transactions[::-1]
+    changed = transactions[:-1] + [transactions[-1].model_copy(update={'amount': transactions[-1].amount + 0.01})]
+    duplicated = transactions + [transactions[0]]
+
+    same_order = transactions_fingerprint(transactions) == transactions_fingerprint(shuffled)
+    distinct = len({
+        transactions_fingerprint(transactions),
+        transactions_fingerprint(changed),
+        transactions_fingerprint(duplicated),
+    }) == 3
+
+    analyzer = AnalyzerService(max_workers=1)
+    analyzer.analyze_spending(transactions)   # miss
+    analyzer.analyze_spending(shuffled)       # hit: mesma coleção em outra ordem
+    analyzer.analyze_spending(changed)        # miss: um centavo de diferença
+
+    # Alterar uma resposta não pode alterar o que o cache devolve depois
+    first = analyzer.analyze_full(transactions)                                  # miss
+    n_insights = len(first['insights'])
+    first['insights'][0].text = 'alterado'
+    first['insights'].clear()
+    first['scores'].clear()
+    second = analyzer.analyze_full(transactions)                                 # hit
+    second['insights'][0].score = -1
+    third = analyzer.analyze_full(transactions)                                  # hit
+
+    isolated = (
+        len(second['insights']) == n_insights > 0
+        and second['insights'][0].text != 'alterado'
+        and third['insights'][0].score != -1
+        and len(third['scores']) > 0
+    )
+
+    checks = [
+        (same_order, "Mesma impressão digital independente da ordem"),
+        (distinct, "Valor alterado e duplicata geram impressões digitais diferentes"),
+        (analyzer.insight_cache_hits == 3, f"Hits do cache: {analyzer.insight_cache_hits} (esperado 3)"),
+        (analyzer.insight_cache_misses == 3, f"Misses do cache: {analyzer.insight_cache_misses} (esperado 3)"),
+        (isolated, "Respostas alteradas pelo chamador não alteram o cache"),
+    ]
+
+    for ok, message in checks:
+        (print_success if ok else print_error)(message)
+
+    return all(ok for ok, _ in checks)
+
+
+def test_scorer_idempotency():
+    """Testa que o update do /score-transaction é idempotente por transaction_id"""
+    print_header("TESTE 7: SCORE-TRANSACTION - Idempotência do Update")
+
+    base_date = datetime(2024, 5, 1)
+    history = [
+        TransactionInput(
+            amount=30 + (i % 7) * 4,
+            date=base_date + timedelta(days=i),
+            category_name="Alimentação",
+            type="EXPENSE",
+        )
+        for i in range(40)
+    ]
+    retried = TransactionInput(amount=45.0, date=base_date + timedelta(days=41), category_name="Alimentação", type="EXPENSE")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analyzer = AnalyzerService(detector_store=DetectorStore(tmp_dir), max_workers=1)
+        analyzer.transaction_scorer.rebuild("user_retry", history)
+
+        results = [analyzer.score_transaction("user_retry", "tx_retry", retried) for _ in range(20)]
+        other = analyzer.score_transaction("user_retry", "tx_other", retried)
+        final = analyzer.score_transaction("user_retry", "tx_check", retried, update=False)
+
+    updates = sum(r['updated'] for r in results)
+
+    checks = [
+        (updates == 1, f"20 envios do mesmo id: {updates} update(s) (esperado 1)"),
+        (results[0]['history_count'] == 40, f"Primeiro envio viu {results[0]['history_count']} despesas (esperado 40)"),
+        (other['updated'] and other['history_count'] == 41, f"Outro id incorporado sobre {other['history_count']} despesas (esperado 41)"),
+        (final['history_count'] == 42, f"Histórico final: {final['history_count']} (esperado 42)"),
+    ]
+
+    for ok, message in checks:
+        (print_success if ok else print_error)(message)
+
+    return all(ok for ok, _ in checks)
+
+
+def test_kernels_equivalence():
+    """Testa que as primitivas numba e numpy dão os mesmos resultados"""
+    print_header("TESTE 8: KERNELS - Equivalência numba x numpy")
+
+    if not kernels.NUMBA_AVAILABLE:
+        print_warning("numba não instalado: apenas a implementação numpy está disponível")
+        return True
+
+    rng = np.random.default_rng(7)
+    n = 20000
+    codes = rng.integers(0, 12, n)
+    codes[codes == 5] = 4  # Grupo vazio no meio
+    values = rng.lognormal(3, 0.8, n)
+    days = np.sort(rng.integers(0, 400, n))
+    bounds = np.sort(rng.choice(np.arange(1, n), 50, replace=False))
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [n]])
+    offsets = rng.integers(0, 400, n)
+
+    cases = {
+        'group_robust_stats': lambda: kernels.group_robust_stats(codes, values, 13),
+        'segment_interval_stats': lambda: kernels.segment_interval_stats(days, starts, ends),
+        'iqr_replace': lambda: (kernels.iqr_replace(np.concatenate([values, [1e6, -1e6]])),),
+        'daily_totals': lambda: kernels.daily_totals(offsets, values, 400),
+    }
+
+    passed = True
+
+    for name, run in cases.items():
+        previous = kernels.USE_NUMBA
+        try:
+            kernels.USE_NUMBA = True
+            compiled = run()
+            kernels.USE_NUMBA = False
+            reference = run()
+        finally:
+            kernels.USE_NUMBA = previous
+
+        same = all(
+            np.allclose(a, b, rtol=1e-9, atol=1e-9, equal_nan=True)
+            for a, b in zip(compiled, reference)
+        )
+
+        if same:
+            print_success(f"{name}: resultados idênticos")
+        else:
+            print_error(f"{name}: numba e numpy divergem")
+            passed = False
+
+    return passed
+
+
+def test_oof_stacking():
+    """Testa o stacking out-of-fold contra o StackingClassifier com CV aninhado (nested_cv)"""
+    print_header("TESTE 9: OOF STACKING - Passada Única x nested_cv")
+
+    from sklearn.datasets import make_classification
+    from sklearn.ensemble import StackingClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import StratifiedKFold, cross_val_score
+    from sklearn.naive_bayes import GaussianNB
+    from sklearn.tree import DecisionTreeClassifier
+
+    X, y = make_classification(n_samples=600, n_features=12, n_informative=6, n_classes=3, random_state=0)
+
+    def estimators():
+        return [
+            ('lr', LogisticRegression(max_iter=1000)),
+            ('nb', GaussianNB()),
+            ('tree', DecisionTreeClassifier(max_depth=4, random_state=0)),
+        ]
+
+    cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
+
+    oof = OutOfFoldStackingClassifier(estimators(), LogisticRegression(max_iter=1000), cv=5, random_state=42).fit(X, y)
+
+    # Mesmos folds internos: meta-features e meta-learner devem coincidir
+    stacking = StackingClassifier(estimators(), LogisticRegression(max_iter=1000), cv=cv, stack_method='predict_proba')
+    stacking.fit(X, y)
+
+    nested_scores = cross_val_score(
+        StackingClassifier(estimators(), LogisticRegression(max_iter=1000), cv=cv, stack_method='predict_proba'),
+        X, y, cv=StratifiedKFold(n_splits=5), scoring='accuracy',
+    )
+
+    prediction_agreement = float(np.mean(oof.predict(X) == stacking.predict(X)))
+    proba_gap = float(np.abs(oof.predict_proba(X) - stacking.predict_proba(X)).max())
+    accuracy_gap = abs(oof.cv_scores_.mean() - nested_scores.mean())
+
+    print_info(f"Acurácia CV: OOF {oof.cv_scores_.mean():.1%} x nested_cv {nested_scores.mean():.1%}")
+
+    checks = [
+        (prediction_agreement == 1.0, f"Predições iguais às do StackingClassifier: {prediction_agreement:.1%}"),
+        (proba_gap < 1e-6, f"Maior diferença de probabilidade: {proba_gap:.2e}"),
+        (accuracy_gap <= 0.03, f"Diferença de acurácia CV: {accuracy_gap:.1%} (tolerância 3%)"),
+    ]
+
+    for ok, message in checks:
+        (print_success if ok else print_error)(message)
+
+    return all(ok for ok, _ in checks)
+
+
+def test_duplicate_detector():
+    """Testa a detecção de duplicatas: hábitos e compras no mesmo dia não são cópias"""
+    print_header("TESTE 10: DUPLICATAS - Cópias x Compras Repetidas")
+
+    analyzer = AnalyzerService(max_workers=1)
+    base_date = datetime(2024, 3, 4)
+    paid_at = base_date.replace(hour=12, minute=31, second=7)
+
+    def expense(amount: float, date: datetime, description: str = None, category: str = "Alimentação", id: str = None) -> TransactionInput:
+        return TransactionInput(amount=amount, date=date, category_name=category, type="EXPENSE", description=description, id=id)
+
+    cases = {
+        "Passagem 2x ao dia por 10 dias": (
+            [expense(4.40, base_date + timedelta(days=d), "METRO SP", "Transporte") for d in range(10) for _ in range(2)], 0),
+        "Dois cafés no mesmo dia (sem horário)": (
+            [expense(7.00, base_date, "CAFE"), expense(7.00, base_date, "CAFE")], 0),
+        "Pedidos iFood diferentes em dias seguidos": (
+            [expense(50.0, base_date, "IFOOD *REST 1234"), expense(50.0, base_date + timedelta(days=1), "IFOOD *REST 9876")], 0),
+        "Mesma linha no mesmo horário": (
+            [expense(89.90, paid_at, "LOJA  X", "Compras"), expense(89.90, paid_at, "loja x", "Compras")], 1),
+        "Mesmo id reimportado com data deslocada": (
+            [expense(10.0, base_date, id="pluggy_1"), expense(10.0, base_date + timedelta(days=1), id="pluggy_1")], 1),
+        "Ids diferentes no mesmo horário": (
+            [expense(89.90, paid_at, "LOJA X", "Compras", id="a"), expense(89.90, paid_at, "LOJA X", "Compras", id="b")], 0),
+    }
+
+    passed = True
+
+    for name, (transactions, expected) in cases.items():
+        expenses = analyzer._prepare_dataframe(transactions, expenses_only=True)
+        found = int(analyzer.duplicate_detector.detect(expenses).sum())
+
+        if found == expected:
+            print_success(f"{name}: {found} cópia(s)")
+        else:
+            print_error(f"{name}: {found} cópia(s) (esperado {expected})")
+            passed = False
+
+    # Por padrão as cópias só são reportadas: nenhuma despesa sai da análise
+    fares = cases["Passagem 2x ao dia por 10 dias"][0] + cases["Mesma linha no mesmo horário"][0]
+    kept, duplicates = analyzer._remove_duplicates(analyzer._prepare_dataframe(fares, expenses_only=True))
+
+    if len(kept) == len(fares) and len(duplicates) == 1:
+        print_success("drop_duplicates desligado por padrão: cópias reportadas, nada removido")
+    else:
+        print_error(f"{len(fares) - len(kept)} despesas removidas com drop_duplicates padrão")
+        passed = False
+
+    return passed
+
+
+def test_forecaster_timeouts():
+    """Testa os prazos dos fits: fila não conta, estouro não derruba outras requisições, pesos renormalizados"""
+    print_header("TESTE 11: FORECASTER - Prazos e Renormalização dos Pesos")
+
+    forecaster = ForecasterService(max_workers=2)
+    passed = True
+
+    # Sem pool pronto os fits rodam no processo, sem prazo
+    start = time.perf_counter()
+    _, _, timed_out, _ = forecaster._fit_members({'frio': (('frio',), time.sleep, (0.2,))})
+
+    if not timed_out and time.perf_counter() - start < 1.0:
+        print_success("Sem pool aquecido: fit no próprio processo, sem esperar o pool subir")
+    else:
+        print_error(f"Requisição esperou o pool subir ({time.perf_counter() - start:.1f}s)")
+        passed = False
+
+    forecaster.start_pool(wait_ready=True)
+
+    # time.sleep como "fit": serializável para o pool e com duração conhecida
+    # 3 fits de 0.5s em 2 processos: o terceiro espera na fila, mas o prazo só conta do início
+    forecaster.model_timeouts = {'a': 0.8, 'b': 0.8, 'c': 0.8}
+    members = {name: (('fila', name), time.sleep, (0.5,)) for name in 'abc'}
+    _, _, timed_out, failed = forecaster._fit_members(members)
+
+    if not timed_out and not failed:
+        print_success("Espera na fila não conta no prazo")
+    else:
+        print_error(f"Fits na fila descartados: {timed_out} {failed}")
+        passed = False
+
+    # Um fit preso estoura o prazo enquanto outra requisição ajusta no mesmo pool
+    forecaster.model_timeouts = {'preso': 0.3, 'vizinho': 5.0}
+    neighbour = {}
+    thread = threading.Thread(target=lambda: neighbour.update(
+        zip(('models', 'durations', 'timed_out', 'failed'),
+            forecaster._fit_members({'vizinho': (('vizinho',), time.sleep, (1.0,))})),
+    ))
+    thread.start()
+    time.sleep(0.1)
+    _, durations, timed_out, _ = forecaster._fit_members({'preso': (('preso',), time.sleep, (30.0,))})
+    thread.join()
+    forecaster.start_pool(wait_ready=True)  # Substituto do pool aposentado (já subindo em segundo plano)
+
+    if timed_out == ['preso'] and durations['preso'] < 1000:
+        print_success(f"Fit preso descartado em {durations['preso']:.0f}ms")
+    else:
+        print_error(f"Fit preso: timed_out={timed_out}, durations={durations}")
+        passed = False
+
+    if 'vizinho' in neighbour['models'] and not neighbour['failed']:
+        print_success("Fit da outra requisição terminou normalmente")
+    else:
+        print_error(f"Fit da outra requisição perdido: {neighbour['failed']}")
+        passed = False
+
+    # Falha no fit é reportada, não some
+    _, _, _, failed = forecaster._fit_members({'erro': (('erro',), time.sleep, (-1,))})
+
+    if 'erro' in failed:
+        print_success(f"Falha reportada: {failed['erro']}")
+    else:
+        print_error("Falha do fit não reportada")
+        passed = False
+
+    # Prophet estoura o prazo: fica fora do ensemble e os pesos dos demais somam 1
+    forecaster.model_timeouts = {'prophet': 0.001}
+    base_date = datetime(2024, 1, 1)
+    transactions = [
+        TransactionInput(amount=50.0 + (day % 7) * 10, date=base_date + timedelta(days=day), category_name="Alimentação", type="EXPENSE")
+        for day in range(120)
+    ]
+    result = forecaster.predict_next_month(transactions)
+    weights = result['model_weights']
+
+    if 'prophet' in result['models_timed_out'] and 'prophet' not in result['models_used'] and abs(sum(weights.values()) - 1) < 1e-9:
+        print_success(f"Prophet descartado por prazo, pesos renormalizados: {weights}")
+    else:
+        print_error(f"Ensemble sem renormalização: timed_out={result['models_timed_out']}, pesos={weights}")
+        passed = False
+
+    renormalized = forecaster._renormalized_weights(['exp_smoothing', 'ridge'])
+
+    if abs(renormalized['exp_smoothing'] - 0.6) < 1e-9 and abs(renormalized['ridge'] - 0.4) < 1e-9:
+        print_success("Pesos 0.15/0.10 renormalizados para 0.6/0.4")
+    else:
+        print_error(f"Renormalização incorreta: {renormalized}")
+        passed = False
+
+    forecaster.shutdown()
+
+    return passed
+
+
+def test_cohort_invalid_lines():
+    """Testa o job dos benchmarks de coorte com uma linha malformada no JSONL"""
+    print_header("TESTE 12: COORTES - Linha Malformada no Arquivo de Entrada")
+
+    base_date = datetime(2024, 1, 1)
+    transactions = [
+        {"amount": 40.0 + day % 5, "date": (base_date + timedelta(days=day)).isoformat(), "category_name": "Alimentação", "type": "EXPENSE"}
+        for day in range(90)
+    ]
+    lines = [
+        json.dumps({"user_id": "u1", "transactions": transactions}),
+        '{"user_id": "u2", "transactions": [',  # JSON truncado
+        json.dumps({"user_id": "u3", "transactions": transactions}),
+    ]
+
+    os.makedirs(BATCH_INPUT_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=BATCH_INPUT_DIR, suffix='.jsonl', delete=False, encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+
+    try:
+        benchmarks = build_cohort_benchmarks(read_users_file(os.path.basename(f.name)))
+    except Exception as e:
+        print_error(f"Linha malformada interrompeu o job: {type(e).__name__}: {e}")
+        return False
+    finally:
+        os.remove(f.name)
+
+    users = int(benchmarks.sketches.get('todos', {}).get('Alimentação', np.zeros(1)).sum())
+
+    if users == 2:
+        print_success("Linha malformada pulada, os 2 usuários válidos entraram nos sketches")
+        return True
+
+    print_error(f"{users} usuários nos sketches (esperado 2)")
+    return False
+
+
 def run_all_tests():
     """Executa todos os testes"""
     print(f"""
@@ -341,6 +820,33 @@ def run_all_tests():
         # Teste 3: Forecaster
         results['forecaster'] = test_forecaster()
 
+        # Teste 4: Merchant Normalizer
+        results['merchant_normalizer'] = test_merchant_normalizer()
+
+        # Teste 5: Análise incremental
+        results['incremental'] = test_incremental_late_rows()
+
+        # Teste 6: Cache por impressão digital
+        results['fingerprint_cache'] = test_fingerprint_cache()
+
+        # Teste 7: Idempotência do score em tempo real
+        results['scorer_idempotency'] = test_scorer_idempotency()
+
+        # Teste 8: Kernels numba x numpy
+        results['kernels'] = test_kernels_equivalence()
+
+        # Teste 9: Stacking OOF x nested_cv
+        results['oof_stacking'] = test_oof_stacking()
+
+        # Teste 10: Duplicatas de importação
+        results['duplicates'] = test_duplicate_detector()
+
+        # Teste 11: Prazos do forecaster
+        results['forecaster_timeouts'] = test_forecaster_timeouts()
+
+        # Teste 12: Linhas malformadas no job de coortes
+        results['cohort_invalid_lines'] = test_cohort_invalid_lines()
+
     except Exception as e:
         print_error(f"Erro durante os testes: {e}")
         import traceback